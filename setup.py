@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 from setuptools import setup, Extension, find_packages
 
 # Cython が環境にインストールされているかどうかを確認し、ない場合は普通に *.c からコンパイルする。
@@ -16,11 +17,14 @@ else:
     ext = '.c'
     cmdclass = {}
 
+# *.c もない場合や、コンパイルに失敗した場合は拡張モジュールなしでインストールする。
+# （その場合、user_item_preprocess.ID は Python 版の _id_fallback になる。）
 ext_modules = [
     Extension('user_item_preprocess.ID', # モジュール名
               sources=['src/user_item_preprocess/ID'+ext],
+              optional=True,
               )
-]
+] if os.path.exists('src/user_item_preprocess/ID'+ext) else []
 
 setup(
     name="user_item_preprocess", # パッケージ名
@@ -28,8 +32,8 @@ setup(
     packages=['user_item_preprocess'],
     package_dir={'':'src'},
     ext_modules=ext_modules, # cythonモジュールがある場合は指定
-    cmdclass={'build_ext': build_ext},
-    install_requires=[],
+    cmdclass=cmdclass,
+    install_requires=['numpy'],
     extras_require={},
     entry_points={}
 )
\ No newline at end of file
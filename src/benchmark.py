@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+# 本プログラムの目的
+ (user_id, item_id, datetime) のログに対する user_item_preprocess の処理速度を計測する。
+ 合成したログを使うので、外部のデータは不要。コマンドラインから実行できる。
+
+# 実行方法
+ > python src/benchmark.py --rows 10000 100000 --output result.json
+ > python src/benchmark.py --rows 10000 100000 --compare result.json
+
+ 結果は JSON で出力されるので、--compare で以前のコミットの結果と比較できる。
+
+# これまでの検証の結論（旧 memo_time_series_process.py より）
+ * pandas の DataFrame を経由せず、numpy.array から直接抽出した方が速い。
+ * ID は int に変換して管理した方が速い（ID.id_transformer を Cython 化した）。
+ * bool index を何度も作るより、np.where で入れ子に絞り込む方が速かった。
+ * numba の jit や、抽出処理の Cython 化では速くならなかった。
+ * 配列をあらかじめソートしておくだけでは、全件比較の速度は変わらなかった。
+   （現在はソート済みのインデックスを np.searchsorted で引くため、全件比較はしない。）
+ * multiprocessing.Pool.map でクエリごとに引数を pickle すると、ほとんど速くならなかった。
+   （現在は get_past_cnt_batch の n_jobs でチャンクごとに並列化する。）
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import resource
+import tracemalloc
+import subprocess
+import numpy as np
+
+from user_item_preprocess.user_item_datetime import preprocesser
+from user_item_preprocess.ID import id_transformer
+from user_item_preprocess import statistics
+
+DAY_SECONDS = 60*60*24
+
+
+def generate_log(n_rows, n_users=None, n_items=None, skew=1.0, days=365, seed=0):
+    """
+    合成したログを生成する。
+    user, item の出現頻度は、順位 k の確率が k^(-skew) に比例するべき分布に従う。
+
+    ARGUMENTs
+    --------------------
+    n_rows [int]:
+        行数。
+    n_users, n_items [int or None]:
+        user, item の種類数。None の場合は n_rows に応じて決める。
+    skew [float]:
+        出現頻度の偏り。0 の場合は一様分布。
+    days [int]:
+        datetime の範囲の日数。2019-01-01 から days 日間に一様に分布する。
+    seed [int]:
+        乱数のシード。
+
+    RETURN
+    --------------------
+    user_ids, item_ids [numpy.array of int32], datetimes [numpy.array of int64 (秒数)]
+    """
+    n_users = n_users or max(n_rows // 50, 10)
+    n_items = n_items or max(n_rows // 200, 10)
+    rng = np.random.default_rng(seed)
+    start = int(np.datetime64('2019-01-01', 's').astype(np.int64))
+
+    def sample(n_kinds):
+        prob = np.arange(1, n_kinds + 1, dtype=np.float64) ** (-skew)
+        cum_prob = np.cumsum(prob / prob.sum())
+        ids = np.searchsorted(cum_prob, rng.random(n_rows), side='right')
+        # 頻度の高いIDが小さい番号に偏らないように、IDを並べ替える。
+        return rng.permutation(n_kinds).astype(np.int32)[np.minimum(ids, n_kinds - 1)]
+
+    user_ids = sample(n_users)
+    item_ids = sample(n_items)
+    datetimes = start + rng.integers(0, days * DAY_SECONDS, n_rows)
+    return user_ids, item_ids, datetimes
+
+
+class measure:
+    # tracemalloc は Python のオブジェクトの確保を遅くするので、--no-trace-memory で無効にできる。
+    trace_memory = True
+
+    def __init__(self, name, n_ops):
+        """
+        with 文の中の処理時間と、tracemalloc で計測したメモリ使用量のピークを記録する。
+        """
+        self.name = name
+        self.n_ops = n_ops
+        self.latencies = None
+        self.peak_memory = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def result(self):
+        result = {
+            'name': self.name,
+            'seconds': self.seconds,
+            'throughput': self.n_ops / self.seconds if self.seconds else None,
+            'peak_memory_mb': None if self.peak_memory is None else self.peak_memory / 1024**2,
+        }
+        if self.latencies is not None:
+            latencies_us = np.asarray(self.latencies) * 1e6
+            for p in [50, 90, 99]:
+                result['latency_p{}_us'.format(p)] = float(np.percentile(latencies_us, p))
+        return result
+
+
+def bench_construction(log, args):
+    user_ids, item_ids, datetimes = log
+    with measure('construction', len(datetimes)) as m:
+        instance = preprocesser(user_ids, item_ids, datetimes, compact=args.compact)
+    return instance, m.result()
+
+
+def bench_construction_str(log, args):
+    # 文字列のID、文字列の datetime から作成する場合（パースを含む）
+    user_ids, item_ids, datetimes = log
+    user_ids = np.char.add('u_', user_ids.astype(str))
+    item_ids = np.char.add('i_', item_ids.astype(str))
+    datetimes = np.datetime_as_string(datetimes.astype('datetime64[s]')).astype(object)
+    with measure('construction_str', len(datetimes)) as m:
+        preprocesser(user_ids, item_ids, datetimes, compact=args.compact)
+    return m.result()
+
+
+def bench_single_query(instance, queries, args):
+    user_ids, item_ids, datetimes = queries
+    latencies = []
+    with measure('single_query', len(datetimes)) as m:
+        for user_id, item_id, datetime in zip(user_ids.tolist(), item_ids.tolist(), datetimes.tolist()):
+            start = time.perf_counter()
+            instance.get_past_cnt(datetime, user_id, item_id, args.diff_days)
+            latencies.append(time.perf_counter() - start)
+    m.latencies = latencies
+    return m.result()
+
+
+def bench_batch_query(instance, queries, args):
+    user_ids, item_ids, datetimes = queries
+    with measure('batch_query', len(datetimes)) as m:
+        instance.get_past_cnt_batch(datetimes, user_ids, item_ids, args.diff_days, n_jobs=args.n_jobs)
+    return m.result()
+
+
+def bench_past_cnt_of_log(instance, args):
+    with measure('past_cnt_of_log', len(instance)) as m:
+        instance.get_past_cnt_of_log(args.diff_days)
+    return m.result()
+
+
+def bench_loaded_query(log, queries, single_queries, args):
+    # 文字列のIDで作成して save したものを、preprocesser.load(mmap=True) で開いた場合のクエリ
+    to_str = lambda log: (np.char.add('u_', log[0].astype(str)), np.char.add('i_', log[1].astype(str)), log[2])
+    instance = preprocesser(*to_str(log), compact=args.compact)
+    with tempfile.TemporaryDirectory() as dir:
+        instance.save(dir)
+        loaded = preprocesser.load(dir, mmap=True)
+        results = []
+        for name, bench in [('single_query', bench_single_query), ('batch_query', bench_batch_query)]:
+            _queries = to_str(single_queries if name == 'single_query' else queries)
+            result = bench(loaded, _queries, args)
+            result['name'] = 'loaded_' + name
+            results.append(result)
+    return results
+
+
+def bench_id_transform(log, args):
+    user_ids = np.char.add('u_', log[0].astype(str))
+    results = []
+    tf = id_transformer()
+    with measure('id_fit_transform_array', len(user_ids)) as m:
+        tf.fit_transform_array(user_ids)
+    results.append(m.result())
+    with measure('id_transform_array', len(user_ids)) as m:
+        tf.transform_array(user_ids)
+    results.append(m.result())
+    if len(user_ids) <= args.max_dict_rows:
+        tf = id_transformer()
+        with measure('id_fit_transform_dict', len(user_ids)) as m:
+            tf.fit_transform(user_ids.tolist())
+        results.append(m.result())
+    return results
+
+
+def bench_entropy(instance, args):
+    results = []
+    n_users = min(len(instance.user_id_tf), args.n_entropy_users)
+    with measure('list_entropy', n_users) as m:
+        for user_id in range(n_users):
+            statistics.list_entropy(instance.item_ids[instance.user_ids == user_id])
+    results.append(m.result())
+    with measure('grouped_entropy', len(instance.user_id_tf)) as m:
+        statistics.grouped_entropy(instance.user_ids, instance.item_ids)
+    results.append(m.result())
+    return results
+
+
+BENCHMARKS = ['construction', 'construction_str', 'single_query', 'batch_query', 'loaded_query',
+              'past_cnt_of_log', 'id_transform', 'entropy']
+
+
+def run(n_rows, args):
+    """
+    n_rows 行のログで、args.benchmarks に指定されたベンチマークを実行する。
+    """
+    log = generate_log(n_rows, args.users, args.items, args.skew, args.days, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    query_index = rng.integers(0, n_rows, args.queries)
+    queries = tuple(array[query_index] for array in log)
+    single_queries = tuple(array[:args.single_queries] for array in queries)
+
+    results = []
+    instance, result = bench_construction(log, args)
+    if 'construction' in args.benchmarks:
+        results.append(result)
+    if 'construction_str' in args.benchmarks:
+        results.append(bench_construction_str(log, args))
+    if 'single_query' in args.benchmarks:
+        results.append(bench_single_query(instance, single_queries, args))
+    if 'batch_query' in args.benchmarks:
+        results.append(bench_batch_query(instance, queries, args))
+    if 'loaded_query' in args.benchmarks:
+        results.extend(bench_loaded_query(log, queries, single_queries, args))
+    if 'past_cnt_of_log' in args.benchmarks:
+        results.append(bench_past_cnt_of_log(instance, args))
+    if 'id_transform' in args.benchmarks:
+        results.extend(bench_id_transform(log, args))
+    if 'entropy' in args.benchmarks:
+        results.extend(bench_entropy(instance, args))
+    for result in results:
+        result['n_rows'] = n_rows
+    return results
+
+
+def get_environment():
+    try:
+        commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def compare(results, base_results):
+    """
+    base_results（以前の結果）に対する処理時間の比を表示する。1より小さければ速くなっている。
+    """
+    base = {(r['name'], r['n_rows']): r for r in base_results}
+    print('{:<26}{:>12}{:>12}{:>12}{:>8}'.format('name', 'n_rows', 'base[s]', 'now[s]', 'ratio'))
+    for r in results:
+        b = base.get((r['name'], r['n_rows']))
+        if b is None:
+            continue
+        print('{:<26}{:>12}{:>12.4f}{:>12.4f}{:>8.2f}'.format(
+                r['name'], r['n_rows'], b['seconds'], r['seconds'], r['seconds'] / b['seconds']))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='user_item_preprocess のベンチマーク')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='ログの行数（複数指定可）')
+    parser.add_argument('--users', type=int, default=None, help='user の種類数')
+    parser.add_argument('--items', type=int, default=None, help='item の種類数')
+    parser.add_argument('--skew', type=float, default=1.0, help='user, item の出現頻度の偏り')
+    parser.add_argument('--days', type=int, default=365, help='datetime の範囲の日数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=100000, help='batch_query のクエリ数')
+    parser.add_argument('--single-queries', type=int, default=2000, help='single_query のクエリ数')
+    parser.add_argument('--diff-days', type=int, nargs='+', default=[7, 30, 90])
+    parser.add_argument('--n-jobs', type=int, default=1, help='batch_query の並列数')
+    parser.add_argument('--compact', action='store_true', help='compact=True で作成する')
+    parser.add_argument('--max-dict-rows', type=int, default=1000000,
+                        help='dict モードの id_transformer を計測する最大の行数')
+    parser.add_argument('--n-entropy-users', type=int, default=1000,
+                        help='list_entropy を計測する user の数')
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help='tracemalloc によるメモリ使用量の計測を行わない')
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument('--output', default=None, help='結果を出力する JSON ファイル')
+    parser.add_argument('--compare', default=None, help='比較する以前の結果の JSON ファイル')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    measure.trace_memory = not args.no_trace_memory
+    results = []
+    for n_rows in args.rows:
+        for result in run(n_rows, args):
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    output = {
+        'environment': get_environment(),
+        'args': vars(args),
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+    return output
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_ID
+'''
+
+
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+from user_item_preprocess import ID
+from user_item_preprocess import _id_fallback
+from user_item_preprocess import id_array
+
+class TEST01(unittest.TestCase):
+    '''配列モードが dict モードと同じ内部IDを返すことを確認する。'''
+    id_transformer = ID.id_transformer
+
+    def test01_01(self):
+        for ids in [['u_3', 'u_1', 'u_2', 'u_1'], [30, 10, 20, 10], [3000000000, 5, 5]]:
+            tf_dict, tf_array = self.id_transformer(), self.id_transformer()
+            expected = tf_dict.fit_transform(ids)
+            result = tf_array.fit_transform_array(ids)
+            self.assertEqual(result.dtype, np.int32)
+            self.assertEqual(list(result), expected)
+            self.assertEqual(list(tf_array.inverse_transform_array(result)), list(ids))
+            self.assertEqual(tf_array.transform(ids), expected)
+            self.assertEqual(tf_array.transform_single_id(ids[0]), expected[0])
+            self.assertEqual(tf_array.inverse_transform_single_id(expected[0]), ids[0])
+
+    def test01_02(self):
+        # 未知のIDは -1 (listの場合は unknown) になる
+        tf = self.id_transformer()
+        tf.fit_array(np.array(['a', 'b']))
+        self.assertEqual(list(tf.transform_array(['b', 'c', 'a'])), [1, -1, 0])
+        self.assertEqual(list(tf.transform_array([1, 2])), [-1, -1])
+        self.assertEqual(tf.transform(['c']), [None])
+        self.assertIsNone(tf.transform_single_id('c'))
+
+
+class TEST02(unittest.TestCase):
+    id_transformer = ID.id_transformer
+
+    def test02_01(self):
+        # 未学習の状態からでも fit_update できる
+        tf = self.id_transformer()
+        tf.fit_update(['b', 'a'])
+        self.assertEqual(tf.transform(['a', 'b']), [0, 1])
+
+    def test02_02(self):
+        # 配列モードの fit_update は既存の内部IDを変えずに追加する
+        tf = self.id_transformer()
+        tf.fit_array(['b', 'd'])
+        tf.fit_update(['c', 'a', 'd', 'c'])
+        self.assertEqual(list(tf.transform_array(['a', 'b', 'c', 'd'])), [2, 0, 3, 1])
+        self.assertEqual(list(tf.inverse_transform_array([0, 1, 2, 3])), ['b', 'd', 'a', 'c'])
+        # 既存のIDより長い文字列のIDも切り捨てられない
+        tf.fit_update(['longer_id'])
+        self.assertEqual(tf.transform_single_id('longer_id'), 4)
+
+    def test02_03(self):
+        # 空の配列で fit した後も fit_update できる
+        tf = self.id_transformer()
+        tf.fit_array([])
+        tf.fit_update(np.array([5, 3]))
+        self.assertEqual(list(tf.transform_array([3, 5, 4])), [0, 1, -1])
+
+    def test02_04(self):
+        # 整数のIDに文字列のIDを追加する（またはその逆の）場合は、文字列に変換せずにエラーにする
+        for ids, new_ids in [([1, 2], ['a']), (['a', 'b'], [3])]:
+            tf = self.id_transformer()
+            tf.fit_array(ids)
+            with self.assertRaises(ValueError):
+                tf.fit_update(new_ids)
+            self.assertEqual(list(tf.transform_array(ids)), [0, 1])
+            self.assertEqual(tf.inverse_transform_single_id(0), ids[0])
+
+    def test02_05(self):
+        # fit_update は既存のIDの配列をコピーせず、追加したIDの数に比例するコストで追加する
+        for ids in [np.arange(0, 20000, 2), np.char.add('u_', np.arange(0, 20000, 2).astype(str))]:
+            tf = self.id_transformer()
+            expected = tf.fit_transform_array(ids)
+            base = tf.vocabulary.runs[0]
+            new_ids = ids[:1000] + 1 if ids.dtype.kind == 'i' else np.char.add(ids[:1000], 'x')
+            for new_id in new_ids:
+                tf.fit_update([new_id])
+            self.assertIs(tf.vocabulary.runs[0], base)
+            self.assertLessEqual(len(tf.vocabulary.runs), 1 + int(np.log2(len(new_ids))) + 1)
+            self.assertEqual(len(tf), len(ids) + len(new_ids))
+            codes = np.arange(len(ids), len(ids) + len(new_ids))
+            self.assertEqual(list(tf.transform_array(new_ids)), list(codes))
+            self.assertEqual(list(tf.inverse_transform_array(codes)), list(new_ids))
+            self.assertEqual(list(tf.transform_array(ids)), list(expected))
+            self.assertEqual(tf.inverse_transform_single_id(int(codes[-1])), new_ids[-1])
+            # 保存すると1つにまとめられる
+            with tempfile.TemporaryDirectory() as dir:
+                tf.save_array(dir)
+                loaded = self.id_transformer()
+                loaded.load_array(dir)
+                self.assertEqual(len(loaded.vocabulary.runs), 1)
+                self.assertEqual(list(loaded.transform_array(new_ids)), list(codes))
+
+
+class TEST03(unittest.TestCase):
+    '''save_array, load_array で保存したものが同じ変換結果になることを確認する。'''
+    id_transformer = ID.id_transformer
+
+    def test03_01(self):
+        for ids in [np.array(['u_3', 'u_1', '日本', '', 'u_10']), np.array([30, 10, 20])]:
+            tf = self.id_transformer()
+            tf.fit_array(ids)
+            tf.fit_update(ids[:1].tolist() + [ids[0][:1] if ids.dtype.kind == 'U' else 99])
+            queries = np.concatenate([ids, ids[:1]])
+            with tempfile.TemporaryDirectory() as dir:
+                tf.save_array(dir)
+                for mmap in [True, False]:
+                    loaded = self.id_transformer()
+                    loaded.load_array(dir, mmap=mmap)
+                    codes = loaded.transform_array(queries)
+                    self.assertEqual(list(codes), list(tf.transform_array(queries)))
+                    self.assertEqual(list(loaded.inverse_transform_array(codes)), list(queries))
+                    self.assertEqual(loaded.transform_single_id(queries[0]), codes[0])
+                    self.assertEqual(loaded.inverse_transform_single_id(codes[1]), queries[1])
+                # 読み込んだ後も fit_update できる
+                loaded.fit_update(['new'] if ids.dtype.kind == 'U' else [7])
+                self.assertEqual(loaded.transform_single_id('new' if ids.dtype.kind == 'U' else 7),
+                                 len(tf))
+
+
+class TEST04(TEST01):
+    '''Python 版の id_transformer (_id_fallback) でも同じ結果になることを確認する。'''
+    id_transformer = _id_fallback.id_transformer
+
+
+class TEST05(TEST02):
+    id_transformer = _id_fallback.id_transformer
+
+
+class TEST06(TEST03):
+    id_transformer = _id_fallback.id_transformer
+
+
+class TEST07(unittest.TestCase):
+    def test07_01(self):
+        # 拡張モジュール ID が import できない場合は、_id_fallback が使われる
+        code = '''
+import sys
+sys.modules['user_item_preprocess.ID'] = None
+import user_item_preprocess
+from user_item_preprocess.user_item_datetime import preprocesser
+assert user_item_preprocess.ID.__name__ == 'user_item_preprocess._id_fallback'
+print(preprocesser([1, 1], ['a', 'b'], [10, 20]).get_past_cnt(30, 1, None, [1]))
+'''
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)))
+        self.assertEqual(output.decode().strip(), '{1: 2}')
+
+
+class TEST08(unittest.TestCase):
+    '''string_array の検索が、numpy の文字列の配列の検索と一致することを確認する。'''
+    def test08_01(self):
+        strs = np.array(sorted(['u_3', 'u_1', '日本', '', 'u_10', 'éa', 'u_1x']))
+        queries = np.array(['u_1', 'u_', '日本語', '', 'u_10_longer_than_all', 'éa', 'z', 'a'])
+        sorted_ids = id_array.string_array.from_array(strs)
+        self.assertEqual(list(sorted_ids[np.arange(len(strs))]), list(strs))
+        for side in ['left', 'right']:
+            expected = np.searchsorted(strs, queries, side=side)
+            self.assertEqual(list(sorted_ids.searchsorted(queries, side=side)), list(expected))
+            self.assertEqual([sorted_ids.searchsorted(query, side=side) for query in queries.tolist()],
+                             list(expected))
+        self.assertEqual(list(id_array.lookup(sorted_ids, np.arange(len(strs)), queries)),
+                         list(id_array.lookup(strs, np.arange(len(strs)), queries)))
+        with self.assertRaises(TypeError):
+            sorted_ids.searchsorted(1)
+
+    def test08_02(self):
+        # 先頭8バイト以上が共通する文字列が多い場合も、numpy の検索と一致する
+        rng = np.random.default_rng(0)
+        strs = np.unique(['user_000_{}{}'.format(i, 'x' * (i % 13)) for i in rng.integers(0, 10000, 2000)])
+        queries = np.concatenate([strs[rng.integers(0, len(strs), 500)],
+                                  ['user_000_{}'.format(i) for i in rng.integers(0, 10000, 500)], ['user', 'v']])
+        sorted_ids = id_array.string_array.from_array(strs)
+        for side in ['left', 'right']:
+            self.assertTrue(np.array_equal(sorted_ids.searchsorted(queries, side=side),
+                                           np.searchsorted(strs, queries, side=side)))
+        self.assertTrue(np.array_equal(id_array.lookup(sorted_ids, np.arange(len(strs)), queries),
+                                       id_array.lookup(strs, np.arange(len(strs)), queries)))
+
+    def test08_03(self):
+        # 保存するのは offsets と blob だけで、固定長にしたコピーは作らない
+        tf = ID.id_transformer()
+        tf.fit_array(np.array(['u_3', 'u_1', '日本']))
+        with tempfile.TemporaryDirectory() as dir:
+            tf.save_array(dir)
+            self.assertEqual(sorted(os.listdir(dir)), ['codes.npy', 'ids_blob.npy', 'ids_offsets.npy', 'positions.npy'])
+            loaded = ID.id_transformer()
+            loaded.load_array(dir)
+            self.assertIsInstance(loaded.vocabulary.runs[0].sorted_ids.blob, np.memmap)
+            self.assertEqual(list(loaded.transform_array(['日本', 'u_1', 'x'])), [2, 0, -1])
+            self.assertEqual(loaded.transform_single_id('u_3'), 1)
+
+
+class TEST09(unittest.TestCase):
+    '''ID (Cython 版) と _id_fallback (Python 版) の id_transformer が同じ実装であることを確認する。'''
+    def test09_01(self):
+        # ID.pyx は _id_fallback.py を include するので、メソッドと docstring が一致する
+        methods = [name for name in vars(_id_fallback.id_transformer) if not name.startswith('__') or name == '__init__']
+        self.assertEqual(sorted(name for name in vars(ID.id_transformer) if name in methods), sorted(methods))
+        for name in methods:
+            self.assertEqual(getattr(ID.id_transformer, name).__doc__,
+                             getattr(_id_fallback.id_transformer, name).__doc__, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_multi_key
+'''
+
+
+import unittest
+import numpy as np
+from user_item_preprocess.multi_key import multi_key_preprocesser, pack_codes
+from user_item_preprocess.index import composite_key
+from user_item_preprocess.user_item_datetime import preprocesser
+from tests.test_user_item_datetime import read_test_data
+
+class TEST01(unittest.TestCase):
+    def setUp(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        # item から作った3つ目のキー
+        self.category_ids = ['c_{}'.format(int(item_id[2:]) % 5) for item_id in item_ids]
+        self.user_ids, self.item_ids, self.datetimes = user_ids, item_ids, datetimes
+        self.keys = {'user': user_ids, 'item': item_ids, 'category': self.category_ids}
+
+    def test01_01(self):
+        self.assertEqual(pack_codes([np.array([1, 2]), np.array([3, -1])], [2, 2], 2).tolist(), [7, -1])
+        self.assertEqual(pack_codes([], [], 3).tolist(), [0, 0, 0])
+        # 2つのキーを下位32bitで詰めると index.composite_key と同じ
+        self.assertEqual(pack_codes([np.array([1, 5]), np.array([2, 0])], [31, 32], 2).tolist(),
+                         composite_key([1, 5], [2, 0]).tolist())
+
+    def test01_02(self):
+        # user, item のキーは preprocesser と同じ結果になる
+        multi_key = multi_key_preprocesser(self.keys, self.datetimes)
+        base = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+        for i in range(0, len(self.datetimes), 97):
+            datetime, user_id, item_id = self.datetimes[i], self.user_ids[i], self.item_ids[i]
+            self.assertEqual(multi_key.get_past_cnt(datetime, user=user_id, item=item_id),
+                             base.get_past_cnt(datetime, user_id, item_id))
+            self.assertEqual(multi_key.get_past_cnt(datetime, user=user_id, is_cut=True),
+                             base.get_past_cnt(datetime, user_id, is_cut=True))
+        np.testing.assert_array_equal(
+            multi_key.get_past_cnt_batch(self.datetimes, {'user': self.user_ids}),
+            base.get_past_cnt_batch(self.datetimes, self.user_ids))
+        np.testing.assert_array_equal(multi_key.get_past_cnt_batch(self.datetimes),
+                                      base.get_past_cnt_batch(self.datetimes))
+        np.testing.assert_array_equal(
+            multi_key.get_past_cnt_of_log([('item', 'user')])[('item', 'user')],
+            base.get_past_cnt_of_log()['user_item'])
+
+    def test01_03(self):
+        # 3つのキーの組み合わせは、条件に合う行を直接数えた結果と一致する
+        multi_key = multi_key_preprocesser(self.keys, self.datetimes, index_names=[('user', 'category')])
+        seconds = multi_key.datetimes
+        user_ids, category_ids = np.array(self.user_ids), np.array(self.category_ids)
+        for i in range(0, len(seconds), 89):
+            is_match = (user_ids == user_ids[i]) & (category_ids == category_ids[i])
+            expected = {d: int((is_match & (seconds < seconds[i]) & (seconds > seconds[i] - d*86400)).sum())
+                        for d in [7, 30, 90]}
+            self.assertEqual(multi_key.get_past_cnt(self.datetimes[i], user=user_ids[i], category=category_ids[i]),
+                             expected)
+        # 未知のIDは 0
+        self.assertEqual(multi_key.get_past_cnt(self.datetimes[0], user='unknown', category='c_1'),
+                         {7: 0, 30: 0, 90: 0})
+        with self.assertRaises(ValueError):
+            multi_key.get_past_cnt(self.datetimes[0], shop='s_1')
+
+    def test01_04(self):
+        # append した結果は、全データで作成した場合と同じ。新しいIDでビット数が増えたインデックスは作り直される
+        n = len(self.datetimes) // 2
+        multi_key = multi_key_preprocesser({name: ids[:n] for name, ids in self.keys.items()}, self.datetimes[:n],
+                                           index_names=[('user',), ('user', 'item', 'category')])
+        new_keys = {name: ids[n:] for name, ids in self.keys.items()}
+        new_keys['category'] = ['new_c_{}'.format(i % 40) for i in range(len(self.datetimes) - n)]
+        multi_key.append(new_keys, self.datetimes[n:])
+        all_keys = {name: list(ids[:n]) + list(new_keys[name]) for name, ids in self.keys.items()}
+        expected = multi_key_preprocesser(all_keys, self.datetimes, index_names=[])
+        queries = {'user': all_keys['user'], 'item': all_keys['item'], 'category': all_keys['category']}
+        np.testing.assert_array_equal(multi_key.get_past_cnt_batch(self.datetimes, queries),
+                                      expected.get_past_cnt_batch(self.datetimes, queries))
+        np.testing.assert_array_equal(multi_key.get_past_cnt_batch(self.datetimes, {'user': all_keys['user']}),
+                                      expected.get_past_cnt_batch(self.datetimes, {'user': all_keys['user']}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_partition
+'''
+
+
+import tempfile
+import unittest
+import numpy as np
+from user_item_preprocess.partition import partitioned_preprocesser
+from user_item_preprocess.user_item_datetime import preprocesser
+from tests.test_user_item_datetime import read_test_data
+
+class TEST01(unittest.TestCase):
+    '''シャードに分けたものが、全てのデータから作成した preprocesser と一致することを確認する。'''
+    def setUp(self):
+        self.user_ids, self.item_ids, self.datetimes = read_test_data()
+        self.expected = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        chunk_size = 700
+        chunks = [(self.user_ids[i:i+chunk_size], self.item_ids[i:i+chunk_size], self.datetimes[i:i+chunk_size])
+                  for i in range(0, len(self.datetimes), chunk_size)]
+        partitioned_preprocesser.build(chunks, self.tmp_dir.name, n_shards=5, n_jobs=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test01_01(self):
+        self_ = partitioned_preprocesser.load(self.tmp_dir.name, n_jobs=2)
+        self.assertEqual(len(self_), len(self.expected))
+        for i in range(0, len(self.datetimes), 97):
+            datetime, user_id, item_id = self.datetimes[i], self.user_ids[i], self.item_ids[i]
+            for args in [(user_id, item_id), (user_id, None), (None, item_id), (None, None), ('unknown', None)]:
+                self.assertEqual(self_.get_past_cnt(datetime, *args, is_cut=True),
+                                 self.expected.get_past_cnt(datetime, *args, is_cut=True))
+        for args in [(self.user_ids, self.item_ids), (self.user_ids, None), (None, self.item_ids), (None, None)]:
+            np.testing.assert_array_equal(self_.get_past_cnt_batch(self.datetimes, *args),
+                                          self.expected.get_past_cnt_batch(self.datetimes, *args))
+
+    def test01_02(self):
+        self_ = partitioned_preprocesser.load(self.tmp_dir.name, n_jobs=2)
+        result = self_.get_past_cnt_of_log(is_cut=True)
+        expected = self.expected.get_past_cnt_of_log(is_cut=True)
+        for name in ['user', 'item', 'user_item']:
+            np.testing.assert_array_equal(result[name], expected[name])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_server
+'''
+
+
+import asyncio
+import unittest
+from user_item_preprocess.server import batch_server, batch_client, serve
+from user_item_preprocess.user_item_datetime import preprocesser
+from tests.test_user_item_datetime import read_test_data
+
+class TEST01(unittest.TestCase):
+    '''同時に送ったクエリがバッチにまとめられ、get_past_cnt と同じ結果になることを確認する。'''
+    def setUp(self):
+        self.user_ids, self.item_ids, self.datetimes = read_test_data()
+        self.user_item_datetime = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+
+    def test01_01(self):
+        async def main():
+            server = batch_server(self.user_item_datetime, max_wait=0.01, max_batch_size=64)
+            results = await asyncio.gather(*[
+                    server.query(self.datetimes[i], self.user_ids[i], None if i % 2 else self.item_ids[i])
+                    for i in range(200)])
+            results.append(await server.query(self.datetimes[0], 'unknown', None, [1]))
+            # 不正なクエリは、同じバッチの他のクエリに影響しない
+            results.extend(await asyncio.gather(
+                    server.query('not a datetime', self.user_ids[0]), server.query(self.datetimes[0], None),
+                    return_exceptions=True))
+            stats = server.stats()
+            await server.stop()
+            return results, stats
+
+        results, stats = asyncio.run(main())
+        for i in range(200):
+            expected = self.user_item_datetime.get_past_cnt(
+                    self.datetimes[i], self.user_ids[i], None if i % 2 else self.item_ids[i])
+            self.assertEqual(results[i], expected)
+        self.assertEqual(results[200], {1: 0})
+        self.assertIsInstance(results[201], ValueError)
+        self.assertEqual(results[202], self.user_item_datetime.get_past_cnt(self.datetimes[0]))
+        self.assertEqual(stats['n_requests'], 203)
+        self.assertEqual(stats['n_errors'], 1)
+        self.assertLess(stats['n_batches'], 203)
+
+    def test01_02(self):
+        async def main():
+            server = batch_server(self.user_item_datetime, max_wait=0.005)
+            tcp_server = await serve(server, '127.0.0.1', 0)
+            port = tcp_server.sockets[0].getsockname()[1]
+            client = await batch_client.connect('127.0.0.1', port)
+            results = await asyncio.gather(*[
+                    client.query(self.datetimes[i], self.user_ids[i], None, [7, 30]) for i in range(50)])
+            stats = await client.stats()
+            with self.assertRaises(RuntimeError):
+                await client.query('not a datetime', self.user_ids[0])
+            await client.close()
+            tcp_server.close()
+            await tcp_server.wait_closed()
+            await server.stop()
+            return results, stats
+
+        results, stats = asyncio.run(main())
+        for i in range(50):
+            self.assertEqual(results[i], self.user_item_datetime.get_past_cnt(
+                    self.datetimes[i], self.user_ids[i], None, [7, 30]))
+        self.assertEqual(stats['n_requests'], 50)
+
+    def test01_03(self):
+        # バッチ全体の処理に失敗しても、そのバッチのクエリだけがエラーになり、以降のクエリは処理される
+        async def main():
+            server = batch_server(self.user_item_datetime, max_wait=0.01)
+            results = await asyncio.wait_for(asyncio.gather(
+                    server.query(self.datetimes[0], self.user_ids[0], None, [[7]]),
+                    server.query(self.datetimes[0], self.user_ids[0], None, [7]), return_exceptions=True), 5)
+            results.append(await asyncio.wait_for(server.query(self.datetimes[0], self.user_ids[0], None, [7]), 5))
+            stats = server.stats()
+            await server.stop()
+            return results, stats
+
+        results, stats = asyncio.run(main())
+        expected = self.user_item_datetime.get_past_cnt(self.datetimes[0], self.user_ids[0], None, [7])
+        self.assertIsInstance(results[0], TypeError)
+        self.assertEqual(results[2], expected)
+        self.assertEqual(stats['n_requests'], 3)
+
+    def test01_04(self):
+        # 1つの接続で同時に処理するクエリは max_in_flight 個までに制限される
+        async def main():
+            server = batch_server(self.user_item_datetime, max_wait=0.005)
+            query, in_flight, max_in_flight = server.query, [0], [0]
+            async def counted_query(*args, **kwargs):
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                try:
+                    return await query(*args, **kwargs)
+                finally:
+                    in_flight[0] -= 1
+            server.query = counted_query
+            tcp_server = await serve(server, '127.0.0.1', 0, max_in_flight=3)
+            port = tcp_server.sockets[0].getsockname()[1]
+            client = await batch_client.connect('127.0.0.1', port)
+            results = await asyncio.wait_for(asyncio.gather(*[
+                    client.query(self.datetimes[i], self.user_ids[i], None, [7]) for i in range(30)]), 10)
+            await client.close()
+            tcp_server.close()
+            await tcp_server.wait_closed()
+            await server.stop()
+            return results, max_in_flight[0]
+
+        results, max_in_flight = asyncio.run(main())
+        for i in range(30):
+            self.assertEqual(results[i], self.user_item_datetime.get_past_cnt(
+                    self.datetimes[i], self.user_ids[i], None, [7]))
+        self.assertGreater(max_in_flight, 1)
+        self.assertLessEqual(max_in_flight, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_statistics
+'''
+
+
+import unittest
+import numpy as np
+from user_item_preprocess import statistics
+from user_item_preprocess.user_item_datetime import preprocesser
+from tests.test_user_item_datetime import read_test_data
+
+class TEST01(unittest.TestCase):
+    def test01_01(self):
+        self.assertAlmostEqual(statistics.list_entropy([1,1,2,3,2]), 1.0549201679861442)
+        self.assertAlmostEqual(statistics.list_entropy(['1','1',5,'1','1']), 0.5004024235381879)
+        self.assertAlmostEqual(statistics.list_entropy(np.array([1,2])), 0.6931471805599453)
+        self.assertEqual(statistics.list_entropy([]), 0.0)
+
+    def test01_02(self):
+        # グループごとに list_entropy を計算した場合と一致する
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        _user_ids, _item_ids = user_item_datetime.user_ids, user_item_datetime.item_ids
+        result = statistics.grouped_entropy(_user_ids, _item_ids)
+        for user_id in range(0, len(result), 7):
+            self.assertAlmostEqual(result[user_id], statistics.list_entropy(_item_ids[_user_ids == user_id]))
+
+    def test01_03(self):
+        # 期間は両端を含まない（2019-01-01 と 2019-01-11 のデータは含まない）
+        user_item_datetime = preprocesser([1,1,1,1,2], [1,2,3,3,1],
+                                          ['2019-01-01','2019-01-05','2019-01-10','2019-01-11','2019-01-10'],
+                                          '%Y-%m-%d')
+        result = user_item_datetime.get_entropy('user', '2019-01-11', 7)
+        self.assertAlmostEqual(result[0], statistics.list_entropy([2, 3]))
+        self.assertEqual(result[1], 0.0)
+        result = user_item_datetime.get_entropy('item')
+        self.assertEqual(len(result), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
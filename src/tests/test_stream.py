@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_stream
+'''
+
+
+import tempfile
+import unittest
+import numpy as np
+from user_item_preprocess.stream import stream_counter
+from user_item_preprocess.user_item_datetime import preprocesser, cut_past_cnts
+from tests.test_user_item_datetime import read_test_data
+
+class TEST01(unittest.TestCase):
+    '''stream_counter が、バケットの精度で get_past_cnt と一致することを確認する。'''
+    def setUp(self):
+        self.user_ids, self.item_ids, self.datetimes = read_test_data()
+        self.seconds = np.array(self.datetimes, dtype='datetime64[s]').astype(np.int64)
+        self.diff_days = [7, 30, 90]
+        self.expected = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+
+    def _assert_agree(self, counter, query_seconds):
+        # query_seconds より前のイベントだけを更新した状態で読み出す
+        user_ids, item_ids = self.user_ids, self.item_ids
+        queries = np.full(len(user_ids), query_seconds)
+        for args in [(user_ids, None), (None, item_ids), (user_ids, item_ids)]:
+            result = counter.get_past_cnt_batch(queries, *args)
+            expected = self.expected.get_past_cnt_batch(queries, *args, self.diff_days)
+            # 差は query_seconds - diff_day ちょうどのイベントだけ
+            _args = [None if ids is None else np.array(ids) for ids in args]
+            for i, diff_day in enumerate(self.diff_days):
+                is_edge = self.seconds == query_seconds - diff_day * 86400
+                edge_cnts = np.zeros(len(queries), dtype=np.int64)
+                for j in np.flatnonzero(is_edge):
+                    is_same = np.ones(len(queries), dtype=bool)
+                    for ids, _ids in zip(_args, [self.user_ids[j], self.item_ids[j]]):
+                        if ids is not None:
+                            is_same &= ids == _ids
+                    edge_cnts += is_same
+                np.testing.assert_array_equal(result[:, i], expected[:, i] + edge_cnts)
+        half_life = 7 * 86400
+        is_past = self.seconds < query_seconds
+        expected_decay = np.array([np.exp2(-(query_seconds - self.seconds[is_past & (np.array(user_ids) == user_id)])
+                                           / half_life).sum() for user_id in user_ids[:50]])
+        np.testing.assert_allclose(counter.get_decayed_cnt_batch(queries[:50], user_ids[:50]), expected_decay)
+
+    def test01_01(self):
+        query_seconds = int(np.median(self.seconds)) // 3600 * 3600
+        is_past = self.seconds < query_seconds
+        counter = stream_counter(self.diff_days, bucket_seconds=3600)
+        # イベントを時刻順に、いくつかに分けて更新する
+        order = np.argsort(self.seconds[is_past], kind='stable')
+        for index in np.array_split(np.flatnonzero(is_past)[order], 7):
+            counter.update(np.array(self.user_ids)[index], np.array(self.item_ids)[index], self.seconds[index])
+        self._assert_agree(counter, query_seconds)
+        # 未知のIDは 0
+        self.assertEqual(counter.get_past_cnt_batch([query_seconds], ['unknown']).tolist(), [[0, 0, 0]])
+        np.testing.assert_array_equal(
+                counter.get_past_cnt_batch([query_seconds] * 5, self.user_ids[:5], is_cut=True),
+                cut_past_cnts(counter.get_past_cnt_batch([query_seconds] * 5, self.user_ids[:5]), self.diff_days))
+        # snapshot, restore
+        with tempfile.TemporaryDirectory() as dir:
+            counter.snapshot(dir)
+            self._assert_agree(stream_counter.restore(dir), query_seconds)
+
+    def test01_02(self):
+        # preprocesser から作成した場合は、preprocesser と内部IDを共有する
+        query_seconds = int(self.seconds.max()) // 86400 * 86400 + 86400
+        counter = stream_counter.from_preprocesser(self.expected, self.diff_days)
+        self.assertIs(counter.user_id_tf, self.expected.user_id_tf)
+        self._assert_agree(counter, query_seconds)
+        with self.assertRaises(ValueError):
+            stream_counter([7], bucket_seconds=5000)
+
+class TEST02(unittest.TestCase):
+    '''1件ずつ更新しても、既存のIDの配列をコピーし直さないことを確認する。'''
+    def test02_01(self):
+        n_pairs, n_updates = 100000, 1000
+        rng = np.random.default_rng(0)
+        counter = stream_counter([7], bucket_seconds=86400)
+        counter.update(rng.integers(0, n_pairs, n_pairs), np.arange(n_pairs), np.zeros(n_pairs, dtype=np.int64))
+        id_tfs = [counter.user_id_tf, counter.item_id_tf, counter.stores[('user', 'item')].id_tf]
+        bases = [id_tf.vocabulary.runs[0] for id_tf in id_tfs]
+        # 新しい user, item, (user, item) のイベントを1件ずつ更新する
+        for i in range(n_updates):
+            counter.update([n_pairs + i], [n_pairs + i], [i])
+        self.assertEqual(len(counter.stores[('user', 'item')]), n_pairs + n_updates)
+        for id_tf, base in zip(id_tfs, bases):
+            # 追加したIDは新しい id_run になり、最初の id_run はそのまま使われる
+            self.assertIs(id_tf.vocabulary.runs[0], base)
+            self.assertLessEqual(len(id_tf.vocabulary.runs), 1 + int(np.log2(n_updates)) + 1)
+        self.assertEqual(counter.get_past_cnt_batch([n_updates], [n_pairs + 10], [n_pairs + 10]).tolist(), [[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
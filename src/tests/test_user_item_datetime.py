@@ -6,8 +6,40 @@
 '''
 
 
+import os
+import csv
+import collections
+import tempfile
 import unittest
+import numpy as np
 from user_item_preprocess.user_item_datetime import preprocesser
+from user_item_preprocess import aggregate
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import scipy
+except ImportError:
+    scipy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'user_item_time.csv')
+
+def read_test_data():
+    with open(DATA_PATH) as f:
+        rows = list(csv.DictReader(f))
+    user_ids  = [row['user_id'] for row in rows]
+    item_ids  = [row['item_id'] for row in rows]
+    datetimes = [row['datetime'] for row in rows]
+    return user_ids, item_ids, datetimes
 
 class TEST01(unittest.TestCase):
     def setUp(self):
@@ -74,10 +106,564 @@ class TEST01(unittest.TestCase):
         self.assertEqual(result[7],   0)
 
 
+    def test01_04(self):
+        # 未知のIDの過去データは0件
+        result = self.user_item_datetime.get_past_cnt(
+                '2019-04-15', 999, None, [7,30])
+        self.assertEqual(result, {7:0, 30:0})
+
+    def test01_05(self):
+        # datetime64 や エポック秒 の配列からも同じ結果になる
+        datetimes = np.array(['2019-01-01','2019-02-01','2019-03-01','2019-04-01','2019-05-01',
+                              '2019-01-01','2019-02-01','2019-03-01'], dtype='datetime64[s]')
+        user_ids = [1,1,1,1,1,2,2,2]
+        item_ids = [1,2,1,1,1,3,1,3]
+        diff_days = [7,30,60,90,120,150]
+        expected = self.user_item_datetime.get_past_cnt('2019-04-15', 1, None, diff_days)
+        for _datetimes in [datetimes, datetimes.astype(np.int64)]:
+            user_item_datetime = preprocesser(user_ids, item_ids, _datetimes)
+            result = user_item_datetime.get_past_cnt(np.datetime64('2019-04-15'), 1, None, diff_days)
+            self.assertEqual(result, expected)
+
     def tearDown(self):
         pass
 
 
+class TEST02(unittest.TestCase):
+    '''インデックスによるカウントが、全件走査（_get_index）の結果と一致することを確認する。'''
+    def setUp(self):
+        self.user_ids, self.item_ids, self.datetimes = read_test_data()
+        self.user_item_datetime = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+
+    def scan_past_cnt(self, datetime, user_id, item_id, diff_days):
+        self_ = self.user_item_datetime
+        _user_id, _item_id, _datetime = self_._transform_inputs(user_id, item_id, datetime)
+        indexes = self_._get_index(_user_id, _item_id, _datetime)
+        diff_datetimes = _datetime - self_._np_array_roop_index(self_.datetimes, indexes)
+        return {d:(diff_datetimes < d * 60*60*24).sum() for d in diff_days}
+
+    def test02_01(self):
+        diff_days = [1,7,30,90]
+        for i in range(0, 5000, 97):
+            for user_id, item_id in [(self.user_ids[i], self.item_ids[i]),
+                                     (self.user_ids[i], None),
+                                     (None, self.item_ids[i]),
+                                     (None, None)]:
+                result = self.user_item_datetime.get_past_cnt(
+                        self.datetimes[i], user_id, item_id, diff_days)
+                self.assertEqual(result, self.scan_past_cnt(
+                        self.datetimes[i], user_id, item_id, diff_days))
+
+
+class TEST03(unittest.TestCase):
+    '''get_past_cnt_batch が get_past_cnt と一致することを確認する。'''
+    def setUp(self):
+        self.user_ids, self.item_ids, self.datetimes = read_test_data()
+        self.user_item_datetime = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+
+    def test03_01(self):
+        diff_days = [30, 7, 90]
+        datetimes = self.datetimes[::50]
+        user_ids = self.user_ids[::50] + ['unknown']
+        item_ids = self.item_ids[::50] + [self.item_ids[0]]
+        datetimes = datetimes + [datetimes[0]]
+        for is_cut in [False, True]:
+            for _user_ids, _item_ids in [(user_ids, item_ids), (user_ids, None),
+                                         (None, item_ids), (None, None)]:
+                result = self.user_item_datetime.get_past_cnt_batch(
+                        datetimes, _user_ids, _item_ids, diff_days, is_cut)
+                self.assertEqual(result.shape, (len(datetimes), len(diff_days)))
+                for i, datetime in enumerate(datetimes):
+                    user_id = None if _user_ids is None else _user_ids[i]
+                    item_id = None if _item_ids is None else _item_ids[i]
+                    expected = self.user_item_datetime.get_past_cnt(
+                            datetime, user_id, item_id, diff_days, is_cut)
+                    self.assertEqual(list(result[i]), [expected[d] for d in diff_days])
+
+
+class TEST04(unittest.TestCase):
+    '''get_past_cnt_of_log が行ごとの get_past_cnt と一致することを確認する。'''
+    def test04_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_ids, item_ids, datetimes = user_ids[:500], item_ids[:500], datetimes[:500]
+        # 同じ datetime の行を含める
+        user_ids += user_ids[:3]
+        item_ids += item_ids[:3]
+        datetimes += datetimes[:3]
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        for is_cut in [False, True]:
+            result = user_item_datetime.get_past_cnt_of_log(diff_days, is_cut)
+            for i in range(len(datetimes)):
+                for key, user_id, item_id in [('user', user_ids[i], None),
+                                              ('item', None, item_ids[i]),
+                                              ('user_item', user_ids[i], item_ids[i])]:
+                    expected = user_item_datetime.get_past_cnt(
+                            datetimes[i], user_id, item_id, diff_days, is_cut)
+                    self.assertEqual(list(result[key][i]), [expected[d] for d in diff_days])
+
+
+class TEST05(unittest.TestCase):
+    '''append で追加した場合と、最初から全てのデータで作成した場合が一致することを確認する。'''
+    def test05_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_ids, item_ids, datetimes = user_ids[:1000], item_ids[:1000], datetimes[:1000]
+        expected = preprocesser(user_ids, item_ids, datetimes)
+        for first in [0, 400]:
+            result = preprocesser(user_ids[:first], item_ids[:first], datetimes[:first])
+            for start in range(first, 1000, 150):
+                end = min(start + 150, 1000)
+                result.append(user_ids[start:end], item_ids[start:end], datetimes[start:end])
+            self.assertEqual(len(result), 1000)
+            self.assertGreater(len(result._indexes[('user',)].runs), 1)
+
+            diff_days = [7, 30, 90]
+            for _user_ids, _item_ids in [(user_ids, item_ids), (user_ids, None), (None, item_ids)]:
+                self.assertTrue(np.array_equal(
+                        result.get_past_cnt_batch(datetimes, _user_ids, _item_ids, diff_days),
+                        expected.get_past_cnt_batch(datetimes, _user_ids, _item_ids, diff_days)))
+            self.assertEqual(result.get_past_cnt(datetimes[0], user_ids[0], item_ids[0], diff_days),
+                             expected.get_past_cnt(datetimes[0], user_ids[0], item_ids[0], diff_days))
+            result_of_log = result.get_past_cnt_of_log(diff_days)
+            expected_of_log = expected.get_past_cnt_of_log(diff_days)
+            for key in ['user', 'item', 'user_item']:
+                self.assertTrue(np.array_equal(result_of_log[key], expected_of_log[key]))
+
+    def test05_02(self):
+        # 整数のIDで作成したものに文字列のIDを append するとエラーになり、データは追加されない
+        result = preprocesser([1, 2], [1, 2], [0, 10])
+        with self.assertRaises(ValueError):
+            result.append(['a'], [1], [20])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result.get_past_cnt(30, 1, None, [1]), {1: 1})
+
+
+class TEST06(unittest.TestCase):
+    '''save で保存して load で読み込んだものが同じ結果になることを確認する。'''
+    def test06_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        expected = preprocesser(user_ids[:800], item_ids[:800], datetimes[:800])
+        expected.append(user_ids[800:], item_ids[800:], datetimes[800:])
+        diff_days = [7, 30, 90]
+        with tempfile.TemporaryDirectory() as dir:
+            expected.save(dir)
+            for mmap in [True, False]:
+                result = preprocesser.load(dir, mmap=mmap)
+                self.assertEqual(isinstance(result.datetimes, np.memmap), mmap)
+                self.assertEqual(len(result), len(expected))
+                for _user_ids, _item_ids in [(user_ids, item_ids), (user_ids, None), (None, None)]:
+                    self.assertTrue(np.array_equal(
+                            result.get_past_cnt_batch(datetimes, _user_ids, _item_ids, diff_days),
+                            expected.get_past_cnt_batch(datetimes, _user_ids, _item_ids, diff_days)))
+                self.assertEqual(result.get_past_cnt(datetimes[0], user_ids[0], item_ids[0], diff_days),
+                                 expected.get_past_cnt(datetimes[0], user_ids[0], item_ids[0], diff_days))
+            # mmap=True で読み込んだものは append できない
+            result = preprocesser.load(dir, mmap=True)
+            with self.assertRaises(ValueError):
+                result.append(user_ids[:1], item_ids[:1], datetimes[:1])
+            # mmap=False で読み込んだものは append できる
+            result = preprocesser.load(dir, mmap=False)
+            result.append(['new_user'], item_ids[:1], datetimes[:1])
+            self.assertEqual(result.get_past_cnt('2100-01-01 00:00:00', 'new_user', None, [100000]),
+                             {100000:1})
+
+
+class TEST07(unittest.TestCase):
+    '''並列処理の結果が並列化しない場合と一致することを確認する。'''
+    def test07_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        for _user_ids, _item_ids in [(user_ids, item_ids), (None, item_ids)]:
+            expected = user_item_datetime.get_past_cnt_batch(datetimes, _user_ids, _item_ids, diff_days)
+            for backend in ['thread', 'process']:
+                result = user_item_datetime.get_past_cnt_batch(
+                        datetimes, _user_ids, _item_ids, diff_days, n_jobs=2, backend=backend)
+                self.assertTrue(np.array_equal(result, expected))
+
+
+class TEST08(unittest.TestCase):
+    '''compact=True の場合も同じ結果になり、各列が小さい型で保持されることを確認する。'''
+    def test08_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        expected = preprocesser(user_ids, item_ids, datetimes)
+        result = preprocesser(user_ids[:2000], item_ids[:2000], datetimes[:2000], compact=True)
+        self.assertEqual(result.user_ids.dtype, np.int16)
+        self.assertEqual(result.datetimes.dtype, np.int32)
+        result.append(user_ids[2000:], item_ids[2000:], datetimes[2000:])
+        # 小さい型に収まらなくなった列は型を広げる
+        many_user_ids = ['new_{}'.format(i) for i in range(40000)]
+        for _preprocesser in [expected, result]:
+            _preprocesser.append(many_user_ids, item_ids[:1] * 40000, ['1900-01-01 00:00:00'] * 40000)
+        self.assertEqual(result.user_ids.dtype, np.int32)
+        self.assertEqual(result.datetimes.dtype, np.int64)
+
+        diff_days = [7, 30, 90, 100000]
+        queries = datetimes + ['1900-01-02 00:00:00']
+        for _user_ids, _item_ids in [(user_ids + ['new_1'], item_ids + item_ids[:1]),
+                                     (user_ids + ['new_1'], None), (None, None)]:
+            self.assertTrue(np.array_equal(
+                    result.get_past_cnt_batch(queries, _user_ids, _item_ids, diff_days),
+                    expected.get_past_cnt_batch(queries, _user_ids, _item_ids, diff_days)))
+            for i in range(0, len(queries), 100):
+                user_id = None if _user_ids is None else _user_ids[i]
+                item_id = None if _item_ids is None else _item_ids[i]
+                self.assertEqual(result.get_past_cnt(queries[i], user_id, item_id, diff_days),
+                                 expected.get_past_cnt(queries[i], user_id, item_id, diff_days))
+        result_of_log = result.get_past_cnt_of_log(diff_days)
+        expected_of_log = expected.get_past_cnt_of_log(diff_days)
+        for key in ['user', 'item', 'user_item']:
+            self.assertTrue(np.array_equal(result_of_log[key], expected_of_log[key]))
+
+
+class TEST09(unittest.TestCase):
+    '''キャッシュを有効にしても結果が変わらず、append でキャッシュが削除されることを確認する。'''
+    def test09_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        expected = [user_item_datetime.get_past_cnt(datetimes[i], user_ids[i], item_ids[i], diff_days)
+                    for i in range(100)]
+        user_item_datetime.enable_cache(maxsize=50)
+        for repeat in range(2):
+            for i in range(100):
+                result = user_item_datetime.get_past_cnt(datetimes[i], user_ids[i], item_ids[i], diff_days)
+                self.assertEqual(result, expected[i])
+        info = user_item_datetime.cache.info()
+        self.assertEqual(info['size'], 50)
+        self.assertEqual(info['misses'], 200)
+
+        for repeat in range(2):
+            result = user_item_datetime.get_past_cnt(datetimes[0], 'unknown', None, diff_days)
+            self.assertEqual(result, {7:0, 30:0, 90:0})
+        self.assertEqual(user_item_datetime.cache.info()['hits'], 1)
+
+        user_item_datetime.append(user_ids[:1], item_ids[:1], ['2019-01-01 00:00:00'])
+        self.assertEqual(len(user_item_datetime.cache), 0)
+
+    def test09_02(self):
+        # time_bucket 単位に切り捨てた datetime (2019-01-01 01:00:00) でカウントする
+        user_item_datetime = preprocesser([1, 1], [1, 1], ['2019-01-01 00:30:00', '2019-01-01 01:30:00'])
+        user_item_datetime.enable_cache(time_bucket=3600)
+        for datetime in ['2019-01-01 01:59:00', '2019-01-01 01:31:00']:
+            self.assertEqual(user_item_datetime.get_past_cnt(datetime, 1, None, [1]), {1:1})
+        self.assertEqual(user_item_datetime.cache.info()['hits'], 1)
+
+
+@unittest.skipIf(pandas is None, 'pandas is not installed.')
+class TEST10(unittest.TestCase):
+    '''from_csv で作成したものが、全てのデータから作成した場合と一致することを確認する。'''
+    def test10_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        expected = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        for compact in [True, False]:
+            result = preprocesser.from_csv(DATA_PATH, chunksize=700, compact=compact)
+            self.assertEqual(len(result), len(expected))
+            self.assertTrue(np.array_equal(
+                    result.get_past_cnt_batch(datetimes, user_ids, item_ids, diff_days),
+                    expected.get_past_cnt_batch(datetimes, user_ids, item_ids, diff_days)))
+            self.assertEqual(result.get_past_cnt(datetimes[0], user_ids[0], None, diff_days),
+                             expected.get_past_cnt(datetimes[0], user_ids[0], None, diff_days))
+
+
+
+class TEST11(unittest.TestCase):
+    '''enable_profiling で段階ごとの計測結果が得られ、結果が変わらないことを確認する。'''
+    def test11_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        expected = user_item_datetime.get_past_cnt(datetimes[0], user_ids[0], None, diff_days, is_cut=True)
+        self.assertEqual(user_item_datetime.get_profile(), {})
+
+        records = []
+        user_item_datetime.enable_profiling(callback=records.append)
+        result = user_item_datetime.get_past_cnt(datetimes[0], user_ids[0], None, diff_days, is_cut=True)
+        self.assertEqual(result, expected)
+        user_item_datetime.get_past_cnt_batch(datetimes[:10], user_ids[:10], None, diff_days)
+
+        profile = user_item_datetime.get_profile()
+        self.assertEqual(profile['get_past_cnt']['calls'], 1)
+        self.assertEqual(set(profile['get_past_cnt']['stages']),
+                         {'transform_inputs', 'index_lookup', 'count', 'cut'})
+        n_user_rows = sum(user_id == user_ids[0] for user_id in user_ids)
+        self.assertEqual(profile['get_past_cnt']['rows_scanned'], n_user_rows)
+        self.assertEqual(profile['get_past_cnt_batch']['queries'], 10)
+        self.assertEqual([record['method'] for record in records], ['get_past_cnt', 'get_past_cnt_batch'])
+
+        user_item_datetime.disable_profiling()
+        self.assertEqual(user_item_datetime.get_profile(), {})
+
+    def test11_02(self):
+        # get_past_cnt_batch の rows_scanned は、件数を数える時に検索した範囲から求める（並列化した場合も同じ）
+        user_ids, item_ids, datetimes = read_test_data()
+        n = len(user_ids) - 100
+        user_item_datetime = preprocesser(user_ids[:n], item_ids[:n], datetimes[:n])
+        user_item_datetime.append(user_ids[n:], item_ids[n:], datetimes[n:])
+        self.assertGreater(len(user_item_datetime._indexes[('user',)].runs), 1)
+        counter = collections.Counter(user_ids)
+        queries = user_ids[:50] + ['unknown_user']
+        expected = user_item_datetime.get_past_cnt_batch(datetimes[:51], queries, None)
+        for n_jobs in [1, 2]:
+            records = []
+            user_item_datetime.enable_profiling(callback=records.append)
+            result = user_item_datetime.get_past_cnt_batch(datetimes[:51], queries, None, n_jobs=n_jobs)
+            self.assertTrue(np.array_equal(result, expected))
+            self.assertEqual(records[0]['rows_scanned'], sum(counter[user_id] for user_id in queries))
+            self.assertNotIn('index_lookup', records[0]['seconds'])
+            user_item_datetime.disable_profiling()
+
+
+
+class TEST12(unittest.TestCase):
+    '''get_past_aggregates の結果が、全件を走査して集計した結果と一致することを確認する。'''
+    def test12_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids[:3000], item_ids[:3000], datetimes[:3000])
+        user_item_datetime.append(user_ids[3000:], item_ids[3000:], datetimes[3000:])
+        seconds = user_item_datetime.datetimes
+        diff_days = [30, 7, 90]
+        for i in range(0, len(user_ids), 97):
+            query_seconds = seconds[i]
+            result = user_item_datetime.get_past_aggregates(datetimes[i], user_ids[i], None, diff_days)
+            for diff_day in diff_days:
+                ages = (query_seconds - seconds) / (60*60*24)
+                is_target = (user_item_datetime.user_ids == user_item_datetime.user_ids[i]) \
+                            & (ages > 0) & (ages < diff_day)
+                self.assertEqual(result['count'][diff_day], is_target.sum())
+                self.assertEqual(result['distinct'][diff_day],
+                                 len(set(user_item_datetime.item_ids[is_target])))
+                if is_target.any():
+                    self.assertAlmostEqual(result['min_age'][diff_day], ages[is_target].min())
+                    self.assertAlmostEqual(result['max_age'][diff_day], ages[is_target].max())
+                else:
+                    self.assertTrue(np.isnan(result['min_age'][diff_day]))
+                self.assertAlmostEqual(result['decay'][diff_day], (0.5 ** (ages[is_target] / 7)).sum())
+
+    def test12_02(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        user_item_datetime = preprocesser(user_ids, item_ids, datetimes)
+        diff_days = [7, 30, 90]
+        queries = datetimes[:50] + ['2019-01-01 00:00:00']
+        query_user_ids = user_ids[:50] + ['unknown']
+        result = user_item_datetime.get_past_aggregates_batch(
+                queries, query_user_ids, item_ids[:51], diff_days, ['count', 'distinct'])
+        expected = user_item_datetime.get_past_cnt_batch(queries, query_user_ids, item_ids[:51], diff_days)
+        self.assertTrue(np.array_equal(result['count'], expected))
+        self.assertTrue(np.array_equal(result['distinct'], np.minimum(expected, 1)))
+
+    def test12_03(self):
+        # データが空の場合は、全ての集計値が 0 (min_age, max_age は nan) になる
+        user_item_datetime = preprocesser([], [], [])
+        result = user_item_datetime.get_past_aggregates('2019-01-01 00:00:00', 'u_1', None, [7, 30])
+        self.assertEqual(result['count'], {7: 0, 30: 0})
+        self.assertEqual(result['distinct'], {7: 0, 30: 0})
+        self.assertEqual(result['decay'], {7: 0.0, 30: 0.0})
+        self.assertTrue(np.isnan(result['min_age'][7]))
+        result = user_item_datetime.get_past_aggregates_batch(['2019-01-01 00:00:00'] * 2, ['u_1', 'u_2'], None, [7])
+        self.assertEqual(result['distinct'].tolist(), [[0], [0]])
+
+
+
+class TEST13(unittest.TestCase):
+    '''get_bucket_counts の件数が、全件を走査して数えた件数と一致することを確認する。'''
+    def setUp(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        self.user_item_datetime = preprocesser(user_ids, item_ids, datetimes, compact=True)
+
+    def test13_01(self):
+        self_ = self.user_item_datetime
+        dense, bucket_starts = self_.get_bucket_counts('user', 7, format='dense')
+        seconds = self_.datetimes.astype(np.int64) + self_.datetime_offset
+        self.assertEqual(dense.sum(), len(self_))
+        self.assertTrue((bucket_starts % (7*24*60*60) == 0).all())
+        for user_id in range(0, dense.shape[0], 11):
+            for b in range(0, len(bucket_starts), 5):
+                is_target = (self_.user_ids == user_id) & (bucket_starts[b] <= seconds) \
+                            & (seconds < bucket_starts[b] + 7*24*60*60)
+                self.assertEqual(dense[user_id, b], is_target.sum())
+
+        (user_codes, item_codes, buckets, counts), _ = self_.get_bucket_counts(('user', 'item'), 7, format='coo')
+        self.assertEqual(counts.sum(), len(self_))
+        self.assertTrue(np.array_equal(np.bincount(user_codes, weights=counts, minlength=dense.shape[0]),
+                                       dense.sum(axis=1)))
+
+        if scipy is not None:
+            csr, _ = self_.get_bucket_counts('item', 7, format='csr')
+            self.assertTrue(np.array_equal(csr.toarray(), self_.get_bucket_counts('item', 7, format='dense')[0]))
+
+    def test13_02(self):
+        # 累積和の差が、バケットの境界で区切った期間の件数になる
+        self_ = self.user_item_datetime
+        cumulative, bucket_starts = self_.get_bucket_counts('user', 1, format='dense', cumulative=True)
+        seconds = self_.datetimes.astype(np.int64) + self_.datetime_offset
+        a, b = 10, 40
+        is_target = (bucket_starts[a] <= seconds) & (seconds < bucket_starts[b])
+        expected = np.bincount(self_.user_ids[is_target], minlength=cumulative.shape[0])
+        self.assertTrue(np.array_equal(cumulative[:, b-1] - cumulative[:, a-1], expected))
+        with self.assertRaises(ValueError):
+            self_.get_bucket_counts('user', 1, format='coo', cumulative=True)
+
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed.')
+class TEST14(unittest.TestCase):
+    '''from_arrow で作成したものが、全てのデータから作成した場合と一致することを確認する。'''
+    def test14_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        expected = preprocesser(user_ids, item_ids, datetimes)
+        table = pyarrow.table({
+            'user_id': pyarrow.array(user_ids).dictionary_encode(),
+            'item_id': pyarrow.array(item_ids),
+            'datetime': pyarrow.array(np.array(datetimes, dtype='datetime64[s]').astype('datetime64[ms]')),
+        })
+        diff_days = [7, 30, 90]
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'user_item_time.parquet')
+            pyarrow.parquet.write_table(table, path, row_group_size=1000)
+            str_table = table.set_column(2, 'datetime', pyarrow.array(datetimes))
+            for source in [table, path, str_table.to_batches(max_chunksize=700)]:
+                result = preprocesser.from_arrow(source, batch_size=800)
+                self.assertEqual(len(result), len(expected))
+                self.assertEqual(list(result.user_id_tf.transform_array(user_ids[:20])),
+                                 list(result.user_ids[:20]))
+                self.assertTrue(np.array_equal(
+                        result.get_past_cnt_batch(datetimes, user_ids, item_ids, diff_days),
+                        expected.get_past_cnt_batch(datetimes, user_ids, item_ids, diff_days)))
+
+
+class TEST15(unittest.TestCase):
+    '''get_top_k が、条件に合う行を直接数えた結果と一致することを確認する。'''
+    def _expected(self, seconds, ids, other_ids, _datetime, target_id, diff_day, k):
+        in_window = (ids == target_id) & (seconds < _datetime) & (seconds > _datetime - diff_day*86400)
+        counter = collections.Counter(other_ids[in_window].tolist())
+        return sorted(counter.items(), key=lambda pair: (-pair[1], pair[0]))[:k]
+
+    def test15_01(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        self_ = preprocesser(user_ids, item_ids, datetimes)
+        seconds, _user_ids, _item_ids = self_.datetimes, self_.user_ids, self_.item_ids
+        diff_days, k = [7, 30, 90], 3
+        batch = self_.get_top_k_batch(datetimes, user_ids, k=k, diff_days=diff_days, return_codes=True)
+        item_batch = self_.get_top_k_batch(datetimes, item_ids=item_ids, k=k, diff_days=diff_days)
+        for i in range(0, len(datetimes), 61):
+            result = self_.get_top_k(datetimes[i], user_ids[i], k=k, diff_days=diff_days, return_codes=True)
+            for diff_day in diff_days:
+                expected = self._expected(seconds, _user_ids, _item_ids, seconds[i], _user_ids[i], diff_day, k)
+                self.assertEqual(result[diff_day], expected)
+                codes, counts = batch[diff_day]
+                self.assertEqual([pair for pair in zip(codes[i].tolist(), counts[i].tolist()) if pair[1]], expected)
+            result = self_.get_top_k(datetimes[i], item_id=item_ids[i], k=k, diff_days=diff_days)
+            expected = self._expected(seconds, _item_ids, _user_ids, seconds[i], _item_ids[i], 90, k)
+            expected = [(self_.user_id_tf.inverse_transform_single_id(code), cnt) for code, cnt in expected]
+            self.assertEqual(result[90], expected)
+            ids, counts = item_batch[90]
+            self.assertEqual([pair for pair in zip(ids[i].tolist(), counts[i].tolist()) if pair[1]], expected)
+        # 未知のIDは空
+        self.assertEqual(self_.get_top_k(datetimes[0], 'unknown'), {7: [], 30: [], 90: []})
+        with self.assertRaises(ValueError):
+            self_.get_top_k(datetimes[0], user_ids[0], item_ids[0])
+
+
+    def test15_02(self):
+        # 行数が多い場合（np.bincount で数える場合）も、同じ件数は値の昇順に並ぶ
+        query_index = np.array([0, 0, 0, 0, 1, 1, 1, 1, 1, 1])
+        values = np.array([2, 1, 2, 1, 0, 0, 0, 2, 2, 1])
+        top_values, top_counts = aggregate.top_k_of_pairs(query_index, values, 2, 3, 2)
+        self.assertEqual(top_values.tolist(), [[1, 2], [0, 2]])
+        self.assertEqual(top_counts.tolist(), [[2, 2], [3, 2]])
+        top_values, top_counts = aggregate.top_k_of_pairs(query_index[:4], values[:4], 2, 3, 4)
+        self.assertEqual(top_values.tolist(), [[1, 2, -1, -1], [-1, -1, -1, -1]])
+        self.assertEqual(top_counts.tolist(), [[2, 2, 0, 0], [0, 0, 0, 0]])
+
+    def test15_03(self):
+        # データが空の場合は空の結果になる
+        self_ = preprocesser([], [], [])
+        self.assertEqual(self_.get_top_k('2019-01-01 00:00:00', 'u_1', k=2, diff_days=[7, 30]), {7: [], 30: []})
+        codes, counts = self_.get_top_k_batch(['2019-01-01 00:00:00'], ['u_1'], k=2, diff_days=[7],
+                                              return_codes=True)[7]
+        self.assertEqual(codes.tolist(), [[-1, -1]])
+        self.assertEqual(counts.tolist(), [[0, 0]])
+
+
+class TEST16(unittest.TestCase):
+    '''time_resolution でマージしたものが、マージしない場合と同じ件数を返却することを確認する。'''
+    def setUp(self):
+        user_ids, item_ids, datetimes = read_test_data()
+        # 全ての行が2回ずつ現れるログ
+        self.user_ids, self.item_ids, self.datetimes = user_ids * 2, item_ids * 2, datetimes * 2
+        self.diff_days = [7, 30, 90]
+
+    def _assert_same_counts(self, result, expected, datetimes):
+        user_ids, item_ids, diff_days = self.user_ids, self.item_ids, self.diff_days
+        for i in range(0, len(datetimes), 151):
+            for args in [(user_ids[i], item_ids[i]), (user_ids[i], None), (None, item_ids[i]), (None, None)]:
+                self.assertEqual(result.get_past_cnt(datetimes[i], *args, diff_days, is_cut=True),
+                                 expected.get_past_cnt(datetimes[i], *args, diff_days, is_cut=True))
+        for args in [(user_ids, item_ids), (user_ids, None), (None, None)]:
+            np.testing.assert_array_equal(result.get_past_cnt_batch(datetimes, *args, diff_days, is_cut=True),
+                                          expected.get_past_cnt_batch(datetimes, *args, diff_days, is_cut=True))
+        aggregates = ['count', 'decay', 'distinct']
+        _result = result.get_past_aggregates_batch(datetimes, user_ids, None, diff_days, aggregates)
+        _expected = expected.get_past_aggregates_batch(datetimes, user_ids, None, diff_days, aggregates)
+        for name in aggregates:
+            np.testing.assert_allclose(_result[name], _expected[name])
+        _result = result.get_top_k_batch(datetimes, user_ids, k=3, diff_days=diff_days)
+        _expected = expected.get_top_k_batch(datetimes, user_ids, k=3, diff_days=diff_days)
+        for diff_day in diff_days:
+            np.testing.assert_array_equal(_result[diff_day][1], _expected[diff_day][1])
+        np.testing.assert_allclose(result.get_entropy('user', datetimes[0], 30),
+                                   expected.get_entropy('user', datetimes[0], 30))
+        np.testing.assert_array_equal(result.get_bucket_counts('item', 7, 'dense')[0],
+                                      expected.get_bucket_counts('item', 7, 'dense')[0])
+
+    def test16_01(self):
+        expected = preprocesser(self.user_ids, self.item_ids, self.datetimes)
+        result = preprocesser(self.user_ids, self.item_ids, self.datetimes, compact=True, time_resolution=1)
+        self.assertEqual(len(result), len(self.datetimes) // 2)
+        self.assertEqual(int(result.weights.sum()), len(self.datetimes))
+        self._assert_same_counts(result, expected, self.datetimes)
+        # get_past_cnt_of_log はマージした行ごとの件数
+        seconds = result.datetimes.astype(np.int64) + result.datetime_offset
+        _user_ids = result.user_id_tf.inverse_transform_array(result.user_ids)
+        np.testing.assert_array_equal(result.get_past_cnt_of_log(self.diff_days)['user'],
+                                      expected.get_past_cnt_batch(seconds, _user_ids, None, self.diff_days))
+        # append と save, load
+        n = len(self.datetimes) // 3
+        appended = preprocesser(self.user_ids[:n], self.item_ids[:n], self.datetimes[:n], time_resolution=1)
+        appended.append(self.user_ids[n:], self.item_ids[n:], self.datetimes[n:])
+        with tempfile.TemporaryDirectory() as dir:
+            appended.save(dir)
+            self._assert_same_counts(preprocesser.load(dir), expected, self.datetimes)
+
+    def test16_02(self):
+        # 1時間単位でマージした場合は、datetimes を1時間単位で切り捨てたデータと同じ結果になる
+        seconds = np.array(self.datetimes, dtype='datetime64[s]').astype(np.int64)
+        floored = seconds - seconds % 3600
+        expected = preprocesser(self.user_ids, self.item_ids, floored)
+        result = preprocesser(self.user_ids, self.item_ids, self.datetimes, time_resolution=3600)
+        self.assertLessEqual(len(result), len(self.datetimes) // 2)
+        self._assert_same_counts(result, expected, self.datetimes)
+
+
+class TEST17(unittest.TestCase):
+    '''配列版のメソッドに長さの異なる入力を渡した場合に ValueError になることを確認する。'''
+    def test17_01(self):
+        user_item_datetime = preprocesser(*read_test_data())
+        datetimes = ['2019-04-15'] * 5
+        for user_ids in [['u_1'] * 3, ['u_1'] * 7]:
+            with self.assertRaises(ValueError):
+                user_item_datetime.get_past_cnt_batch(datetimes, user_ids)
+            with self.assertRaises(ValueError):
+                user_item_datetime.get_past_cnt_batch(datetimes, None, user_ids)
+            with self.assertRaises(ValueError):
+                user_item_datetime.get_past_aggregates_batch(datetimes, user_ids)
+            with self.assertRaises(ValueError):
+                user_item_datetime.get_top_k_batch(datetimes, user_ids)
+        self.assertEqual(user_item_datetime.get_past_cnt_batch(datetimes, ['u_1'] * 5).shape, (5, 3))
+
+
 if __name__ == '__main__':
     print("""このテストを実行する前に、以下のコマンドを実行して変更したプログラムを反映してください。
           > cd [setup.py があるディレクトリ]
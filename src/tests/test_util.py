@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+テストコマンド
+ > python -m unittest src.tests.test_util
+'''
+
+
+import unittest
+import numpy as np
+from user_item_preprocess import util
+
+class TEST01(unittest.TestCase):
+    def test01_01(self):
+        # ISO形式は numpy でまとめてパースし、strptime と同じ結果になる
+        datetimes = ['2019-04-01 12:34:56', '1999-12-31 23:59:59']
+        result = util.array_to_seconds(datetimes, '%Y-%m-%d %H:%M:%S')
+        self.assertEqual(result.dtype, np.int64)
+        self.assertEqual(list(result), [1554122096, 946684799])
+
+    def test01_02(self):
+        # ISO形式以外は strptime にフォールバックする
+        result = util.array_to_seconds(['2019/04/01'], '%Y/%m/%d')
+        self.assertEqual(list(result), [1554076800])
+
+    def test01_03(self):
+        self.assertEqual(util.to_seconds('2019-04-01', '%Y-%m-%d'), 1554076800)
+        self.assertEqual(util.to_seconds(np.datetime64('2019-04-01')), 1554076800)
+        self.assertEqual(util.to_seconds(1554076800), 1554076800)
+        self.assertEqual(util.seconds_to_str(1554122096), '2019-04-01 12:34:56')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from . import hellow
-from . import ID
-from . import statistics
-from . import user_item_datetime
-from . import util
+"""
+サブモジュールは、最初に参照された時に import する（import user_item_preprocess 自体は何も読み込まない）。
+Cython の拡張モジュール ID がコンパイルされていない場合、ID は Python 版の _id_fallback になる。
+"""
+__all__ = ['aggregate', 'arrow', 'bucket', 'buffer', 'cache', 'hellow', 'ID', 'id_array', 'index', 'instrument', 'multi_key',
+           'parallel', 'partition', 'server', 'statistics', 'stream', 'user_item_datetime', 'util']
 
+
+def __getattr__(name):
+    import importlib
+    if name == 'ID':
+        try:
+            module = importlib.import_module('.ID', __name__)
+        except ImportError:
+            module = importlib.import_module('._id_fallback', __name__)
+        globals()['ID'] = module
+        return module
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
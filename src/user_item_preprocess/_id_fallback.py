@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+id_transformer の実装。Cython 版と Python 版で実装が食い違わないよう、実装はこのファイルだけにある。
+* ID.pyx はこのファイルを include して Cython でコンパイルする（拡張モジュール ID）。
+* 拡張モジュール ID がコンパイルされていない環境では、このモジュールがそのまま ID の代わりに使われる。
+  （user_item_preprocess.ID を参照すると、ID が import できない場合はこのモジュールになる。）
+preprocesser が使う配列モードは numpy (id_array) で処理するので、速度はほとんど変わらない。
+"""
+
+import os
+import pickle
+import numpy as np
+from user_item_preprocess import id_array
+
+
+class id_transformer:
+    SAVE_FILE_NAME_id_convert_dict = 'id_convert_dict.pickle'
+    SAVE_FILE_NAME_inverse_id_convert_dict = 'inverse_id_convert_dict.pickle'
+
+    def __init__(self):
+        """
+        transform ids to the index which start from 0.
+
+        There are two modes.
+        * dict mode (fit, transform, ...):
+            ids are managed by python dicts. any hashable id can be used.
+        * array mode (fit_array, transform_array, ...):
+            ids are managed by numpy arrays (see id_array).
+            ids must be all int or all str, and indexes are int32 numpy arrays.
+            unknown ids are transformed to -1.
+        Methods of dict mode also work after fit_array.
+        """
+        self.id_convert_dict = None
+        self.inverse_id_convert_dict = None
+        self.vocabulary = None
+
+    def __len__(self):
+        """
+        the number of ids.
+        """
+        if self.is_array_mode():
+            return len(self.vocabulary)
+        return 0 if self.id_convert_dict is None else len(self.id_convert_dict)
+
+    def save(self, dir='/tmp'):
+        """
+        Save the dicts of dict mode as pickle files.
+        To save the arrays of array mode, use self.save_array.
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            path of the directory where to save.
+        """
+        with open(os.path.join(dir, self.SAVE_FILE_NAME_id_convert_dict), 'wb') as f:
+            pickle.dump(self.id_convert_dict, f)
+        with open(os.path.join(dir, self.SAVE_FILE_NAME_inverse_id_convert_dict), 'wb') as f:
+            pickle.dump(self.inverse_id_convert_dict, f)
+
+    def load(self, dir='/tmp'):
+        """
+        Load the dicts saved by self.save.
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            path of the directory where to load.
+        """
+        with open(os.path.join(dir, self.SAVE_FILE_NAME_id_convert_dict), 'rb') as f:
+            self.id_convert_dict = pickle.load(f)
+        with open(os.path.join(dir, self.SAVE_FILE_NAME_inverse_id_convert_dict), 'rb') as f:
+            self.inverse_id_convert_dict = pickle.load(f)
+
+    def fit(self, ids):
+        """
+        ARGUMETs:
+            ids [array-like object]:
+                array of id of user or item.
+        """
+        ids_ = sorted(set(ids))
+        self.id_convert_dict = {i:index for index,i in enumerate(ids_)}
+        self.inverse_id_convert_dict = {item:key for key,item in self.id_convert_dict.items()}
+        self.vocabulary = None
+
+    def transform(self, ids, unknown=None):
+        """
+        ARGUMETs:
+            ids [array-like object]:
+                array of id of user or item.
+        """
+        if self.is_array_mode():
+            return [unknown if c < 0 else c for c in self.transform_array(ids).tolist()]
+        return [self.id_convert_dict.get(i, unknown) for i in ids]
+
+    def transform_single_id(self, single_id, unknown=None):
+        if self.is_array_mode():
+            return self.vocabulary.lookup_single(single_id, unknown)
+        return self.id_convert_dict.get(single_id, unknown)
+
+    def fit_transform(self, ids):
+        self.fit(ids)
+        return self.transform(ids)
+
+    def inverse_transform(self, indexes, unknown=None):
+        """
+        ARGUMETs:
+            indexes [array-like object]:
+                array of index which are transformed by self.fit
+        """
+        if self.is_array_mode():
+            return [self.inverse_transform_single_id(ind, unknown) for ind in indexes]
+        return [self.inverse_id_convert_dict.get(ind, unknown) for ind in indexes]
+
+    def inverse_transform_single_id(self, single_index, unknown=None):
+        if self.is_array_mode():
+            return self.vocabulary.inverse_single(single_index, unknown)
+        return self.inverse_id_convert_dict.get(single_index, unknown)
+
+    def fit_update(self, ids):
+        """
+        Add unknown ids. new indexes start from (the max of current indexes + 1).
+        In array mode, new ids are added as a new run of id_array.vocabulary,
+        so the cost depends on len(ids), not on the number of known ids.
+
+        ARGUMETs:
+            ids [array-like object]:
+                array of id of user or item.
+        """
+        if self.is_array_mode():
+            ids = id_array.as_id_array(ids)
+            self.vocabulary.add(np.unique(ids[self.transform_array(ids) < 0]))
+            return
+        if self.id_convert_dict is None:
+            self.id_convert_dict, self.inverse_id_convert_dict = {}, {}
+        ids_ = [id_ for id_ in sorted(set(ids)) if id_ not in self.id_convert_dict]
+        now_max_id = max(self.id_convert_dict.values(), default=-1)
+        new_id_convert_dict = {i:now_max_id+1+index for index,i in enumerate(ids_)}
+        self.id_convert_dict.update(new_id_convert_dict)
+        self.inverse_id_convert_dict.update({item:key for key,item in new_id_convert_dict.items()})
+
+    def is_array_mode(self):
+        return self.vocabulary is not None
+
+    def fit_array(self, ids):
+        """
+        fit in array mode. same indexes as self.fit are given (the order of sorted ids).
+
+        ARGUMETs:
+            ids [array-like object]:
+                array of id of user or item. all int or all str.
+        """
+        self.fit_transform_array(ids)
+
+    def fit_transform_array(self, ids):
+        """
+        fit in array mode and return the indexes of ids as int32 numpy array.
+        """
+        self.vocabulary, codes = id_array.vocabulary.from_ids(ids)
+        self.id_convert_dict, self.inverse_id_convert_dict = None, None
+        return codes
+
+    def transform_array(self, ids, unknown=-1):
+        """
+        ARGUMETs:
+            ids [array-like object]:
+                array of id of user or item.
+            unknown [int]:
+                index of unknown ids.
+        RETURN:
+            int32 numpy array of indexes.
+        """
+        if self.is_array_mode():
+            return self.vocabulary.lookup(ids, unknown)
+        return np.array([self.id_convert_dict.get(i, unknown) for i in ids],
+                        dtype=id_array.CODE_DTYPE)
+
+    def inverse_transform_array(self, indexes):
+        """
+        ARGUMETs:
+            indexes [array-like object]:
+                array of index which are transformed by self.fit_array.
+                all indexes must be known (0 <= index < number of ids).
+        RETURN:
+            numpy array of ids.
+        """
+        if self.is_array_mode():
+            return self.vocabulary.inverse(indexes)
+        return np.array([self.inverse_id_convert_dict[ind] for ind in indexes])
+
+    def save_array(self, dir='/tmp'):
+        """
+        Save the arrays of array mode as .npy files (see id_array.save).
+        str ids are saved as offsets and an utf-8 bytes blob.
+        Unlike self.save, no python dict is pickled.
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            path of the directory where to save.
+        """
+        if not self.is_array_mode():
+            raise ValueError('save_array is available only in array mode. use fit_array.')
+        self.vocabulary.save(dir)
+
+    def load_array(self, dir='/tmp', mmap=True):
+        """
+        Load the arrays saved by self.save_array.
+        If mmap is True, the files are opened by np.memmap (read only).
+        Loading is near-instant, and processes which load the same files
+        share the pages. Lookups are binary searches on the mapped data.
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            path of the directory where to load.
+        mmap [bool]:
+            whether to open the files by np.memmap.
+        """
+        self.vocabulary = id_array.vocabulary.load(dir, mmap)
+        self.id_convert_dict, self.inverse_id_convert_dict = None, None
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser.get_past_aggregates で使う、期間内のデータの集計。
+time_index の各 sorted_run で、クエリごとの期間の範囲を一度だけ二分探索し、
+diff_days の全ての期間の集計値を計算する。
+
+* count, min_age, max_age は範囲の位置だけから計算するので、期間内の行数によらず速い。
+* decay, distinct は期間内の行を取り出して集計するので、
+  コストは最も長い期間内の行数の合計に比例する。
+* top_k_past（期間内の件数が多い値の上位 k 個）も、期間内の行を取り出して集計する。
+"""
+
+import numpy as np
+from user_item_preprocess import util
+from user_item_preprocess.index import segment_searchsorted, expand_ranges
+
+AGGREGATES = ['count', 'distinct', 'min_age', 'max_age', 'decay']
+
+
+def aggregate_past(index, keys, _datetimes, diff_times, aggregates=AGGREGATES, half_life=None, values=None,
+                   weights=None, max_rows=10000000):
+    """
+    keys[i] に対応するデータのうち、_datetimes[i] より前で diff_times ごとの期間内にあるものを集計する。
+    期間は time_index.count_past と同じ。
+
+    ARGUMENTs
+    -----------------
+    index [time_index]:
+        集計するインデックス。
+    keys [numpy.array which element is int]:
+        各クエリのキー。
+    _datetimes [numpy.array which element is int]:
+        各クエリの datetime（インデックスの datetimes と同じ単位）。
+    diff_times [numpy.array which element is int]:
+        期間の長さの秒数。
+    aggregates [list of str]:
+        計算する集計値。AGGREGATES のうちのいくつか。
+        * count: 行数。
+        * distinct: values の種類数。
+        * min_age, max_age: 最も新しい行と最も古い行の経過日数(float)。行がない場合は nan。
+        * decay: 各行を 0.5 ** (経過秒数 / half_life) で重み付けした行数。
+    half_life [int or None]:
+        decay の半減期の秒数。
+    values [numpy.array or None]:
+        distinct で種類数を数える、行番号を添字とした値（item_ids など）。
+    weights [numpy.array or None]:
+        行番号を添字とした各行の重み。count, decay は重みを掛けて合計する。
+        index も同じ重みで作成されている必要がある。
+    max_rows [int]:
+        decay, distinct の計算で、1回に取り出す行数の上限の目安。
+        クエリを期間内の行数の合計が max_rows 程度になるように分けて処理し、メモリ使用量を抑える。
+
+    RETURN
+    -----------------
+    aggregates をキーとし、(クエリ数, len(diff_times)) の numpy.array を値とする dict。
+    """
+    unknowns = set(aggregates) - set(AGGREGATES)
+    if unknowns:
+        raise ValueError('Unknown aggregates: {}'.format(sorted(unknowns)))
+    if 'decay' in aggregates and not half_life:
+        raise ValueError('half_life must be specified to compute decay.')
+
+    _datetimes = np.asarray(_datetimes, dtype=np.int64)
+    n_queries, n_windows = len(_datetimes), len(diff_times)
+    is_gather = 'decay' in aggregates or 'distinct' in aggregates
+    counts = np.zeros((n_queries, n_windows), dtype=np.int64)
+    newests = np.full((n_queries, n_windows), np.iinfo(np.int64).min)
+    oldests = np.full((n_queries, n_windows), np.iinfo(np.int64).max)
+    run_ranges = []
+    for run in index.runs:
+        starts, ends = run.get_ranges(keys)
+        end_pos = segment_searchsorted(run.datetimes, starts, ends, _datetimes, side='left')
+        max_start_pos = end_pos
+        for i, diff_time in enumerate(diff_times):
+            start_pos = segment_searchsorted(
+                    run.datetimes, starts, end_pos, _datetimes - diff_time, side='right')
+            has_data = start_pos < end_pos
+            counts[:, i] += run.sum_weights(start_pos, end_pos)
+            newests[has_data, i] = np.maximum(newests[has_data, i], run.datetimes[end_pos[has_data] - 1])
+            oldests[has_data, i] = np.minimum(oldests[has_data, i], run.datetimes[start_pos[has_data]])
+            max_start_pos = np.minimum(max_start_pos, start_pos)
+        run_ranges.append((max_start_pos, end_pos))
+
+    has_data = newests > np.iinfo(np.int64).min
+    results = {}
+    if 'count' in aggregates:
+        results['count'] = counts
+    if 'min_age' in aggregates:
+        results['min_age'] = np.where(has_data, (_datetimes[:, None] - newests) / util.DAY_SECONDS, np.nan)
+    if 'max_age' in aggregates:
+        results['max_age'] = np.where(has_data, (_datetimes[:, None] - oldests) / util.DAY_SECONDS, np.nan)
+    if 'decay' in aggregates:
+        results['decay'] = np.zeros((n_queries, n_windows), dtype=np.float64)
+    if 'distinct' in aggregates:
+        results['distinct'] = np.zeros((n_queries, n_windows), dtype=np.int64)
+    if is_gather:
+        n_rows = sum((end_pos - start_pos for start_pos, end_pos in run_ranges), np.zeros(n_queries, dtype=np.int64))
+        for start, end in split_by_rows(n_rows, max_rows):
+            query_index, ages, orders = gather_rows(index.runs, run_ranges, _datetimes, start, end)
+            if 'decay' in aggregates:
+                decay_weights = np.exp2(-ages / half_life)
+                if weights is not None:
+                    decay_weights *= weights[orders]
+                results['decay'][start:end] = sum_in_windows(
+                        query_index, ages, decay_weights, end - start, diff_times)
+            if 'distinct' in aggregates:
+                query_index, ages = min_age_of_pairs(query_index, values[orders], ages)
+                results['distinct'][start:end] = sum_in_windows(query_index, ages, None, end - start, diff_times)
+    return {name: results[name] for name in aggregates}
+
+
+def split_by_rows(n_rows, max_rows):
+    """
+    クエリを、n_rows（各クエリの行数）の合計が max_rows 程度になる連続した区間 (start, end) に分ける。
+    1つのクエリの行数が max_rows を超える場合は、そのクエリだけの区間になる。
+    """
+    cum_rows = np.cumsum(n_rows)
+    chunks, start = [], 0
+    while start < len(n_rows):
+        base = cum_rows[start - 1] if start else 0
+        end = max(int(np.searchsorted(cum_rows, base + max_rows, side='right')), start + 1)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def gather_rows(runs, run_ranges, _datetimes, start, end):
+    """
+    クエリ start:end の期間内の行を全ての sorted_run から取り出す。
+
+    RETURN
+    -----------------
+    (各行のクエリの番号 - start, 各行の経過秒数, 各行の行番号)
+    """
+    query_indexes, ages, orders = [], [], []
+    for run, (start_pos, end_pos) in zip(runs, run_ranges):
+        positions, query_index = expand_ranges(start_pos[start:end], end_pos[start:end])
+        query_indexes.append(query_index)
+        ages.append(_datetimes[start:end][query_index] - run.datetimes[positions])
+        orders.append(run.order[positions])
+    if not query_indexes:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(query_indexes), np.concatenate(ages), np.concatenate(orders)
+
+
+def sum_in_windows(query_index, ages, weights, n_queries, diff_times):
+    """
+    ages < diff_time の行の weights をクエリごとに合計し、(n_queries, len(diff_times)) の配列で返却する。
+    weights が None の場合は行数を数える。
+    """
+    sums = np.zeros((n_queries, len(diff_times)), dtype=np.float64)
+    for i, diff_time in enumerate(diff_times):
+        in_window = ages < diff_time
+        sums[:, i] = np.bincount(query_index, weights=in_window if weights is None else weights * in_window,
+                                 minlength=n_queries)
+    return sums
+
+
+def min_age_of_pairs(query_index, values, ages):
+    """
+    (query_index, values) の組み合わせごとに、最小の ages を返却する。
+
+    RETURN
+    -----------------
+    (組み合わせの query_index, 組み合わせの最小の ages)
+    """
+    if len(query_index) == 0:
+        return query_index, ages
+    values = np.asarray(values, dtype=np.int64)
+    pair_keys = query_index * (int(values.max()) + 1) + values
+    sort_index = np.argsort(pair_keys)
+    pair_keys = pair_keys[sort_index]
+    is_head = np.ones(len(pair_keys), dtype=bool)
+    is_head[1:] = pair_keys[1:] != pair_keys[:-1]
+    heads = np.flatnonzero(is_head)
+    return query_index[sort_index[heads]], np.minimum.reduceat(ages[sort_index], heads)
+
+
+def top_k_past(index, keys, _datetimes, diff_times, values, n_values, k=10, weights=None, max_rows=10000000):
+    """
+    keys[i] に対応するデータのうち、_datetimes[i] より前で diff_times ごとの期間内にあるものについて、
+    values の値ごとの件数を数え、件数の多い上位 k 個の値と件数を返却する。期間は time_index.count_past と同じ。
+
+    ARGUMENTs
+    -----------------
+    index, keys, _datetimes, diff_times, max_rows:
+        aggregate_past と同じ。
+    values [numpy.array which element is int]:
+        件数を数える、行番号を添字とした 0 以上 n_values 未満の値（item_ids など）。
+    n_values [int]:
+        values の種類数。
+    k [int]:
+        返却する値の数。
+    weights [numpy.array or None]:
+        行番号を添字とした各行の重み。件数は重みの合計になる。
+
+    RETURN
+    -----------------
+    (上位の値, その件数) で、どちらも (クエリ数, len(diff_times), k) の numpy.array。
+    件数の降順（同じ件数の場合は値の昇順）に並び、k 個に満たない部分は値が -1、件数が 0 になる。
+    """
+    _datetimes = np.asarray(_datetimes, dtype=np.int64)
+    n_queries, n_windows = len(_datetimes), len(diff_times)
+    top_values = np.full((n_queries, n_windows, k), -1, dtype=np.int64)
+    top_counts = np.zeros((n_queries, n_windows, k), dtype=np.int64)
+    if n_windows == 0 or k <= 0:
+        return top_values, top_counts
+    # 最も長い期間の範囲だけを取り出し、短い期間は経過秒数で絞り込む。
+    max_diff_time = max(diff_times)
+    run_ranges = []
+    for run in index.runs:
+        starts, ends = run.get_ranges(keys)
+        end_pos = segment_searchsorted(run.datetimes, starts, ends, _datetimes, side='left')
+        start_pos = segment_searchsorted(run.datetimes, starts, end_pos, _datetimes - max_diff_time, side='right')
+        run_ranges.append((start_pos, end_pos))
+    n_rows = sum((end_pos - start_pos for start_pos, end_pos in run_ranges), np.zeros(n_queries, dtype=np.int64))
+    for start, end in split_by_rows(n_rows, max_rows):
+        query_index, ages, orders = gather_rows(index.runs, run_ranges, _datetimes, start, end)
+        row_values = np.asarray(values[orders], dtype=np.int64)
+        row_weights = None if weights is None else np.asarray(weights[orders], dtype=np.int64)
+        for i, diff_time in enumerate(diff_times):
+            in_window = ages < diff_time
+            top_values[start:end, i], top_counts[start:end, i] = top_k_of_pairs(
+                    query_index[in_window], row_values[in_window], end - start, n_values, k,
+                    None if row_weights is None else row_weights[in_window])
+    return top_values, top_counts
+
+
+def top_k_of_pairs(query_index, values, n_queries, n_values, k, weights=None):
+    """
+    (query_index, values) の組み合わせの件数（weights を指定した場合は重みの合計）を数え、
+    クエリごとに件数の多い上位 k 個の値と件数を返却する。
+    組み合わせの種類の上限 (n_queries * n_values) が行数に比べて小さい場合は np.bincount と np.argpartition で、
+    大きい場合はソートで数える。
+
+    RETURN
+    -----------------
+    (上位の値, その件数) で、どちらも (n_queries, k) の numpy.array。並び順は top_k_past と同じ。
+    """
+    top_values = np.full((n_queries, k), -1, dtype=np.int64)
+    top_counts = np.zeros((n_queries, k), dtype=np.int64)
+    if len(values) == 0:
+        return top_values, top_counts
+    pair_keys = query_index * n_values + values
+    if n_queries * n_values <= 4 * len(values):
+        counts = np.bincount(pair_keys, weights, minlength=n_queries * n_values).astype(np.int64)
+        counts = counts.reshape(n_queries, n_values)
+        # 同じ件数の場合に値の小さい方が上位になるように、件数と値を1つのスコアにする。
+        scores = counts * n_values + (n_values - 1 - np.arange(n_values))
+        n_top = min(k, n_values)
+        if n_top < n_values:
+            tops = np.argpartition(-scores, n_top - 1, axis=1)[:, :n_top]
+        else:
+            tops = np.broadcast_to(np.arange(n_values), (n_queries, n_values))
+        tops = np.take_along_axis(tops, np.argsort(-np.take_along_axis(scores, tops, axis=1), axis=1), axis=1)
+        _counts = np.take_along_axis(counts, tops, axis=1)
+        top_values[:, :n_top] = np.where(_counts > 0, tops, -1)
+        top_counts[:, :n_top] = _counts
+        return top_values, top_counts
+
+    if weights is None:
+        pair_keys, counts = np.unique(pair_keys, return_counts=True)
+    else:
+        pair_keys, inverse = np.unique(pair_keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights).astype(np.int64)
+    _query_index, _values = pair_keys // n_values, pair_keys % n_values
+    sort_index = np.lexsort((_values, -counts, _query_index))
+    _query_index, _values, counts = _query_index[sort_index], _values[sort_index], counts[sort_index]
+    ranks = np.arange(len(_query_index)) - np.searchsorted(_query_index, _query_index, side='left')
+    is_top = ranks < k
+    top_values[_query_index[is_top], ranks[is_top]] = _values[is_top]
+    top_counts[_query_index[is_top], ranks[is_top]] = counts[is_top]
+    return top_values, top_counts
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser.from_arrow で使う、Arrow の列を内部ID・秒数に変換する関数群。（pyarrow が必要）
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from user_item_preprocess import util
+
+
+def iter_batches(source, columns, batch_size=1000000):
+    """
+    source から columns の列だけを持つ pyarrow.RecordBatch を順に返却する。
+    source は preprocesser.from_arrow を参照。
+    """
+    if isinstance(source, str):
+        parquet_file = pq.ParquetFile(source, read_dictionary=columns[:2])
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    elif isinstance(source, pa.Table):
+        yield from source.select(columns).to_batches(max_chunksize=batch_size)
+    elif isinstance(source, pa.RecordBatch):
+        yield source.select(columns)
+    else:
+        for batch in source:
+            yield batch.select(columns)
+
+
+def _buffer_key(array):
+    """
+    array のバッファのアドレスと長さ。同じ辞書を使い回しているかの判定に使う。
+    """
+    return (len(array), array.offset) + tuple(0 if b is None else b.address for b in array.buffers())
+
+
+class code_mapper:
+    def __init__(self, id_transformer):
+        """
+        Arrow の ID の列を、id_transformer の内部ID(int32)の numpy.array に変換する。
+        未知のIDは id_transformer に fit_update で追加する。
+        """
+        self.id_transformer = id_transformer
+        self._dictionary_key = None
+        self._dictionary_codes = None
+
+    def transform(self, array):
+        """
+        ARGUMENTs
+        -----------------
+        array [pyarrow.Array or pyarrow.ChunkedArray]:
+            ID の列。辞書エンコードされている場合は、辞書だけを変換する。
+        """
+        if isinstance(array, pa.ChunkedArray):
+            chunks = [self.transform(chunk) for chunk in array.chunks]
+            return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+        if array.null_count:
+            raise ValueError('ID columns must not contain nulls.')
+        if not pa.types.is_dictionary(array.type):
+            ids = array.to_numpy(zero_copy_only=False)
+            self.id_transformer.fit_update(ids)
+            return self.id_transformer.transform_array(ids)
+
+        key = _buffer_key(array.dictionary)
+        if key != self._dictionary_key:
+            dictionary = array.dictionary.to_numpy(zero_copy_only=False)
+            self.id_transformer.fit_update(dictionary)
+            self._dictionary_codes = self.id_transformer.transform_array(dictionary)
+            self._dictionary_key = key
+        return self._dictionary_codes[array.indices.to_numpy(zero_copy_only=False)]
+
+
+def to_seconds(array, datetime_format='%Y-%m-%d %H:%M:%S'):
+    """
+    Arrow の datetime の列を、1970-01-01 00:00:00 (UTC) からの秒数(int64)の numpy.array に変換する。
+    timestamp, date 型は numpy.datetime64 として、文字列を経由せずに変換する。
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if array.null_count:
+        raise ValueError('The datetime column must not contain nulls.')
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    return util.array_to_seconds(array.to_numpy(zero_copy_only=False), datetime_format)
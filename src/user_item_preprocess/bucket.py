@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+datetime を一定の長さの区間（バケット）に分けて、ID × バケットごとの件数を数える。
+preprocesser.get_bucket_counts で使う。
+"""
+
+import numpy as np
+
+
+def get_buckets(seconds, bucket_seconds):
+    """
+    秒数をバケットの番号に変換する。
+    バケットの境界は 1970-01-01 00:00:00 から bucket_seconds ごと（1日単位なら UTC の0時）。
+
+    RETURN
+    -----------------
+    (各要素のバケットの番号, 各バケットの開始の秒数の配列)
+    バケットの番号は、最も古い要素のバケットを 0 とする。
+
+    EXAMPLE
+    -------------
+    get_buckets(np.array([86400*2+10, 86400*4]), 86400)
+     > (array([0, 2]), array([172800, 259200, 345600]))
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if len(seconds) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    origin = seconds.min() // bucket_seconds * bucket_seconds
+    buckets = (seconds - origin) // bucket_seconds
+    bucket_starts = origin + np.arange(buckets.max() + 1, dtype=np.int64) * bucket_seconds
+    return buckets, bucket_starts
+
+
+def count_unique_rows(columns, weights=None):
+    """
+    columns を列とする表の、同じ行ごとの件数（weights を指定した場合は重みの合計）を数える。
+
+    RETURN
+    -----------------
+    (ユニークな行の各列の配列のリスト, 各行の件数)
+    行は columns の先頭の列、次の列、... の順にソートされている。
+
+    EXAMPLE
+    -------------
+    count_unique_rows([np.array([1, 0, 1]), np.array([5, 5, 5])])
+     > ([array([0, 1]), array([5, 5])], array([1, 2]))
+    """
+    columns = [np.asarray(column, dtype=np.int64) for column in columns]
+    n = len(columns[0])
+    if n == 0:
+        return columns, np.zeros(0, dtype=np.int64)
+    sort_index = np.lexsort(columns[::-1])
+    columns = [column[sort_index] for column in columns]
+    is_head = np.zeros(n, dtype=bool)
+    is_head[0] = True
+    for column in columns:
+        is_head[1:] |= column[1:] != column[:-1]
+    heads = np.flatnonzero(is_head)
+    if weights is None:
+        counts = np.diff(np.append(heads, n))
+    else:
+        counts = np.add.reduceat(np.asarray(weights, dtype=np.int64)[sort_index], heads)
+    return [column[heads] for column in columns], counts
+
+
+def merge_events(_user_ids, _item_ids, seconds, time_resolution):
+    """
+    user, item と、秒数を time_resolution 秒で切り捨てた値が同じ行を、1つの重み付きの行にマージする。
+    マージした行の秒数は切り捨てた値になる。
+
+    RETURN
+    -----------------
+    (_user_ids, _item_ids, seconds, weights)
+    行は秒数、user, item の順にソートされている。weights はマージした行の件数。
+
+    EXAMPLE
+    -------------
+    merge_events(np.array([0, 0, 1]), np.array([5, 5, 5]), np.array([120, 150, 130]), 60)
+     > (array([0, 1]), array([5, 5]), array([120, 120]), array([2, 1]))
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    floored = seconds - seconds % time_resolution
+    (seconds, _user_ids_, _item_ids_), weights = count_unique_rows([floored, _user_ids, _item_ids])
+    return (_user_ids_.astype(np.asarray(_user_ids).dtype), _item_ids_.astype(np.asarray(_item_ids).dtype),
+            seconds, weights)
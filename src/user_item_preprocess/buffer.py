@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+データの追加に対応した numpy の配列。
+"""
+
+import numpy as np
+
+
+class growing_array:
+    def __init__(self, values):
+        """
+        要素の追加(append)ができる numpy の1次元配列。
+        容量が足りなくなった場合は容量を2倍にして確保し直すので、
+        追加のコストは、ならすと追加した件数に比例する。
+        2次元以上の配列の場合は、最初の軸の方向に行を追加する。
+
+        ARGUMENTs
+        --------------------
+        values [numpy.array]:
+            初期値。コピーせずにそのまま内部の配列として利用する。
+        """
+        self._buffer = values
+        self._size = len(values)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        """
+        追加された要素の配列（内部の配列のview）。
+        """
+        return self._buffer[:self._size]
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    def append(self, values):
+        """
+        values を末尾に追加する。
+        """
+        values = np.asarray(values)
+        new_size = self._size + len(values)
+        if new_size > len(self._buffer):
+            capacity = max(2 * len(self._buffer), new_size)
+            buffer = np.empty((capacity,) + self._buffer.shape[1:], dtype=np.result_type(self._buffer, values))
+            buffer[:self._size] = self.values
+            self._buffer = buffer
+        self._buffer[self._size:new_size] = values
+        self._size = new_size
+
+    def astype(self, dtype):
+        """
+        内部の配列の型を dtype に変更する。同じ型の場合は何もしない。
+        """
+        if self._buffer.dtype != dtype:
+            self._buffer = self._buffer.astype(dtype)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+クエリ結果のキャッシュ。
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class lru_cache:
+    def __init__(self, maxsize=10000):
+        """
+        要素数の上限つきの LRU キャッシュ。
+        上限を超えた場合は、最後に参照されてから最も時間が経っている要素を削除する。
+
+        ARGUMENTs
+        --------------------
+        maxsize [int]:
+            保持する要素数の上限。
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """
+        key の値を返却する。存在しない場合は None を返却する。
+        """
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        全ての要素を削除する。hits, misses はそのまま。
+        """
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        """
+        EXAMPLE of RETURN
+        -----------------
+        {'hits': 10, 'misses': 2, 'size': 2, 'maxsize': 10000}
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data), 'maxsize': self.maxsize}
@@ -5,4 +5,5 @@ Created on Thu Mar 28 17:45:48 2019
 
 @author: um003160
 """
-print("Hellow from ", __file__)
+def hellow():
+    print("Hellow from ", __file__)
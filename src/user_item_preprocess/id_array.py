@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ID.id_transformer の配列モードで利用する、numpy による ID 変換の関数群。
+Pythonのdictやlistを経由せずに、IDの配列と内部ID(int32)の配列を相互に変換する。
+
+内部ID の管理には以下の3つの配列を使う。
+    sorted_ids [numpy.array or string_array]: ソート済みのユニークなID
+    sorted_codes [numpy.array of int32]: sorted_ids の各IDの内部ID
+    positions [numpy.array of int64]: 内部ID を添字とした、sorted_ids 上の位置
+
+save, load でこれらの配列を .npy ファイルとして保存し、np.memmap で開くことができる。
+IDの追加(fit_update)に対応するため、vocabulary はこれらの配列のかたまり(id_run)を複数持つ。
+追加したIDは新しい id_run になり、同程度の大きさの id_run 同士をマージしていく（index.time_index と同じ考え方）。
+そのため、追加のコストは全体のIDの数ではなく、追加したIDの数にほぼ比例する。
+文字列のIDは、UTF-8 のバイト列を連結した blob と、各IDの開始位置 offsets として保存する。
+"""
+
+import os
+import numpy as np
+
+CODE_DTYPE = np.int32
+
+
+def as_id_array(ids):
+    """
+    ids を numpy.array に変換する。
+    object型の配列（pandas.Series の文字列など）は、numpy の文字列型や整数型に変換する。
+    * 配列モードでは、1つの配列に文字列と整数のIDを混在させることはできない。
+    """
+    ids = np.asarray(ids)
+    if ids.dtype.kind == 'O' and len(ids):
+        ids = np.asarray(ids.tolist())
+    return ids
+
+
+def factorize(ids):
+    """
+    ids をソート済みのユニークなIDと、その位置を表す内部ID(int32)に変換する。
+    内部IDはソート済みのIDの順番に 0 から振られるので、dictを使う id_transformer.fit と同じになる。
+
+    EXAMPLE
+    -------------
+    factorize(['b', 'a', 'b'])
+     > (array(['a', 'b'], dtype='<U1'), array([1, 0, 1], dtype=int32))
+    """
+    ids = as_id_array(ids)
+    if ids.dtype.kind in 'iu' and len(ids):
+        # 値の範囲が狭い整数は、ソートせずに bincount で変換する。
+        min_id, max_id = int(ids.min()), int(ids.max())
+        if 0 <= min_id and max_id < 4 * len(ids):
+            is_exist = np.bincount(ids.astype(np.int64, copy=False), minlength=max_id+1) > 0
+            codes_of_value = np.cumsum(is_exist, dtype=np.int64) - 1
+            uniques = np.flatnonzero(is_exist).astype(ids.dtype)
+            return uniques, codes_of_value[ids.astype(np.int64, copy=False)].astype(CODE_DTYPE)
+    uniques, codes = np.unique(ids, return_inverse=True)
+    return uniques, codes.reshape(-1).astype(CODE_DTYPE)
+
+
+def lookup(sorted_ids, sorted_codes, ids, unknown=-1):
+    """
+    ids を内部IDに変換する。sorted_ids に存在しないIDは unknown に変換する。
+
+    EXAMPLE
+    -------------
+    lookup(np.array(['a', 'b']), np.array([0, 1]), ['b', 'c'])
+     > array([ 1, -1], dtype=int32)
+    """
+    ids = as_id_array(ids)
+    codes = np.full(len(ids), unknown, dtype=CODE_DTYPE)
+    if len(sorted_ids) == 0 or len(ids) == 0:
+        return codes
+    try:
+        if isinstance(sorted_ids, string_array):
+            _pos, found = sorted_ids.find(ids)
+        else:
+            pos = sorted_ids.searchsorted(ids)
+            _pos = np.minimum(pos, len(sorted_ids) - 1)
+            found = (pos < len(sorted_ids)) & (sorted_ids[_pos] == ids)
+    except TypeError:
+        # 文字列のIDに整数を渡した場合などは、全て未知のIDとする。
+        return codes
+    codes[found] = sorted_codes[_pos[found]]
+    return codes
+
+
+def lookup_single(sorted_ids, sorted_codes, single_id, unknown=None):
+    """
+    lookup の1件版。存在しないIDは unknown を返却する。
+    """
+    if len(sorted_ids) == 0:
+        return unknown
+    try:
+        pos = sorted_ids.searchsorted(single_id)
+    except TypeError:
+        return unknown
+    if pos < len(sorted_ids) and sorted_ids[pos] == single_id:
+        return int(sorted_codes[pos])
+    return unknown
+
+
+def merge(run_a, run_b):
+    """
+    内部IDの範囲が連続する2つの id_run（run_a の次の内部IDから run_b が始まる）をマージした id_run を返却する。
+    run_b のIDは run_a に存在しないIDである必要がある。コストは2つの id_run の大きさの和に比例する。
+    """
+    check_kind(run_a.sorted_ids, run_b.sorted_ids)
+    sorted_ids_a, sorted_ids_b = np.asarray(run_a.sorted_ids), np.asarray(run_b.sorted_ids)
+    insert_pos = np.searchsorted(sorted_ids_a, sorted_ids_b)
+    # 文字列の長さが伸びる場合などに切り捨てられないよう、型を揃えてから挿入する。
+    dtype = np.result_type(sorted_ids_a, sorted_ids_b)
+    sorted_ids = np.insert(sorted_ids_a.astype(dtype, copy=False), insert_pos, sorted_ids_b)
+    sorted_codes = np.insert(np.asarray(run_a.sorted_codes), insert_pos, run_b.sorted_codes)
+    return id_run(sorted_ids, sorted_codes, run_a.first_code)
+
+
+def get_kind(ids):
+    """
+    IDの種類を返却する。文字列は 'str'、整数は 'int'、それ以外は numpy の dtype.kind。
+    """
+    if isinstance(ids, string_array):
+        return 'str'
+    kind = np.asarray(ids).dtype.kind
+    return {'U': 'str', 'S': 'str', 'i': 'int', 'u': 'int'}.get(kind, kind)
+
+
+def check_kind(sorted_ids, new_ids):
+    """
+    new_ids が sorted_ids と同じ種類のIDであることを確認する。
+    文字列と整数のIDを混在させると、np.result_type で全て文字列に変換されてしまうため、エラーにする。
+    sorted_ids が空の場合は、どの種類のIDでもよい。
+
+    EXAMPLE
+    -------------
+    check_kind(np.array([1, 2]), np.array(['a']))
+     > ValueError: Cannot add str ids to int ids. ids must be all int or all str in array mode.
+    """
+    if len(sorted_ids) == 0 or len(new_ids) == 0:
+        return
+    kind, new_kind = get_kind(sorted_ids), get_kind(new_ids)
+    if kind != new_kind:
+        raise ValueError('Cannot add {} ids to {} ids. ids must be all int or all str in array mode.'.format(
+                new_kind, kind))
+
+
+def get_positions(sorted_codes):
+    """
+    内部ID を添字とした、sorted_ids 上の位置の配列を返却する。
+    """
+    positions = np.empty(len(sorted_codes), dtype=np.int64)
+    positions[sorted_codes] = np.arange(len(sorted_codes))
+    return positions
+
+
+# 先頭から k バイトだけを残す（big endian の uint64 の上位 k バイト）マスク。
+_CHUNK_MASKS = np.array([(2**64 - 1) ^ (2**(64 - 8*k) - 1) for k in range(9)], dtype=np.uint64)
+
+
+class string_array:
+    # 配列の検索で範囲を絞り込むため、SAMPLE_INTERVAL 件ごとの文字列の先頭8バイトをメモリに持つ。
+    SAMPLE_INTERVAL = 16
+
+    def __init__(self, offsets, blob):
+        """
+        UTF-8 のバイト列を連結した blob と、各文字列の開始位置 offsets で表した、
+        ソート済みの文字列の配列。numpy.array の代わりに sorted_ids として使う。
+        offsets, blob は np.memmap でもよく、検索の際に全体をメモリに展開したり、固定長にコピーしたりしない。
+
+        ARGUMENTs
+        --------------------
+        offsets [numpy.array of int64]:
+            要素数は文字列の数+1。i番目の文字列は blob[offsets[i]:offsets[i+1]]。
+        blob [numpy.array of uint8]:
+            UTF-8 のバイト列を連結したもの。
+        """
+        self.offsets = offsets
+        self.blob = blob
+        self._samples = None
+        # 1件の検索で使う、Python の int, bytes を返す view
+        self._offsets_view = memoryview(np.ascontiguousarray(offsets, dtype=np.int64)).cast('B').cast('q')
+        self._blob_view = memoryview(np.ascontiguousarray(blob, dtype=np.uint8))
+
+    @classmethod
+    def from_array(cls, strs):
+        """
+        文字列の numpy.array から作成する。
+        """
+        encoded = np.char.encode(np.asarray(strs, dtype=str), 'utf-8')
+        lengths = np.char.str_len(encoded)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        width = max(encoded.itemsize, 1)
+        matrix = np.frombuffer(encoded.astype('S{}'.format(width)).tobytes(), dtype=np.uint8)
+        blob = matrix.reshape(len(encoded), width)[np.arange(width)[None, :] < lengths[:, None]]
+        return cls(offsets, blob)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __array__(self, dtype=None, copy=None):
+        strs = self[np.arange(len(self))]
+        return strs if dtype is None else strs.astype(dtype)
+
+    def __getitem__(self, index):
+        if np.ndim(index) == 0:
+            return np.str_(self._get_bytes(int(index)).decode('utf-8'))
+        matrix = self._get_matrix(np.asarray(index, dtype=np.int64))
+        encoded = np.frombuffer(matrix.tobytes(), dtype='S{}'.format(max(matrix.shape[1], 1)))
+        return np.char.decode(encoded, 'utf-8').astype(str)
+
+    def _get_bytes(self, i):
+        """
+        i番目の文字列の UTF-8 のバイト列を bytes で返却する。
+        """
+        if i < 0:
+            i += len(self)
+        return self._blob_view[self._offsets_view[i]:self._offsets_view[i + 1]].tobytes()
+
+    def _get_matrix(self, index, width=None):
+        """
+        index の文字列のバイト列を、右側を0で埋めた (len(index), width) の uint8 の行列で返却する。
+        width を超える部分は切り捨てる。
+        """
+        starts = self.offsets[index]
+        lengths = self.offsets[index + 1] - starts
+        if width is None:
+            width = int(lengths.max()) if len(lengths) else 0
+        columns = np.arange(width)
+        is_valid = columns[None, :] < lengths[:, None]
+        positions = np.where(is_valid, starts[:, None] + columns[None, :], 0)
+        matrix = np.where(is_valid, self.blob[positions] if len(self.blob) else 0, 0)
+        return matrix.astype(np.uint8)
+
+    def _get_chunks(self, index, start):
+        """
+        index の文字列の start バイト目からの8バイト（足りない部分は0）を、big endian として uint64 で返却する。
+        uint64 の大小が、バイト列の辞書順の大小と一致する。
+        """
+        if len(self.blob) == 0:
+            return np.zeros(len(index), dtype=np.uint64)
+        starts = self.offsets[index] + start
+        lengths = np.clip(self.offsets[index + 1] - starts, 0, 8)
+        positions = starts[:, None] + np.arange(8)
+        np.minimum(positions, len(self.blob) - 1, out=positions)
+        chunks = np.ascontiguousarray(self.blob[positions], dtype=np.uint8).view('>u8').reshape(-1)
+        return chunks.astype(np.uint64) & _CHUNK_MASKS[lengths]
+
+    def searchsorted(self, values, side='left'):
+        """
+        numpy.ndarray.searchsorted と同じ。
+        1件の場合は bytes の比較で二分探索し、配列の場合は全てのクエリを同時に二分探索する。
+        """
+        if np.ndim(values) == 0:
+            if not isinstance(values, str):
+                raise TypeError('string_array can only be searched by str.')
+            return self._searchsorted_single(values.encode('utf-8'), side)
+        return self._searchsorted_query(self._to_query(values), side)
+
+    def find(self, values):
+        """
+        lookup 用に、values の各文字列の位置（len(self) 未満に切り詰めたもの）と、
+        その位置の文字列が一致するかどうかを返却する。文字列に戻さずにバイト列のまま比較する。
+        """
+        query = self._to_query(values)
+        pos = self._searchsorted_query(query)
+        _pos = np.minimum(pos, len(self) - 1)
+        found = (pos < len(self)) & (self._compare(_pos, query) == 0)
+        return _pos, found
+
+    @staticmethod
+    def _to_query(values):
+        """
+        values を、UTF-8 のバイト列を8バイトずつ big endian の uint64 にした行列と、バイト列の長さに変換する。
+        """
+        values = np.atleast_1d(np.asarray(values))
+        if values.dtype.kind != 'U':
+            raise TypeError('string_array can only be searched by str.')
+        n_chars = max(values.itemsize // 4, 1)
+        width = -(-n_chars // 8) * 8
+        code_points = np.zeros((len(values), width), dtype=np.uint32)
+        code_points[:, :values.itemsize // 4] = np.ascontiguousarray(values).view(np.uint32).reshape(len(values), -1)
+        if len(values) == 0 or code_points.max() < 128:
+            # ASCII だけの場合は、文字コードがそのまま UTF-8 のバイト列になる。
+            matrix = code_points.astype(np.uint8)
+            lengths = np.char.str_len(values)
+        else:
+            encoded = np.char.encode(values, 'utf-8')
+            width = -(-max(encoded.itemsize, 1) // 8) * 8
+            matrix = np.frombuffer(encoded.astype('S{}'.format(width)).tobytes(), dtype=np.uint8)
+            lengths = np.char.str_len(encoded)
+        chunks = matrix.reshape(len(values), width).view('>u8').astype(np.uint64)
+        return chunks, lengths
+
+    def _get_samples(self):
+        """
+        SAMPLE_INTERVAL 件ごとの文字列の先頭8バイト（big endian の uint64）。最初に使う時に作成する。
+        """
+        if self._samples is None:
+            self._samples = self._get_chunks(np.arange(0, len(self), self.SAMPLE_INTERVAL), 0)
+        return self._samples
+
+    def _searchsorted_query(self, query, side='left'):
+        """
+        searchsorted の配列版。query は _to_query で変換したクエリ。
+        先頭8バイトのサンプルで範囲を絞り込んでから、全てのクエリを同時に二分探索する。
+        """
+        chunks, _ = query
+        samples = self._get_samples()
+        # サンプルの先頭8バイトがクエリより小さい（大きい）文字列は、クエリより小さい（大きい）。
+        first = chunks[:, 0]
+        lo = np.maximum(np.searchsorted(samples, first, side='left') - 1, 0) * self.SAMPLE_INTERVAL
+        hi = np.minimum(np.searchsorted(samples, first, side='right') * self.SAMPLE_INTERVAL, len(self))
+        active = np.flatnonzero(lo < hi)
+        while len(active):
+            _lo, _hi = lo[active], hi[active]
+            mid = (_lo + _hi) >> 1
+            cmp = self._compare(mid, query, active)
+            go_right = cmp < 0 if side == 'left' else cmp <= 0
+            lo[active] = np.where(go_right, mid + 1, _lo)
+            hi[active] = np.where(go_right, _hi, mid)
+            active = active[lo[active] < hi[active]]
+        return lo
+
+    def _searchsorted_single(self, value, side='left'):
+        """
+        searchsorted の1件版。value は UTF-8 のバイト列。
+        """
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            mid_value = self._get_bytes(mid)
+            if mid_value < value or (side == 'right' and mid_value == value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _compare(self, index, query, rows=None):
+        """
+        self[index] と query の rows 行目のクエリを比較し、小さい場合は-1, 等しい場合は0, 大きい場合は1を返却する。
+        8バイトずつ uint64 で比較し、それまでのバイト列が等しいものだけ次の8バイトを読む。
+        """
+        chunks, lengths = query
+        if rows is not None:
+            chunks, lengths = chunks[rows], lengths[rows]
+        cmp = np.zeros(len(index), dtype=np.int8)
+        undecided = np.arange(len(index))
+        for i in range(chunks.shape[1]):
+            values = self._get_chunks(index[undecided], 8 * i)
+            _chunks = chunks[undecided, i]
+            cmp[undecided] = np.where(values < _chunks, -1, np.where(values > _chunks, 1, 0))
+            undecided = undecided[values == _chunks]
+            if len(undecided) == 0:
+                return cmp
+        # クエリの長さまでのバイト列が同じ場合は、長いものが大きい。
+        _lengths = self.offsets[index[undecided] + 1] - self.offsets[index[undecided]]
+        cmp[undecided] = np.sign(_lengths - lengths[undecided])
+        return cmp
+
+
+def save(dir, sorted_ids, sorted_codes, positions):
+    """
+    sorted_ids, sorted_codes, positions を dir に .npy ファイルとして保存する。
+    文字列のIDは ids_offsets.npy, ids_blob.npy に、それ以外は ids.npy に保存する。
+    """
+    os.makedirs(dir, exist_ok=True)
+    if isinstance(sorted_ids, string_array) or np.asarray(sorted_ids).dtype.kind == 'U':
+        if not isinstance(sorted_ids, string_array):
+            sorted_ids = string_array.from_array(sorted_ids)
+        np.save(os.path.join(dir, 'ids_offsets.npy'), sorted_ids.offsets)
+        np.save(os.path.join(dir, 'ids_blob.npy'), sorted_ids.blob)
+    else:
+        np.save(os.path.join(dir, 'ids.npy'), sorted_ids, allow_pickle=False)
+    np.save(os.path.join(dir, 'codes.npy'), sorted_codes)
+    np.save(os.path.join(dir, 'positions.npy'), positions)
+
+
+def load(dir, mmap=True):
+    """
+    save で保存した (sorted_ids, sorted_codes, positions) を読み込む。
+    mmap=True の場合は np.memmap (読み取り専用) で開くため、読み込みはほぼ一瞬で、
+    複数のプロセスで同じファイルを開いた場合はページキャッシュが共有される。
+    """
+    mmap_mode = 'r' if mmap else None
+    _load = lambda name: np.load(os.path.join(dir, name), mmap_mode=mmap_mode)
+    if os.path.exists(os.path.join(dir, 'ids.npy')):
+        sorted_ids = _load('ids.npy')
+    else:
+        sorted_ids = string_array(_load('ids_offsets.npy'), _load('ids_blob.npy'))
+    return sorted_ids, _load('codes.npy'), _load('positions.npy')
+
+
+class id_run:
+    def __init__(self, sorted_ids, sorted_codes, first_code, positions=None):
+        """
+        内部IDが first_code から連続する、ソート済みのIDのかたまり。
+
+        ARGUMENTs
+        --------------------
+        sorted_ids [numpy.array or string_array]:
+            ソート済みのユニークなID。np.memmap でもよい。
+        sorted_codes [numpy.array of int32]:
+            sorted_ids の各IDの内部ID。first_code から first_code+len(sorted_ids)-1 までの値を1つずつ持つ。
+        first_code [int]:
+            最初の内部ID。
+        positions [numpy.array of int64 or None]:
+            内部ID - first_code を添字とした、sorted_ids 上の位置。None の場合は sorted_codes から作成する。
+        """
+        self.sorted_ids = sorted_ids
+        self.sorted_codes = sorted_codes
+        self.first_code = first_code
+        self.positions = get_positions(np.asarray(sorted_codes) - first_code) if positions is None else positions
+
+    def __len__(self):
+        return len(self.sorted_codes)
+
+    def inverse(self, codes):
+        """
+        内部IDの配列をIDの配列に変換する。codes は全て、この id_run の内部IDである必要がある。
+        """
+        return self.sorted_ids[self.positions[codes - self.first_code]]
+
+
+class vocabulary:
+    def __init__(self, runs=None):
+        """
+        id_transformer の配列モードで、IDと内部IDの対応を管理する。
+        内部IDの範囲の順に id_run を持ち、IDの検索は各 id_run を順に二分探索する。
+
+        ARGUMENTs
+        --------------------
+        runs [list of id_run or None]:
+            内部IDの範囲の順に並べた id_run。最初の id_run の内部IDは 0 から始まる。
+        """
+        self.runs = [] if runs is None else runs
+
+    @classmethod
+    def from_ids(cls, ids):
+        """
+        ids から作成し、ids の内部IDを int32 の numpy.array で返却する。内部IDはソート済みのIDの順番に 0 から振られる。
+        """
+        uniques, codes = factorize(ids)
+        runs = [id_run(uniques, np.arange(len(uniques), dtype=CODE_DTYPE), 0,
+                       np.arange(len(uniques), dtype=np.int64))] if len(uniques) else []
+        return cls(runs), codes
+
+    def __len__(self):
+        return self.runs[-1].first_code + len(self.runs[-1]) if self.runs else 0
+
+    def lookup(self, ids, unknown=-1):
+        """
+        ids を内部IDに変換する。存在しないIDは unknown に変換する。
+        2番目以降の id_run は、それまでの id_run で見つからなかったIDだけを検索する。
+        """
+        ids = as_id_array(ids)
+        codes = np.full(len(ids), unknown, dtype=CODE_DTYPE)
+        rows = np.arange(len(ids))
+        for run in self.runs:
+            _codes = lookup(run.sorted_ids, run.sorted_codes, ids[rows], -1)
+            is_found = _codes >= 0
+            codes[rows[is_found]] = _codes[is_found]
+            rows = rows[~is_found]
+            if len(rows) == 0:
+                break
+        return codes
+
+    def lookup_single(self, single_id, unknown=None):
+        """
+        lookup の1件版。存在しないIDは unknown を返却する。
+        """
+        for run in self.runs:
+            code = lookup_single(run.sorted_ids, run.sorted_codes, single_id)
+            if code is not None:
+                return code
+        return unknown
+
+    def inverse(self, codes):
+        """
+        内部IDの配列をIDの numpy.array に変換する。codes は全て存在する内部IDである必要がある。
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        if len(self.runs) == 1:
+            return self.runs[0].inverse(codes)
+        run_index = np.searchsorted([run.first_code for run in self.runs], codes, side='right') - 1
+        masks = [run_index == i for i in range(len(self.runs))]
+        pieces = [self.runs[i].inverse(codes[mask]) for i, mask in enumerate(masks)]
+        ids = np.empty(len(codes), dtype=np.result_type(*pieces) if pieces else np.int64)
+        for mask, piece in zip(masks, pieces):
+            ids[mask] = piece
+        return ids
+
+    def inverse_single(self, code, unknown=None):
+        """
+        inverse の1件版。存在しない内部IDは unknown を返却する。
+        """
+        if not 0 <= code < len(self):
+            return unknown
+        for run in reversed(self.runs):
+            if run.first_code <= code:
+                return run.sorted_ids[run.positions[code - run.first_code]].item()
+
+    def add(self, new_ids):
+        """
+        未知のIDである new_ids に、新しい内部ID（現在の最大値+1から、ソート済みのIDの順番）を振って追加する。
+        new_ids はユニークで、存在しないIDである必要がある。
+        new_ids を新しい id_run とし、直前の id_run の大きさが新しい id_run の2倍以下になったらマージする。
+        """
+        new_ids = np.sort(as_id_array(new_ids))
+        if len(new_ids) == 0:
+            return
+        if self.runs:
+            check_kind(self.runs[0].sorted_ids, new_ids)
+        n_ids = len(self)
+        self.runs.append(id_run(new_ids, np.arange(n_ids, n_ids + len(new_ids), dtype=CODE_DTYPE), n_ids,
+                                np.arange(len(new_ids), dtype=np.int64)))
+        while len(self.runs) >= 2 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            run_b = self.runs.pop()
+            run_a = self.runs.pop()
+            self.runs.append(merge(run_a, run_b))
+
+    def compact(self):
+        """
+        全ての id_run を1つにマージする。
+        """
+        while len(self.runs) >= 2:
+            run_b = self.runs.pop()
+            run_a = self.runs.pop()
+            self.runs.append(merge(run_a, run_b))
+
+    def save(self, dir):
+        """
+        dir に .npy ファイルとして保存する（save を参照）。保存の前に compact する。
+        """
+        self.compact()
+        if self.runs:
+            save(dir, self.runs[0].sorted_ids, self.runs[0].sorted_codes, self.runs[0].positions)
+        else:
+            save(dir, np.array([], dtype=np.int64), np.array([], dtype=CODE_DTYPE), np.array([], dtype=np.int64))
+
+    @classmethod
+    def load(cls, dir, mmap=True):
+        """
+        save で保存したものを読み込む（load を参照）。
+        """
+        sorted_ids, sorted_codes, positions = load(dir, mmap)
+        return cls([id_run(sorted_ids, sorted_codes, 0, positions)] if len(sorted_codes) else [])
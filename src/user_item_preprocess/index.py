@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+キー（user, item, (user, item) など）ごとに datetime をソートして保持するインデックス。
+preprocesser の構築時に一度だけ作成し、過去件数のカウントを np.searchsorted で行う。
+クエリのコストはログ全体の件数ではなく、1つのグループの件数にのみ依存する。
+
+データの追加(append)に対応するため、time_index はソート済みのデータのかたまり(sorted_run)を
+複数持つ。追加したデータは新しい sorted_run になり、同程度の大きさの sorted_run 同士を
+マージしていく（LSM-tree と同じ考え方）。そのため、追加のコストは追加したデータの件数にほぼ比例し、
+sorted_run の数はデータ件数の log 程度に抑えられる。
+"""
+
+import os
+import numpy as np
+
+
+def composite_key(user_ids, item_ids, width=32):
+    """
+    user_id と item_id の内部ID(int)を 1つの int64 のキーにまとめる。
+    上位ビットが user_id, 下位 width ビット（デフォルトは32bit）が item_id になる。
+    item_ids は 0 以上 2**width 未満である必要がある。
+
+    EXAMPLE
+    -------------
+    composite_key(1, 2)
+     > 4294967298
+    composite_key(1, 2, width=2)
+     > 6
+    """
+    return (np.asarray(user_ids, dtype=np.int64) << width) | np.asarray(item_ids, dtype=np.int64)
+
+
+def segment_searchsorted(sorted_array, starts, ends, values, side='left'):
+    """
+    sorted_array[starts[i]:ends[i]] の範囲ごとに values[i] を二分探索し、
+    挿入位置（sorted_array 上の位置）を返却する。
+    全てのクエリを同時に二分探索するため、numpy の演算回数は log2(最大の範囲の長さ) 回程度になる。
+
+    ARGUMENTs
+    --------------------
+    sorted_array [numpy.array]:
+        各範囲の内部がソートされている1次元の配列。
+    starts, ends [array like object which element is int]:
+        各クエリの探索範囲。
+    values [array like object]:
+        各クエリの探索する値。
+    side [str]:
+        'left' or 'right'. np.searchsorted の side と同じ意味。
+
+    EXAMPLE
+    -------------
+    sorted_array = np.array([1,3,5, 2,4,6])
+    segment_searchsorted(sorted_array, [0,3], [3,6], [4,4])
+     > array([2, 4])
+    """
+    lo = np.array(starts, dtype=np.int64)
+    hi = np.array(ends, dtype=np.int64)
+    values = np.asarray(values)
+    active = np.flatnonzero(lo < hi)
+    while len(active):
+        _lo, _hi = lo[active], hi[active]
+        mid = (_lo + _hi) >> 1
+        if side == 'left':
+            go_right = sorted_array[mid] < values[active]
+        else:
+            go_right = sorted_array[mid] <= values[active]
+        lo[active] = np.where(go_right, mid + 1, _lo)
+        hi[active] = np.where(go_right, _hi, mid)
+        active = active[lo[active] < hi[active]]
+    return lo
+
+
+def expand_ranges(starts, ends):
+    """
+    範囲 starts[i]:ends[i] を連結した位置の配列と、各位置の範囲の番号 i の配列を返却する。
+
+    EXAMPLE
+    -------------
+    expand_ranges([0, 5], [2, 8])
+     > (array([0, 1, 5, 6, 7]), array([0, 0, 1, 1, 1]))
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    range_index = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(len(range_index)) + np.repeat(starts - offsets, lengths)
+    return positions, range_index
+
+
+def get_order_dtype(n_rows):
+    """
+    行番号 0 から n_rows までを格納する型を返却する。
+    """
+    return np.int32 if n_rows < np.iinfo(np.int32).max else np.int64
+
+
+class sorted_run:
+    def __init__(self, keys, datetimes, order, weights=None):
+        """
+        keys ごとに datetimes をソートしたデータのかたまり。
+
+        ARGUMENTs
+        --------------------
+        keys [array like object which element is int]:
+            グループを表すキーの1次元の配列。
+        datetimes [numpy.array]:
+            datetimes の1次元の配列で、要素数は keys と同じ。
+        order [numpy.array which element is int]:
+            各要素の、preprocesser の配列上の行番号。
+        weights [numpy.array which element is int or None]:
+            各要素の重み（マージした行の件数）。None の場合は全て 1。
+        * datetimes, order は渡された型のまま保持する（int32 などの小さい型でもよい）。
+
+        * self.keys はソート済みのユニークなキー。
+        * self.indptr[i]:self.indptr[i+1] が self.keys[i] に対応する範囲。
+        * self.datetimes はキー、datetime の順にソートされた datetimes。
+        * self.order は self.datetimes の各要素の行番号。
+        * self.cum_weights は self.datetimes の順の重みの累積和（先頭は0）。weights が None の場合は None。
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        sort_index = np.lexsort((datetimes, keys))
+        sorted_keys = keys[sort_index]
+        self.datetimes = datetimes[sort_index]
+        self.order = np.asarray(order)[sort_index]
+        self.cum_weights = None
+        if weights is not None:
+            self.cum_weights = np.append(0, np.cumsum(np.asarray(weights, dtype=np.int64)[sort_index]))
+
+        is_head = np.ones(len(sorted_keys), dtype=bool)
+        is_head[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        starts = np.flatnonzero(is_head)
+        self.keys = sorted_keys[starts]
+        self.indptr = np.append(starts, len(sorted_keys))
+
+    @classmethod
+    def from_arrays(cls, keys, indptr, datetimes, order, cum_weights=None):
+        """
+        作成済みの配列（np.memmap など）から、ソートせずに作成する。
+        """
+        self = cls.__new__(cls)
+        self.keys, self.indptr, self.datetimes, self.order = keys, indptr, datetimes, order
+        self.cum_weights = cum_weights
+        return self
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    def get_row_keys(self):
+        """
+        self.datetimes の各要素のキーを返却する。
+        """
+        return np.repeat(self.keys, np.diff(self.indptr))
+
+    def get_weights(self):
+        """
+        self.datetimes の各要素の重みを返却する。重みがない場合は None。
+        """
+        return None if self.cum_weights is None else np.diff(self.cum_weights)
+
+    def sum_weights(self, starts, ends):
+        """
+        範囲 starts[i]:ends[i] の重みの合計（重みがない場合は要素数）を返却する。
+        """
+        if self.cum_weights is None:
+            return ends - starts
+        return self.cum_weights[ends] - self.cum_weights[starts]
+
+    def get_range(self, key):
+        """
+        key に対応する self.datetimes 上の範囲 (start, end) を返却する。
+        key が存在しない場合は (0, 0) を返却する。
+        """
+        pos = np.searchsorted(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return self.indptr[pos], self.indptr[pos+1]
+        return 0, 0
+
+    def get_ranges(self, keys):
+        """
+        get_range の配列版。keys に対応する範囲の配列 (starts, ends) を返却する。
+        存在しない key の範囲は (0, 0) になる。
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        starts = np.zeros(len(keys), dtype=np.int64)
+        ends = np.zeros(len(keys), dtype=np.int64)
+        if len(self.keys) == 0:
+            return starts, ends
+        pos = np.searchsorted(self.keys, keys)
+        _pos = np.minimum(pos, len(self.keys) - 1)
+        found = (pos < len(self.keys)) & (self.keys[_pos] == keys)
+        starts[found] = self.indptr[_pos[found]]
+        ends[found] = self.indptr[_pos[found] + 1]
+        return starts, ends
+
+    def count_past_in_ranges(self, starts, ends, _datetimes, diff_times):
+        """
+        範囲 starts[i]:ends[i] の datetimes のうち、_datetimes[i] より前で、
+        diff_times ごとの期間内にあるものの件数を (クエリ数, len(diff_times)) の配列で返却する。
+        diff_times は datetimes と同じ単位の期間の長さ。
+        """
+        past_cnts = np.zeros((len(starts), len(diff_times)), dtype=np.int64)
+        end_pos = segment_searchsorted(self.datetimes, starts, ends, _datetimes, side='left')
+        for i, diff_time in enumerate(diff_times):
+            start_pos = segment_searchsorted(
+                    self.datetimes, starts, end_pos, _datetimes - diff_time, side='right')
+            past_cnts[:, i] = self.sum_weights(start_pos, end_pos)
+        return past_cnts
+
+    def count_past_of_rows(self, diff_times):
+        """
+        self.datetimes の各要素について、同じキーの中でその要素より前で、
+        diff_times ごとの期間内にある要素の件数を (len(self), len(diff_times)) の配列で返却する。
+        その要素自身と、その要素と同じ datetime の要素は「前」とみなさずカウントしない。
+        """
+        n_rows = len(self.datetimes)
+        # 同じキーかつ同じ datetime の連続区間の先頭位置が、各要素より前のデータの終端になる。
+        is_head = np.ones(n_rows, dtype=bool)
+        is_head[1:] = self.datetimes[1:] != self.datetimes[:-1]
+        is_head[self.indptr[:-1]] = True
+        end_pos = np.maximum.accumulate(np.where(is_head, np.arange(n_rows), 0))
+        starts = np.repeat(self.indptr[:-1], np.diff(self.indptr))
+
+        past_cnts = np.zeros((n_rows, len(diff_times)), dtype=np.int64)
+        for i, diff_time in enumerate(diff_times):
+            start_pos = segment_searchsorted(
+                    self.datetimes, starts, end_pos, self.datetimes - diff_time, side='right')
+            past_cnts[:, i] = self.sum_weights(start_pos, end_pos)
+        return past_cnts
+
+
+def merge_runs(run_a, run_b):
+    """
+    2つの sorted_run をマージした sorted_run を返却する。
+    """
+    weights = None
+    if run_a.cum_weights is not None or run_b.cum_weights is not None:
+        _get_weights = lambda run: np.ones(len(run), dtype=np.int64) if run.cum_weights is None else run.get_weights()
+        weights = np.concatenate([_get_weights(run_a), _get_weights(run_b)])
+    return sorted_run(np.concatenate([run_a.get_row_keys(), run_b.get_row_keys()]),
+                      np.concatenate([run_a.datetimes, run_b.datetimes]),
+                      np.concatenate([run_a.order, run_b.order]),
+                      weights)
+
+
+class time_index:
+    def __init__(self, keys, datetimes, weights=None):
+        """
+        keys ごとに datetimes をソートしたインデックスを作成する。
+
+        ARGUMENTs
+        --------------------
+        keys [array like object which element is int]:
+            グループを表すキーの1次元の配列で、要素数はサンプル数だけある。
+        datetimes [numpy.array]:
+            datetimes の1次元の配列で、要素数はサンプル数だけある。
+        weights [numpy.array which element is int or None]:
+            各サンプルの重み。指定した場合、件数は重みの合計になる。（sorted_run を参照）
+        """
+        self.runs = []
+        self.n_rows = 0
+        self.is_weighted = weights is not None
+        self.append(keys, datetimes, np.arange(len(datetimes), dtype=get_order_dtype(len(datetimes))), weights)
+
+    def __len__(self):
+        return self.n_rows
+
+    def append(self, keys, datetimes, order, weights=None):
+        """
+        データを追加する。order は追加するデータの行番号、weights はその重み。
+        追加したデータを新しい sorted_run とし、直前の sorted_run の大きさが
+        新しい sorted_run の2倍以下になったらマージする。
+        """
+        if len(datetimes) == 0:
+            return
+        if self.is_weighted and weights is None:
+            weights = np.ones(len(datetimes), dtype=np.int64)
+        self.runs.append(sorted_run(keys, datetimes, order, weights))
+        self.n_rows += len(datetimes)
+        while len(self.runs) >= 2 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            run_b = self.runs.pop()
+            run_a = self.runs.pop()
+            self.runs.append(merge_runs(run_a, run_b))
+
+    def compact(self):
+        """
+        全ての sorted_run を1つにマージする。
+        """
+        while len(self.runs) >= 2:
+            run_b = self.runs.pop()
+            run_a = self.runs.pop()
+            self.runs.append(merge_runs(run_a, run_b))
+
+    def save(self, dir):
+        """
+        インデックスを dir に .npy ファイルとして保存する。保存の前に compact する。
+        """
+        self.compact()
+        os.makedirs(dir, exist_ok=True)
+        names = ['keys', 'indptr', 'datetimes', 'order'] + (['cum_weights'] if self.is_weighted else [])
+        for name in names:
+            if self.runs:
+                array = getattr(self.runs[0], name)
+            else:
+                array = np.zeros(1 if name in ('indptr', 'cum_weights') else 0, dtype=np.int64)
+            np.save(os.path.join(dir, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, dir, mmap=True):
+        """
+        save で保存したインデックスを読み込む。mmap=True の場合は np.memmap で開く。
+        """
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(dir, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in ['keys', 'indptr', 'datetimes', 'order']]
+        self = cls.__new__(cls)
+        self.is_weighted = os.path.exists(os.path.join(dir, 'cum_weights.npy'))
+        if self.is_weighted:
+            arrays.append(np.load(os.path.join(dir, 'cum_weights.npy'), mmap_mode=mmap_mode))
+        self.n_rows = len(arrays[2])
+        self.runs = [sorted_run.from_arrays(*arrays)] if self.n_rows else []
+        return self
+
+    def get_rows(self, key):
+        """
+        key に対応するソート済みの datetimes と、その行番号を返却する。
+        """
+        if len(self.runs) == 1:
+            start, end = self.runs[0].get_range(key)
+            return self.runs[0].datetimes[start:end], self.runs[0].order[start:end]
+        datetimes, orders = [], []
+        for run in self.runs:
+            start, end = run.get_range(key)
+            datetimes.append(run.datetimes[start:end])
+            orders.append(run.order[start:end])
+        datetimes = np.concatenate(datetimes) if datetimes else np.zeros(0, dtype=np.int64)
+        orders = np.concatenate(orders) if orders else np.zeros(0, dtype=np.int64)
+        sort_index = np.argsort(datetimes, kind='stable')
+        return datetimes[sort_index], orders[sort_index]
+
+    def get_datetimes(self, key):
+        """
+        key に対応するソート済みの datetimes を返却する。
+        """
+        return self.get_rows(key)[0]
+
+    def count_past(self, keys, _datetimes, diff_times, n_rows=None):
+        """
+        keys[i] に対応するデータのうち、_datetimes[i] より前で、diff_times ごとの期間内に
+        あるものの件数を (クエリ数, len(diff_times)) の配列で返却する。
+        存在しない（負の値などの）キーの件数は0になる。
+        n_rows に int64 の配列を渡すと、keys[i] に対応するデータの行数（重みは考慮しない）を
+        n_rows[i] に加算する。件数を数えるために検索した範囲から求めるので、追加の検索はしない。
+        """
+        past_cnts = np.zeros((len(keys), len(diff_times)), dtype=np.int64)
+        for run in self.runs:
+            starts, ends = run.get_ranges(keys)
+            past_cnts += run.count_past_in_ranges(starts, ends, _datetimes, diff_times)
+            if n_rows is not None:
+                n_rows += ends - starts
+        return past_cnts
+
+    def count_past_of_rows(self, diff_times):
+        """
+        インデックスを作成した元の各行について、同じキーの中でその行より前で、
+        diff_times ごとの期間内にある行の件数を (行数, len(diff_times)) の配列で返却する。
+        行の順番は元の配列の順番。
+        その行自身と、その行と同じ datetime の行は「前」とみなさずカウントしない。
+        （get_past_cnt に行の datetime を渡した場合と同じ結果になる。）
+        """
+        past_cnts = np.zeros((self.n_rows, len(diff_times)), dtype=np.int64)
+        for i, run in enumerate(self.runs):
+            run_past_cnts = run.count_past_of_rows(diff_times)
+            row_keys = run.get_row_keys()
+            for j, other_run in enumerate(self.runs):
+                if i != j:
+                    starts, ends = other_run.get_ranges(row_keys)
+                    run_past_cnts += other_run.count_past_in_ranges(
+                            starts, ends, run.datetimes, diff_times)
+            past_cnts[run.order] = run_past_cnts
+        return past_cnts
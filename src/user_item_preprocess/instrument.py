@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser のクエリの処理時間を、処理の段階ごとに計測する。
+preprocesser.enable_profiling で有効にした場合だけ計測する。
+無効の場合、クエリの処理に追加されるのは `is not None` の比較だけ。
+"""
+
+import time
+import threading
+
+
+class query_record:
+    def __init__(self, method, n_queries=1):
+        """
+        1回のクエリ（get_past_cnt の1回の呼び出しなど）の計測結果。
+        lap を呼ぶたびに、前回の lap（または作成時）からの経過時間を stage の時間として記録する。
+
+        ARGUMENTs
+        --------------------
+        method [str]:
+            計測する preprocesser のメソッド名。
+        n_queries [int]:
+            クエリの数。get_past_cnt_batch の場合は配列の長さ。
+        """
+        self.method = method
+        self.n_queries = n_queries
+        self.seconds = {}
+        self.rows_scanned = 0
+        self.result_size = 0
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def to_dict(self):
+        """
+        EXAMPLE of RETURN
+        -----------------
+        {
+            'method': 'get_past_cnt',
+            'n_queries': 1,
+            'seconds': {'transform_inputs': 1.2e-05, 'index_lookup': 8.0e-06, 'count': 6.1e-06},
+            'rows_scanned': 12,  # カウントの対象になった（インデックス上の）行数
+            'result_size': 5,  # 最も長い diff_days の期間の件数
+        }
+        """
+        return {'method': self.method, 'n_queries': self.n_queries, 'seconds': dict(self.seconds),
+                'rows_scanned': self.rows_scanned, 'result_size': self.result_size}
+
+
+class profiler:
+    def __init__(self, callback=None):
+        """
+        query_record をメソッドごと、段階ごとに累積する。
+
+        ARGUMENTs
+        --------------------
+        callback [callable or None]:
+            クエリごとに query_record.to_dict() の dict を渡して呼び出す関数。
+            外部のメトリクスのシステムに送る場合に利用する。
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        累積した計測結果を削除する。
+        """
+        with self._lock:
+            self._methods = {}
+
+    def start(self, method, n_queries=1):
+        return query_record(method, n_queries)
+
+    def finish(self, record):
+        """
+        record を累積し、callback を呼び出す。
+        """
+        with self._lock:
+            stats = self._methods.setdefault(record.method, {
+                'calls': 0, 'queries': 0, 'rows_scanned': 0, 'max_rows_scanned': 0,
+                'result_size': 0, 'stages': {}})
+            stats['calls'] += 1
+            stats['queries'] += record.n_queries
+            stats['rows_scanned'] += record.rows_scanned
+            stats['max_rows_scanned'] = max(stats['max_rows_scanned'], record.rows_scanned)
+            stats['result_size'] += record.result_size
+            for stage, seconds in record.seconds.items():
+                stage_stats = stats['stages'].setdefault(stage, {'calls': 0, 'seconds': 0.0})
+                stage_stats['calls'] += 1
+                stage_stats['seconds'] += seconds
+        if self.callback is not None:
+            self.callback(record.to_dict())
+
+    def snapshot(self):
+        """
+        累積した計測結果のコピーを返却する。
+
+        EXAMPLE of RETURN
+        -----------------
+        {
+            'get_past_cnt': {
+                'calls': 100,  # 呼び出し回数
+                'queries': 100,  # クエリ数の合計
+                'rows_scanned': 1200,  # rows_scanned の合計
+                'max_rows_scanned': 80,
+                'result_size': 500,  # result_size の合計
+                'stages': {
+                    'transform_inputs': {'calls': 100, 'seconds': 0.0012},
+                    'index_lookup': {'calls': 100, 'seconds': 0.0008},
+                    'count': {'calls': 100, 'seconds': 0.0006},
+                },
+            },
+        }
+        """
+        with self._lock:
+            return {method: dict(stats, stages={stage: dict(stage_stats)
+                                                for stage, stage_stats in stats['stages'].items()})
+                    for method, stats in self._methods.items()}
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser を、user, item の2つに限らない任意の数のキー（shop, category など）に一般化したもの。
+
+datetimes は1つだけ保持し、キーの組み合わせごとに time_index を作成する。
+組み合わせのキーは、各キーの内部IDをビット単位で詰めた1つの int64 の値（composite code）にするので、
+複数のキーで絞り込むクエリも、インデックスの1回の二分探索で処理できる。
+インデックスは index_names で指定した組み合わせは作成時に、それ以外はクエリで初めて使われた時に作成する。
+
+EXAMPLE
+-----------------
+self = multi_key_preprocesser({'user': user_ids, 'shop': shop_ids, 'category': category_ids}, datetimes,
+                              index_names=[('user',), ('shop',), ('user', 'category')])
+self.get_past_cnt('2019-04-01 00:00:00', user='u_1', category='c_2')
+ > {7: 0, 30: 2, 90: 5}
+"""
+
+import numpy as np
+from user_item_preprocess import ID
+from user_item_preprocess import util
+from user_item_preprocess.index import time_index, composite_key, get_order_dtype
+from user_item_preprocess.buffer import growing_array
+from user_item_preprocess.user_item_datetime import count_past_dict, cut_past_cnt_dict, cut_past_cnts
+
+
+def get_widths(n_codes_list):
+    """
+    各キーの内部ID (0 から n_codes-1) を格納するビット数を返却する。合計は63ビット以下である必要がある。
+    """
+    widths = [max(int(n_codes - 1).bit_length(), 1) for n_codes in n_codes_list]
+    if sum(widths) > 63:
+        raise ValueError('The composite code of the keys does not fit in int64.')
+    return widths
+
+
+def pack_codes(code_columns, widths, n):
+    """
+    各キーの内部IDの配列を、widths ビットずつ詰めた（index.composite_key を繰り返し適用した）、
+    要素数 n の int64 の配列にする。
+    code_columns が空の場合（キーで絞り込まない場合）は全て 0 になる。
+    未知のID（負の値や、widths に収まらない値）を含む要素は -1 になり、インデックスには存在しない。
+
+    EXAMPLE
+    -------------
+    pack_codes([np.array([1, 2]), np.array([3, -1])], [2, 2], 2)
+     > array([ 7, -1])
+    """
+    keys = np.zeros(n, dtype=np.int64)
+    is_unknown = np.zeros(n, dtype=bool)
+    for codes, width in zip(code_columns, widths):
+        codes = np.asarray(codes, dtype=np.int64)
+        is_unknown |= (codes < 0) | (codes >= (1 << width))
+        keys = composite_key(keys, np.where(is_unknown, 0, codes), width)
+    keys[is_unknown] = -1
+    return keys
+
+
+class multi_key_preprocesser:
+    def __init__(self, keys, datetimes, datetime_format='%Y-%m-%d %H:%M:%S', index_names=None):
+        """
+        ARGUMENTs
+        --------------------
+        keys [dict]:
+            キーの名前を key, そのIDの1次元の配列を value とする dict。
+            ex) {'user': user_ids, 'shop': shop_ids, 'category': category_ids}
+            各キーは、それぞれの id_transformer で int32 の内部IDに変換して管理する。
+        datetimes [array like object]:
+            preprocesser の datetimes と同じ。
+        datetime_format [str]:
+            datetimes の日付形式のstr
+        index_names [list of tuple or None]:
+            作成時にインデックスを作成するキーの組み合わせ。ex) [('user',), ('user', 'category')]
+            None の場合は、各キー単独の組み合わせ。
+            それ以外の組み合わせのインデックスは、クエリで初めて使われた時に作成する。
+        """
+        self.names = list(keys)
+        self.datetime_format = datetime_format
+        self.id_tfs = {name: ID.id_transformer() for name in self.names}
+        self._codes = {name: growing_array(self.id_tfs[name].fit_transform_array(ids))
+                       for name, ids in keys.items()}
+        self._datetimes = growing_array(util.array_to_seconds(datetimes, datetime_format))
+        if len({len(column) for column in self._codes.values()} | {len(self._datetimes)}) > 1:
+            raise ValueError('keys and datetimes must have the same length.')
+        self._indexes = {}
+        for names in ([(name,) for name in self.names] if index_names is None else index_names):
+            self._build_index(self._get_index_names(names))
+
+    @property
+    def datetimes(self):
+        return self._datetimes.values
+
+    def get_codes(self, name):
+        """
+        name のキーの内部IDの配列を返却する。
+        """
+        return self._codes[name].values
+
+    def __len__(self):
+        return len(self._datetimes)
+
+    def _get_index_names(self, names):
+        """
+        names を、__init__ の keys の順に並べたタプルにする。
+        """
+        unknowns = set(names) - set(self.names)
+        if unknowns:
+            raise ValueError('Unknown keys: {}'.format(sorted(unknowns)))
+        return tuple(name for name in self.names if name in names)
+
+    def _build_index(self, names):
+        widths = get_widths([len(self.id_tfs[name]) for name in names])
+        keys = pack_codes([self.get_codes(name) for name in names], widths, len(self))
+        self._indexes[names] = (time_index(keys, self.datetimes), widths)
+
+    def _get_index(self, names):
+        """
+        names の組み合わせのインデックスと、composite code のビット数を返却する。
+        まだ作成していない場合は作成する。
+        """
+        if names not in self._indexes:
+            self._build_index(names)
+        return self._indexes[names]
+
+    def append(self, keys, datetimes):
+        """
+        データを追加する。preprocesser.append と同じく、作成済みのインデックスに追加する。
+        ただし、IDの種類数が増えて composite code のビット数が足りなくなったインデックスは作り直す。
+
+        ARGUMENTs
+        --------------------
+        keys [dict]:
+            __init__ の keys と同じ形式で、全てのキーを含む必要がある。
+        datetimes:
+            __init__ と同じ形式。
+        """
+        if set(keys) != set(self.names):
+            raise ValueError('keys must contain all of {}.'.format(self.names))
+        seconds = util.array_to_seconds(datetimes, self.datetime_format)
+        if any(len(ids) != len(seconds) for ids in keys.values()):
+            raise ValueError('keys and datetimes must have the same length.')
+        new_codes = {}
+        for name in self.names:
+            self.id_tfs[name].fit_update(keys[name])
+            new_codes[name] = self.id_tfs[name].transform_array(keys[name])
+            self._codes[name].append(new_codes[name])
+        n_rows = len(self) + len(seconds)
+        order = np.arange(len(self), n_rows, dtype=get_order_dtype(n_rows))
+        self._datetimes.append(seconds)
+        for names, (index, widths) in list(self._indexes.items()):
+            n_codes_list = [len(self.id_tfs[name]) for name in names]
+            if get_widths(n_codes_list) != widths:
+                self._build_index(names)
+            else:
+                index.append(pack_codes([new_codes[name] for name in names], widths, len(seconds)), seconds, order)
+
+    def get_past_cnt(self, datetime, diff_days=[7,30,90], is_cut=False, **ids):
+        """
+        ids で指定したキーの組み合わせの過去データが何個あるかをカウントする。
+        preprocesser.get_past_cnt の user_id, item_id を、任意のキーに一般化したもの。
+
+        ARGUMENTs
+        -----------------
+        datetime, diff_days, is_cut:
+            preprocesser.get_past_cnt と同じ。
+        ids:
+            キーの名前=ID の形式で、絞り込むキーを指定する。ex) user='u_1', category='c_2'
+            指定しないキーでは絞り込まない。
+
+        EXAMPLE of RETURN
+        -----------------
+        {7: 0, 30: 1, 90: 3}
+        """
+        names = self._get_index_names(ids)
+        index, widths = self._get_index(names)
+        codes = [self.id_tfs[name].transform_single_id(ids[name], -1) for name in names]
+        key = pack_codes([np.array([code]) for code in codes], widths, 1)[0]
+        _datetime = util.to_seconds(datetime, self.datetime_format)
+        sorted_datetimes = self.datetimes[:0] if key < 0 else index.get_datetimes(key)
+        past_cnt_dict = count_past_dict(sorted_datetimes, _datetime, diff_days)
+        if is_cut:
+            past_cnt_dict = cut_past_cnt_dict(past_cnt_dict)
+        return past_cnt_dict
+
+    def get_past_cnt_batch(self, datetimes, ids={}, diff_days=[7,30,90], is_cut=False):
+        """
+        get_past_cnt の配列版。
+
+        ARGUMENTs
+        -----------------
+        datetimes:
+            preprocesser.get_past_cnt_batch と同じ。
+        ids [dict]:
+            キーの名前を key, IDの配列を value とする dict。ex) {'user': user_ids, 'category': category_ids}
+        diff_days, is_cut:
+            preprocesser.get_past_cnt_batch と同じ。
+
+        RETURN
+        -----------------
+        (len(datetimes), len(diff_days)) の int の numpy.array。
+        """
+        names = self._get_index_names(ids)
+        index, widths = self._get_index(names)
+        _datetimes = util.array_to_seconds(datetimes, self.datetime_format)
+        keys = pack_codes([self.id_tfs[name].transform_array(ids[name]) for name in names], widths, len(_datetimes))
+        past_cnts = index.count_past(keys, _datetimes, util.days_to_seconds(diff_days))
+        if is_cut:
+            past_cnts = cut_past_cnts(past_cnts, diff_days)
+        return past_cnts
+
+    def get_past_cnt_of_log(self, index_names, diff_days=[7,30,90], is_cut=False):
+        """
+        preprocesser.get_past_cnt_of_log の一般化。
+        ログの全ての行について、index_names の各組み合わせで、その行より前のデータの件数を数える。
+
+        ARGUMENTs
+        -----------------
+        index_names [list of tuple]:
+            カウントするキーの組み合わせ。ex) [('user',), ('user', 'category')]
+
+        EXAMPLE of RETURN
+        -----------------
+        {
+            ('user',): (行数, len(diff_days)) の int の numpy.array,
+            ('user', 'category'): (行数, len(diff_days)) の int の numpy.array,
+        }
+        """
+        diff_times = util.days_to_seconds(diff_days)
+        past_cnts_dict = {}
+        for names in index_names:
+            index, _ = self._get_index(self._get_index_names(names))
+            past_cnts = index.count_past_of_rows(diff_times)
+            past_cnts_dict[tuple(names)] = cut_past_cnts(past_cnts, diff_days) if is_cut else past_cnts
+        return past_cnts_dict
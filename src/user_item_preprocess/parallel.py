@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser の配列版のクエリを、複数のコアで並列に処理する。
+
+クエリの配列をチャンクに分けて、以下のどちらかで処理し、元の順番で1つの配列に戻す。
+* backend='thread':
+    スレッドプールで処理する。numpy の searchsorted やインデックス処理は GIL を解放するので、
+    データのコピーなしで並列化できる。
+* backend='process':
+    プロセスプールで処理する。preprocesser を preprocesser.save で一度だけディレクトリに保存し
+    （preprocesser.load(mmap=True) で読み込んだものはそのディレクトリを使う）、
+    各ワーカーは preprocesser.load(mmap=True) で開く。データはページキャッシュ上で共有され、
+    ワーカーに送るのは変換済みのクエリの配列（内部ID, 秒数）だけになる。
+"""
+
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# プロセスプールの各ワーカーが読み込んだ preprocesser
+_worker_preprocesser = None
+
+
+def get_n_jobs(n_jobs):
+    """
+    n_jobs が None または負の値の場合は、CPUのコア数を返却する。
+    """
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def split_chunks(n_queries, n_chunks):
+    """
+    range(n_queries) を n_chunks 個の連続した区間 (start, end) に分割する。
+    """
+    bounds = np.linspace(0, n_queries, n_chunks + 1).astype(np.int64)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+def get_shared_dir(preprocesser_):
+    """
+    ワーカーが preprocesser.load(mmap=True) で開くためのディレクトリを返却する。
+    まだ保存していない場合は、一時ディレクトリに保存する（append されるまで使い回す）。
+    """
+    if preprocesser_._shared_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix='user_item_preprocess_')
+        preprocesser_.save(tmp_dir.name)
+        # TemporaryDirectory は参照がなくなった時にディレクトリを削除する。
+        preprocesser_._shared_dir = tmp_dir
+    if isinstance(preprocesser_._shared_dir, str):
+        return preprocesser_._shared_dir
+    return preprocesser_._shared_dir.name
+
+
+def _init_worker(dir):
+    global _worker_preprocesser
+    from user_item_preprocess.user_item_datetime import preprocesser
+    _worker_preprocesser = preprocesser.load(dir, mmap=True)
+
+
+def _count_chunk(preprocesser_, args, count_rows):
+    """
+    1つのチャンクの件数と、count_rows が True の場合はキーに対応するデータの行数を返却する。
+    """
+    n_rows = np.zeros(len(args[2]), dtype=np.int64) if count_rows else None
+    return preprocesser_._get_past_cnt_array(*args, n_rows), n_rows
+
+
+def _run_chunk(args, count_rows):
+    return _count_chunk(_worker_preprocesser, args, count_rows)
+
+
+def get_past_cnt_array(preprocesser_, _user_ids, _item_ids, _datetimes, diff_days,
+                       n_jobs=None, backend='thread', n_rows=None):
+    """
+    preprocesser._get_past_cnt_array を並列に実行する。
+    入力は preprocesser._transform_batch_inputs で変換済みのもの。
+
+    ARGUMENTs
+    -----------------
+    preprocesser_ [preprocesser]:
+        クエリを処理する preprocesser。
+    n_jobs [int or None]:
+        並列数。None または負の値の場合はCPUのコア数。
+    backend [str]:
+        'thread' or 'process'.
+    n_rows [numpy.array of int64 or None]:
+        preprocesser._get_past_cnt_array と同じ。各チャンクで数えた行数を加算する。
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    # 処理時間のばらつきを均すため、並列数より多めのチャンクに分ける。
+    chunks = split_chunks(len(_datetimes), 4 * n_jobs)
+    _slice = lambda array, start, end: None if array is None else array[start:end]
+    args_list = [(_slice(_user_ids, start, end), _slice(_item_ids, start, end),
+                  _datetimes[start:end], diff_days) for start, end in chunks]
+    if not args_list:
+        return preprocesser_._get_past_cnt_array(_user_ids, _item_ids, _datetimes, diff_days, n_rows)
+
+    count_rows = [n_rows is not None] * len(args_list)
+    if backend == 'thread':
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(lambda args, _count_rows: _count_chunk(preprocesser_, args, _count_rows),
+                                        args_list, count_rows))
+    elif backend == 'process':
+        dir = get_shared_dir(preprocesser_)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(dir,)) as executor:
+            results = list(executor.map(_run_chunk, args_list, count_rows))
+    else:
+        raise ValueError("backend must be 'thread' or 'process'.")
+    if n_rows is not None:
+        for (start, end), (_, chunk_n_rows) in zip(chunks, results):
+            n_rows[start:end] += chunk_n_rows
+    return np.concatenate([past_cnts for past_cnts, _ in results], axis=0)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メモリに収まらない大きさのログを扱うための、user ごとに分割（パーティション）した preprocesser。
+
+ログを user の内部IDのハッシュ（n_shards で割った余り）でシャードに分け、
+シャードごとの preprocesser を preprocesser.save の形式でディスクに保存し、np.memmap で開く。
+user_id_tf, item_id_tf は全てのシャードで1つを共有するので、内部IDはシャードによらず同じ。
+
+* user_id を指定するクエリは、その user のシャードだけで処理する。
+* user_id を指定しないクエリは、全てのシャードで処理して件数を合計する。
+* get_past_cnt_batch はクエリをシャードごとに分け、シャードを並列（スレッド）に処理する。
+
+作成時のメモリ使用量は最も大きいシャードの大きさ程度、クエリ時は実際に参照するページ（ワーキングセット）だけで、
+ログ全体の大きさによらない。
+
+EXAMPLE
+-----------------
+self = partitioned_preprocesser.from_csv('events.csv', '/data/events_shards', n_shards=64)
+self = partitioned_preprocesser.load('/data/events_shards')
+self.get_past_cnt('2019-04-01 00:00:00', 'u_1')
+ > {7: 0, 30: 2, 90: 5}
+"""
+
+import os
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from user_item_preprocess import ID
+from user_item_preprocess import util
+from user_item_preprocess.parallel import get_n_jobs
+from user_item_preprocess.user_item_datetime import preprocesser, cut_past_cnts
+
+# シャードに追加する前の、内部IDと秒数の一時ファイル（列の名前, 型）
+RAW_COLUMNS = [('user_ids', np.int32), ('item_ids', np.int32), ('seconds', np.int64), ('rows', np.int64)]
+
+
+def get_shards(_user_ids, n_shards):
+    """
+    user の内部IDからシャードの番号を返却する。未知のID（負の値）は 0 にする。
+    """
+    return np.where(_user_ids < 0, 0, _user_ids % n_shards)
+
+
+class partitioned_preprocesser:
+    def __init__(self, dir, mmap=True, n_jobs=None):
+        """
+        build で作成したディレクトリを開く。partitioned_preprocesser.load と同じ。
+
+        ARGUMENTs
+        --------------------
+        dir [str]:
+            build で作成したディレクトリのパス。
+        mmap [bool]:
+            シャードを np.memmap で開くかどうか。（preprocesser.load を参照）
+        n_jobs [int or None]:
+            シャードを並列に処理する数。None または負の値の場合はCPUのコア数。
+        """
+        with open(os.path.join(dir, 'meta.json')) as f:
+            meta = json.load(f)
+        self.dir = dir
+        self.n_shards = meta['n_shards']
+        self.n_rows = meta['n_rows']
+        self.datetime_format = meta['datetime_format']
+        self.n_jobs = n_jobs
+        self.user_id_tf = ID.id_transformer()
+        self.user_id_tf.load_array(os.path.join(dir, 'user_id_tf'), mmap)
+        self.item_id_tf = ID.id_transformer()
+        self.item_id_tf.load_array(os.path.join(dir, 'item_id_tf'), mmap)
+        self.shards = [preprocesser.load(self._get_shard_dir(dir, shard), mmap, self.user_id_tf, self.item_id_tf)
+                       for shard in range(self.n_shards)]
+
+    @classmethod
+    def load(cls, dir, mmap=True, n_jobs=None):
+        return cls(dir, mmap, n_jobs)
+
+    @staticmethod
+    def _get_shard_dir(dir, shard):
+        return os.path.join(dir, 'shard_{:04d}'.format(shard))
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def build(cls, chunks, dir, n_shards=16, datetime_format='%Y-%m-%d %H:%M:%S', compact=True, n_jobs=None):
+        """
+        (user_ids, item_ids, datetimes) のチャンクを順に読み込み、シャードに分けて dir に保存する。
+
+        1. チャンクごとに、IDを共有の id_transformer に fit_update で追加して内部IDに変換し、
+           シャードごとの一時ファイルに追記する。
+        2. シャードごとに一時ファイルを読み込んで preprocesser（インデックスを含む）を作成し、保存する。
+        メモリに保持するのは、1つのチャンクと1つのシャード、IDの辞書だけ。
+
+        ARGUMENTs
+        --------------------
+        chunks [iterable]:
+            (user_ids, item_ids, datetimes) の iterable。各要素は preprocesser の __init__ と同じ形式。
+        dir [str]:
+            保存するディレクトリのパス。
+        n_shards [int]:
+            シャードの数。最も大きいシャードがメモリに収まるように決める。
+        datetime_format, compact:
+            preprocesser の __init__ と同じ。
+        n_jobs:
+            __init__ と同じ。
+
+        RETURN
+        --------------------
+        dir を開いた partitioned_preprocesser。
+        """
+        user_id_tf, item_id_tf = ID.id_transformer(), ID.id_transformer()
+        user_id_tf.fit_transform_array([])
+        item_id_tf.fit_transform_array([])
+        for shard in range(n_shards):
+            os.makedirs(cls._get_shard_dir(dir, shard), exist_ok=True)
+            for name, _ in RAW_COLUMNS:
+                open(os.path.join(cls._get_shard_dir(dir, shard), '_' + name + '.bin'), 'wb').close()
+
+        n_rows = 0
+        for user_ids, item_ids, datetimes in chunks:
+            user_id_tf.fit_update(user_ids)
+            item_id_tf.fit_update(item_ids)
+            columns = {
+                'user_ids': user_id_tf.transform_array(user_ids),
+                'item_ids': item_id_tf.transform_array(item_ids),
+                'seconds': util.array_to_seconds(datetimes, datetime_format),
+            }
+            if not len(columns['user_ids']) == len(columns['item_ids']) == len(columns['seconds']):
+                raise ValueError('user_ids, item_ids, datetimes must have the same length.')
+            columns['rows'] = np.arange(n_rows, n_rows + len(columns['seconds']), dtype=np.int64)
+            n_rows += len(columns['seconds'])
+            shards = get_shards(columns['user_ids'], n_shards)
+            sort_index = np.argsort(shards, kind='stable')
+            bounds = np.append(0, np.cumsum(np.bincount(shards, minlength=n_shards)))
+            for shard in np.flatnonzero(np.diff(bounds)):
+                index = sort_index[bounds[shard]:bounds[shard+1]]
+                for name, dtype in RAW_COLUMNS:
+                    with open(os.path.join(cls._get_shard_dir(dir, shard), '_' + name + '.bin'), 'ab') as f:
+                        columns[name][index].astype(dtype, copy=False).tofile(f)
+
+        user_id_tf.save_array(os.path.join(dir, 'user_id_tf'))
+        item_id_tf.save_array(os.path.join(dir, 'item_id_tf'))
+        for shard in range(n_shards):
+            shard_dir = cls._get_shard_dir(dir, shard)
+            raw = {}
+            for name, dtype in RAW_COLUMNS:
+                path = os.path.join(shard_dir, '_' + name + '.bin')
+                raw[name] = np.fromfile(path, dtype=dtype)
+                os.remove(path)
+            shard_preprocesser = preprocesser([], [], [], datetime_format, compact)
+            shard_preprocesser.user_id_tf, shard_preprocesser.item_id_tf = user_id_tf, item_id_tf
+            shard_preprocesser._append_codes(raw['user_ids'], raw['item_ids'], raw['seconds'])
+            shard_preprocesser._build_indexes()
+            shard_preprocesser.save(shard_dir, save_id_tf=False)
+            # 各行の、元のログ上の行番号（get_past_cnt_of_log で使う）
+            np.save(os.path.join(shard_dir, 'rows.npy'), raw['rows'])
+        with open(os.path.join(dir, 'meta.json'), 'w') as f:
+            json.dump({'n_shards': n_shards, 'n_rows': n_rows, 'datetime_format': datetime_format}, f)
+        return cls(dir, n_jobs=n_jobs)
+
+    @classmethod
+    def from_csv(cls, path, dir, n_shards=16, user_col='user_id', item_col='item_id', datetime_col='datetime',
+                 chunksize=1000000, datetime_format='%Y-%m-%d %H:%M:%S', compact=True, n_jobs=None, **kwargs):
+        """
+        CSVファイルを chunksize 行ずつ読み込んで build する。
+        引数は build と preprocesser.from_csv を参照。
+        """
+        import pandas as pd
+        reader = pd.read_csv(path, usecols=[user_col, item_col, datetime_col], chunksize=chunksize, **kwargs)
+        chunks = ((chunk[user_col].values, chunk[item_col].values, chunk[datetime_col].values) for chunk in reader)
+        return cls.build(chunks, dir, n_shards, datetime_format, compact, n_jobs)
+
+    def _map_shards(self, function, shards):
+        """
+        shards の各シャードで function(shard) を並列に実行し、結果のリストを返却する。
+        """
+        n_jobs = min(get_n_jobs(self.n_jobs), len(shards))
+        if n_jobs <= 1:
+            return [function(shard) for shard in shards]
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            return list(executor.map(function, shards))
+
+    def get_past_cnt(self, datetime, user_id=None, item_id=None, diff_days=[7,30,90], is_cut=False):
+        """
+        preprocesser.get_past_cnt と同じ。
+        user_id を指定した場合は、その user のシャードだけで処理する。
+        """
+        if user_id is not None:
+            _user_id = self.user_id_tf.transform_single_id(user_id, -1)
+            shard = get_shards(np.array([_user_id]), self.n_shards)[0]
+            return self.shards[shard].get_past_cnt(datetime, user_id, item_id, diff_days, is_cut)
+        past_cnt_dict = {diff_day: 0 for diff_day in diff_days}
+        for shard_preprocesser in self.shards:
+            for diff_day, cnt in shard_preprocesser.get_past_cnt(datetime, None, item_id, diff_days, is_cut).items():
+                past_cnt_dict[diff_day] += cnt
+        return past_cnt_dict
+
+    def get_past_cnt_batch(self, datetimes, user_ids=None, item_ids=None, diff_days=[7,30,90], is_cut=False):
+        """
+        preprocesser.get_past_cnt_batch と同じ。
+        user_ids を指定した場合は、クエリを user のシャードごとに分けて処理する。
+        指定しない場合は、全てのクエリを全てのシャードで処理して合計する。
+        """
+        _user_ids = None if user_ids is None else self.user_id_tf.transform_array(user_ids)
+        _item_ids = None if item_ids is None else self.item_id_tf.transform_array(item_ids)
+        seconds = util.array_to_seconds(datetimes, self.datetime_format)
+        if _user_ids is None:
+            results = self._map_shards(
+                    lambda shard: self._get_shard_past_cnt_array(shard, None, _item_ids, seconds, diff_days),
+                    range(self.n_shards))
+            past_cnts = sum(results) if results else np.zeros((len(seconds), len(diff_days)), dtype=np.int64)
+        else:
+            shards = get_shards(_user_ids, self.n_shards)
+            sort_index = np.argsort(shards, kind='stable')
+            bounds = np.append(0, np.cumsum(np.bincount(shards, minlength=self.n_shards)))
+            _slice = lambda array, index: None if array is None else array[index]
+
+            def _get(shard):
+                index = sort_index[bounds[shard]:bounds[shard+1]]
+                return index, self._get_shard_past_cnt_array(
+                        shard, _user_ids[index], _slice(_item_ids, index), seconds[index], diff_days)
+
+            past_cnts = np.zeros((len(seconds), len(diff_days)), dtype=np.int64)
+            for index, shard_past_cnts in self._map_shards(_get, np.flatnonzero(np.diff(bounds))):
+                past_cnts[index] = shard_past_cnts
+        if is_cut:
+            past_cnts = cut_past_cnts(past_cnts, diff_days)
+        return past_cnts
+
+    def _get_shard_past_cnt_array(self, shard, _user_ids, _item_ids, seconds, diff_days):
+        """
+        shard の preprocesser._get_past_cnt_array を実行する。seconds は datetime_offset を引く前の秒数。
+        """
+        shard_preprocesser = self.shards[shard]
+        return shard_preprocesser._get_past_cnt_array(
+                _user_ids, _item_ids, seconds - shard_preprocesser.datetime_offset, diff_days)
+
+    def get_past_cnt_of_log(self, diff_days=[7,30,90], is_cut=False):
+        """
+        preprocesser.get_past_cnt_of_log と同じ。行の順番は build に渡したログの順番。
+        'user', 'user_item' はシャードの中だけで計算し、
+        'item' は各シャードの行を、他の全てのシャードでも検索して合計する。
+        """
+        diff_times = util.days_to_seconds(diff_days)
+        past_cnts_dict = {name: np.zeros((self.n_rows, len(diff_days)), dtype=np.int64)
+                          for name in ['user', 'item', 'user_item']}
+
+        def _get(shard):
+            shard_preprocesser = self.shards[shard]
+            rows = np.load(os.path.join(self._get_shard_dir(self.dir, shard), 'rows.npy'), mmap_mode='r')
+            results = {
+                'user': shard_preprocesser._indexes[('user',)].count_past_of_rows(diff_times),
+                'item': shard_preprocesser._indexes[('item',)].count_past_of_rows(diff_times),
+                'user_item': shard_preprocesser._indexes[('user', 'item')].count_past_of_rows(diff_times),
+            }
+            seconds = shard_preprocesser.datetimes.astype(np.int64) + shard_preprocesser.datetime_offset
+            for other in range(self.n_shards):
+                if other != shard:
+                    results['item'] += self._get_shard_past_cnt_array(
+                            other, None, shard_preprocesser.item_ids, seconds, diff_days)
+            return rows, results
+
+        for rows, results in self._map_shards(_get, range(self.n_shards)):
+            for name, past_cnts in results.items():
+                past_cnts_dict[name][rows] = past_cnts
+        if is_cut:
+            past_cnts_dict = {k: cut_past_cnts(v, diff_days) for k, v in past_cnts_dict.items()}
+        return past_cnts_dict
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+preprocesser.get_past_cnt をオンラインで提供するための、asyncio によるマイクロバッチのサーバー。
+
+同時に届いたクエリを短い時間 (max_wait 秒) だけ待って集め、
+preprocesser.get_past_cnt_batch の1回の呼び出しでまとめて処理し、個別の結果を返却する。
+クエリごとに get_past_cnt を呼ぶより、同時実行数が多い時のスループットとレイテンシが改善する。
+
+* batch_server: asyncio のイベントループ上で、await query(...) でクエリを受け付ける。
+* serve: batch_server を TCP で公開する。1行に1つの JSON を送受信する。
+    リクエスト: {"id": 1, "datetime": "2019-01-01 00:00:00", "user_id": "u_1", "item_id": null, "diff_days": [7, 30]}
+    レスポンス: {"id": 1, "past_cnt": {"7": 0, "30": 2}}  （エラーの場合は {"id": 1, "error": "..."}）
+    {"id": 2, "method": "stats"} で batch_server.stats() を返却する。
+* batch_client: serve に接続するクライアント。1つの接続で複数のクエリを同時に送ることができる。
+
+EXAMPLE
+-----------------
+async def main():
+    server = batch_server(preprocesser_, max_wait=0.002)
+    tcp_server = await serve(server, '127.0.0.1', 8765)
+    client = await batch_client.connect('127.0.0.1', 8765)
+    print(await client.query('2019-01-01 00:00:00', 'u_1'))
+     > {7: 0, 30: 2, 90: 3}
+"""
+
+import json
+import time
+import asyncio
+import collections
+import numpy as np
+
+
+class batch_server:
+    def __init__(self, preprocesser_, diff_days=[7,30,90], max_wait=0.002, max_batch_size=1024,
+                 max_queue_size=10000):
+        """
+        ARGUMENTs
+        -----------------
+        preprocesser_ [preprocesser]:
+            クエリを処理する preprocesser。
+        diff_days [list of int]:
+            クエリで diff_days を指定しない場合の diff_days。
+        max_wait [float]:
+            最初のクエリが届いてから、同じバッチに含めるクエリを待つ最大の秒数。
+        max_batch_size [int]:
+            1回のバッチで処理するクエリの最大数。
+        max_queue_size [int]:
+            処理待ちのクエリの最大数。これを超えると、query はキューに空きができるまで待つ（バックプレッシャー）。
+        """
+        self.preprocesser = preprocesser_
+        self.diff_days = list(diff_days)
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._worker = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_errors = 0
+        self._latencies = collections.deque(maxlen=10000)
+        self._start_time = time.perf_counter()
+
+    def start(self):
+        """
+        バッチを処理するタスクを、実行中のイベントループで開始する。query からも自動で呼ばれる。
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        バッチを処理するタスクを停止する。処理待ちのクエリはキャンセルされる。
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                self._queue.get_nowait()[-1].cancel()
+            self._worker, self._queue = None, None
+
+    async def query(self, datetime, user_id=None, item_id=None, diff_days=None):
+        """
+        get_past_cnt と同じ結果を返却する（is_cut は未対応）。
+        キューが一杯の場合は、空きができるまで待つ。
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        diff_days = tuple(self.diff_days if diff_days is None else diff_days)
+        await self._queue.put((time.perf_counter(), datetime, user_id, item_id, diff_days, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(requests) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    # 待ち時間を過ぎても、既にキューにあるものはまとめて処理する。
+                    if self._queue.empty():
+                        break
+                    requests.append(self._queue.get_nowait())
+                    continue
+                try:
+                    requests.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # イベントループを止めないよう、numpy の処理は別スレッドで行う。
+            try:
+                results = await loop.run_in_executor(None, self._process, requests)
+            except Exception as e:
+                # バッチ全体の処理に失敗した場合は、そのバッチのクエリだけをエラーにして、処理を続ける。
+                results = [e] * len(requests)
+            now = time.perf_counter()
+            for request, result in zip(requests, results):
+                future = request[-1]
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.n_errors += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                self._latencies.append(now - request[0])
+            self.n_requests += len(requests)
+            self.n_batches += 1
+
+    def _process(self, requests):
+        """
+        requests を、user_id, item_id の有無と diff_days が同じグループごとに get_past_cnt_batch で処理する。
+        """
+        results = [None] * len(requests)
+        groups = collections.defaultdict(list)
+        for i, (_, _, user_id, item_id, diff_days, _) in enumerate(requests):
+            groups[(user_id is None, item_id is None, diff_days)].append(i)
+        for (no_user, no_item, diff_days), indexes in groups.items():
+            _get = lambda position, is_none: None if is_none else [requests[i][position] for i in indexes]
+            try:
+                past_cnts = self.preprocesser.get_past_cnt_batch(
+                        [requests[i][1] for i in indexes], _get(2, no_user), _get(3, no_item), list(diff_days))
+            except Exception:
+                # 不正なクエリが含まれる場合は、1件ずつ処理して、そのクエリだけをエラーにする。
+                for i in indexes:
+                    results[i] = self._process_single(requests[i])
+                continue
+            for i, past_cnt in zip(indexes, past_cnts.tolist()):
+                results[i] = dict(zip(diff_days, past_cnt))
+        return results
+
+    def _process_single(self, request):
+        _, datetime, user_id, item_id, diff_days, _ = request
+        _to_list = lambda id: None if id is None else [id]
+        try:
+            past_cnts = self.preprocesser.get_past_cnt_batch(
+                    [datetime], _to_list(user_id), _to_list(item_id), list(diff_days))
+        except Exception as e:
+            return e
+        return dict(zip(diff_days, past_cnts[0].tolist()))
+
+    def stats(self):
+        """
+        EXAMPLE of RETURN
+        -----------------
+        {
+            'n_requests': 1000,  # 処理したクエリの数
+            'n_batches': 40,  # バッチの数
+            'n_errors': 0,
+            'mean_batch_size': 25.0,
+            'queue_size': 3,  # 処理待ちのクエリの数
+            'throughput': 5000.0,  # 1秒あたりのクエリ数（開始または reset_stats から）
+            'latency_p50_ms': 2.1,  # 直近 10000 クエリの、受け付けから結果までの時間
+            'latency_p99_ms': 4.8,
+        }
+        """
+        latencies_ms = np.asarray(self._latencies) * 1000
+        elapsed = time.perf_counter() - self._start_time
+        return {
+            'n_requests': self.n_requests,
+            'n_batches': self.n_batches,
+            'n_errors': self.n_errors,
+            'mean_batch_size': self.n_requests / self.n_batches if self.n_batches else 0.0,
+            'queue_size': self._queue.qsize() if self._queue is not None else 0,
+            'throughput': self.n_requests / elapsed if elapsed else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+            'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+        }
+
+
+async def serve(server, host='127.0.0.1', port=8765, max_in_flight=1024):
+    """
+    batch_server を TCP で公開する。返却値は asyncio.Server で、close() で停止できる。
+    プロトコルはモジュールの説明を参照。
+
+    ARGUMENTs
+    -----------------
+    max_in_flight [int]:
+        1つの接続で同時に処理するクエリの最大数。これを超えると、応答を返すまで次の行を読まない
+        （TCP のバックプレッシャーでクライアントの送信が止まる）。
+    """
+    async def handle(reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        in_flight = asyncio.Semaphore(max_in_flight)
+
+        async def respond(request):
+            response = {'id': request.get('id')}
+            try:
+                if request.get('method') == 'stats':
+                    response['stats'] = server.stats()
+                else:
+                    past_cnt = await server.query(request['datetime'], request.get('user_id'),
+                                                  request.get('item_id'), request.get('diff_days'))
+                    response['past_cnt'] = {str(k): v for k, v in past_cnt.items()}
+            except Exception as e:
+                response['error'] = '{}: {}'.format(type(e).__name__, e)
+            async with lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        try:
+            while True:
+                await in_flight.acquire()
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    in_flight.release()
+                    async with lock:
+                        writer.write((json.dumps({'id': None, 'error': 'ValueError: {}'.format(e)}) + '\n').encode())
+                        await writer.drain()
+                    continue
+                # 同じ接続のクエリも並行に処理し、同じバッチにまとめられるようにする。
+                task = asyncio.get_running_loop().create_task(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: in_flight.release())
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class batch_client:
+    def __init__(self, reader, writer):
+        """
+        serve に接続するクライアント。batch_client.connect で作成する。
+        """
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._futures = {}
+        self._receiver = asyncio.get_running_loop().create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _receive(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._futures.pop(response.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in response:
+                    future.set_exception(RuntimeError(response['error']))
+                else:
+                    future.set_result(response)
+        finally:
+            for future in self._futures.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('connection closed.'))
+            self._futures.clear()
+
+    async def _request(self, request):
+        self._next_id += 1
+        request['id'] = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._futures[self._next_id] = future
+        self._writer.write((json.dumps(request) + '\n').encode())
+        await self._writer.drain()
+        return await future
+
+    async def query(self, datetime, user_id=None, item_id=None, diff_days=None):
+        """
+        batch_server.query と同じ。ID は JSON で送るため、str か int である必要がある。
+        """
+        response = await self._request({'datetime': datetime, 'user_id': user_id,
+                                        'item_id': item_id, 'diff_days': diff_days})
+        return {int(k): v for k, v in response['past_cnt'].items()}
+
+    async def stats(self):
+        return (await self._request({'method': 'stats'}))['stats']
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._receiver.cancel()
@@ -2,12 +2,35 @@
 # -*- coding: utf-8 -*-
 """
 統計計算を定義します。
+エントロピーは自然対数で計算します（scipy.stats.entropy と同じ）。
 """
 
-from scipy.stats import entropy
+import numpy as np
+from collections import Counter
+
+
+def count_entropy(counts):
+    """
+    各IDの出現回数の配列から、エントロピーを計算します。
+
+    EXAMPLEs
+    ------------
+    count_entropy([2, 2, 1])
+     > 1.0549201679861442
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    counts = counts[counts > 0]
+    if len(counts) == 0:
+        return 0.0
+    total = counts.sum()
+    return float(np.log(total) - np.dot(counts, np.log(counts)) / total)
+
+
 def list_entropy(list_of_ids):
     """
     リストに格納されたIDの多様性（エントロピー）を計算します。
+    数値の numpy.array は np.unique で、それ以外は collections.Counter で出現回数を数えます。
+
     EXAMPLEs
     ------------
     list_of_ids = [1,1,2,3,2]
@@ -23,9 +46,84 @@ def list_entropy(list_of_ids):
      > 0.6931471805599453
 
     """
-    _list_of_ids = list(list_of_ids) # np.arrayなども、listに変換する
-    set_ = list(set(_list_of_ids))
-    prob = [_list_of_ids.count(s) / len(_list_of_ids) for s in set_]
-    return entropy(prob)
+    if isinstance(list_of_ids, np.ndarray) and list_of_ids.dtype.kind in 'iub':
+        counts = np.unique(list_of_ids, return_counts=True)[1]
+    else:
+        counts = list(Counter(list_of_ids).values())
+    return count_entropy(counts)
+
+
+def grouped_entropy(group_codes, value_codes, datetimes=None, start=None, end=None, n_groups=None, weights=None):
+    """
+    group_codes ごとに、value_codes の多様性（エントロピー）を計算します。
+    例えば preprocesser の user_ids, item_ids を渡すと、全てのユーザーのアイテムの多様性を
+    ユーザーごとのループなしで、まとめて計算します。
+
+    (group, value) の組み合わせごとの件数 c を数え、グループの合計件数を T とすると、
+    エントロピーは log(T) - sum(c * log(c)) / T になります。
+    組み合わせの件数は bincount（組み合わせの種類が少ない場合）か、np.unique で数えます。
+
+    ARGUMENTs
+    -----------------
+    group_codes [numpy.array which element is int]:
+        グループの内部ID。0 以上の値である必要がある。
+    value_codes [numpy.array which element is int]:
+        エントロピーを計算する値の内部ID。0 以上の値である必要がある。
+    datetimes [numpy.array or None]:
+        各要素の datetime。start, end を指定する場合に使う。
+    start, end [int or None]:
+        datetimes と同じ単位の値。start < datetimes < end の要素だけを集計する。
+        None の場合はその側を制限しない。
+        （preprocesser.get_past_cnt の期間と同じく、両端を含まない。）
+    n_groups [int or None]:
+        グループの数。None の場合は group_codes の最大値+1。
+    weights [numpy.array or None]:
+        各要素の重み（件数）。None の場合は全て 1。
+
+    RETURN
+    -----------------
+    長さ n_groups の float64 の numpy.array。i番目がグループ i のエントロピー。
+    要素が1つもないグループは 0.0。
+
+    EXAMPLEs
+    ------------
+    grouped_entropy(np.array([0,0,0,0,0,1,1]), np.array([1,1,2,3,2,5,5]))
+     > array([1.05492017, 0.        ])
+    """
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    value_codes = np.asarray(value_codes, dtype=np.int64)
+    if n_groups is None:
+        n_groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+    if start is not None or end is not None:
+        is_target = np.ones(len(group_codes), dtype=bool)
+        if start is not None:
+            is_target &= datetimes > start
+        if end is not None:
+            is_target &= datetimes < end
+        group_codes, value_codes = group_codes[is_target], value_codes[is_target]
+        if weights is not None:
+            weights = weights[is_target]
+    if len(group_codes) == 0:
+        return np.zeros(n_groups, dtype=np.float64)
 
+    n_values = int(value_codes.max()) + 1
+    pair_keys = group_codes * n_values + value_codes
+    if n_groups * n_values <= 4 * len(pair_keys):
+        pair_counts = np.bincount(pair_keys, weights, minlength=n_groups * n_values)
+        pair_keys = np.flatnonzero(pair_counts)
+        pair_counts = pair_counts[pair_keys]
+    elif weights is None:
+        pair_keys, pair_counts = np.unique(pair_keys, return_counts=True)
+    else:
+        pair_keys, inverse = np.unique(pair_keys, return_inverse=True)
+        pair_counts = np.bincount(inverse.ravel(), weights)
+    pair_groups = pair_keys // n_values
+    pair_counts = pair_counts.astype(np.float64)
 
+    totals = np.bincount(pair_groups, weights=pair_counts, minlength=n_groups)
+    sum_clogc = np.bincount(pair_groups, weights=pair_counts * np.log(pair_counts), minlength=n_groups)
+    entropies = np.zeros(n_groups, dtype=np.float64)
+    has_data = totals > 0
+    entropies[has_data] = np.log(totals[has_data]) - sum_clogc[has_data] / totals[has_data]
+    # 1種類だけのグループは丸め誤差で負の値になることがあるので、0 にそろえる。
+    return np.maximum(entropies, 0.0)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+イベントが届くたびに更新し、すぐに読み出せるオンラインのカウンター。
+preprocesser の配列をイベントごとに検索する代わりに、ID ごとの状態だけを保持する。
+
+* counter_store: 1種類のID（id_transformer の内部ID）ごとのカウンター。
+    - 期間内の件数: bucket_seconds 秒ごとのバケットのリングバッファで、diff_days の期間の件数を近似する。
+    - 減衰件数: 各イベントを 0.5 ** (経過日数 / half_life_days) で重み付けした件数。
+    状態は内部IDを添字とした numpy の配列で、新しいIDが追加されると配列を伸ばす。
+    更新と読み出しは配列でまとめて行い、1件あたりのコストはデータ全体の件数によらない。
+* stream_counter: user, item, (user, item) ごとの counter_store をまとめたもの。
+    preprocesser と同じ user_id_tf, item_id_tf を共有できる。
+
+期間内の件数の精度
+-----------------
+datetime q の、diff_day の期間の件数は、q の属するバケットから diff_day 日前の時刻 (q - diff_day) の属するバケットまでの、
+更新済みのイベントの件数になる。get_past_cnt(q) の期間 (q - diff_day, q) と比べると、
+q より前のイベントだけを更新している場合、差は (q - diff_day) の属するバケットの [バケットの開始, q - diff_day] の件数だけで、
+q がバケットの境界の場合は、ちょうど q - diff_day のイベントだけになる。
+また、各IDの最も新しいバケットから diff_days の最大の期間より古いイベントは、更新しても無視される。
+読み出す datetime は、そのIDの最後に更新したイベント以降である必要がある。
+
+EXAMPLE
+-----------------
+counter = stream_counter.from_preprocesser(preprocesser_, diff_days=[7, 30, 90], bucket_seconds=3600)
+counter.update(['u_1'], ['i_2'], ['2019-04-01 12:00:00'])
+counter.get_past_cnt_batch(['2019-04-01 13:00:00'], ['u_1'])
+ > array([[3, 5, 12]])
+"""
+
+import os
+import json
+import numpy as np
+from user_item_preprocess import ID
+from user_item_preprocess import util
+from user_item_preprocess.index import composite_key, expand_ranges
+from user_item_preprocess.buffer import growing_array
+from user_item_preprocess.user_item_datetime import cut_past_cnts
+
+# まだ更新されていない状態のバケット番号、時刻
+EMPTY = np.iinfo(np.int64).min // 2
+
+
+class counter_store:
+    def __init__(self, diff_days=[7,30,90], bucket_seconds=86400, half_life_days=7, id_tf=None,
+                 datetime_format='%Y-%m-%d %H:%M:%S'):
+        """
+        ARGUMENTs
+        --------------------
+        diff_days [list of int]:
+            件数を数える期間の日数。全て bucket_seconds の倍数である必要がある。
+        bucket_seconds [int]:
+            リングバッファの1つのバケットの秒数。期間内の件数の精度になる。
+            1つのIDあたり (max(diff_days) 日 / bucket_seconds + 1) 個の int32 を使う。
+        half_life_days [float]:
+            減衰件数の半減期の日数。
+        id_tf [id_transformer or None]:
+            IDを内部IDに変換する id_transformer。None の場合は新しく作成する。
+            update で未知のIDを fit_update で追加する。
+        datetime_format [str]:
+            datetimes の日付形式のstr
+        """
+        diff_times = util.days_to_seconds(diff_days)
+        if np.any(diff_times % bucket_seconds):
+            raise ValueError('diff_days must be multiples of bucket_seconds.')
+        self.diff_days = list(diff_days)
+        self.bucket_seconds = int(bucket_seconds)
+        self.half_life_days = half_life_days
+        self.datetime_format = datetime_format
+        self.n_buckets = int(max(diff_times, default=0) // bucket_seconds) + 1
+        if id_tf is None:
+            id_tf = ID.id_transformer()
+            id_tf.fit_transform_array([])
+        self.id_tf = id_tf
+        self._counts = growing_array(np.zeros((0, self.n_buckets), dtype=np.int32))
+        self._last_buckets = growing_array(np.zeros(0, dtype=np.int64))
+        self._decays = growing_array(np.zeros(0, dtype=np.float64))
+        self._decay_times = growing_array(np.zeros(0, dtype=np.int64))
+
+    def __len__(self):
+        """
+        状態を保持している内部IDの数。
+        """
+        return len(self._last_buckets)
+
+    def _grow(self, n_codes):
+        """
+        内部ID n_codes - 1 までの状態を確保する。
+        """
+        n_new = n_codes - len(self)
+        if n_new > 0:
+            self._counts.append(np.zeros((n_new, self.n_buckets), dtype=np.int32))
+            self._last_buckets.append(np.full(n_new, EMPTY, dtype=np.int64))
+            self._decays.append(np.zeros(n_new, dtype=np.float64))
+            self._decay_times.append(np.full(n_new, EMPTY, dtype=np.int64))
+
+    def update(self, ids, datetimes, weights=None):
+        """
+        イベントを追加する。
+
+        ARGUMENTs
+        --------------------
+        ids [array like object]:
+            各イベントのID。未知のIDは id_tf に追加する。
+        datetimes [array like object]:
+            各イベントの datetime。preprocesser の datetimes と同じ形式。
+        weights [array like object or None]:
+            各イベントの件数。None の場合は全て 1。
+        """
+        self.id_tf.fit_update(ids)
+        self.update_codes(self.id_tf.transform_array(ids), util.array_to_seconds(datetimes, self.datetime_format),
+                          weights)
+
+    def update_codes(self, codes, seconds, weights=None):
+        """
+        update の内部ID版。seconds は 1970-01-01 00:00:00 からの秒数。
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        weights = np.ones(len(codes), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        if len(codes) == 0:
+            return
+        if codes.min() < 0:
+            raise ValueError('codes must not contain unknown ids.')
+        self._grow(int(codes.max()) + 1)
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        inverse = inverse.ravel()
+
+        # リングバッファ: 最も新しいバケットが進んだIDは、進んだ分のバケットを空にしてから加算する。
+        buckets = seconds // self.bucket_seconds
+        new_last_buckets = self._last_buckets.values[unique_codes].copy()
+        np.maximum.at(new_last_buckets, inverse, buckets)
+        n_clears = np.minimum(new_last_buckets - self._last_buckets.values[unique_codes], self.n_buckets)
+        offsets, index = expand_ranges(np.zeros(len(unique_codes), dtype=np.int64), n_clears)
+        counts = self._counts.values
+        counts[unique_codes[index], (new_last_buckets[index] - offsets) % self.n_buckets] = 0
+        self._last_buckets.values[unique_codes] = new_last_buckets
+        is_valid = buckets > new_last_buckets[inverse] - self.n_buckets
+        np.add.at(counts, (codes[is_valid], buckets[is_valid] % self.n_buckets), weights[is_valid])
+
+        # 減衰件数: 各IDの最も新しい時刻を基準に、既存の値とイベントの重みを減衰させて合計する。
+        half_life = util.days_to_seconds(self.half_life_days)
+        decay_times = self._decay_times.values[unique_codes]
+        new_decay_times = decay_times.copy()
+        np.maximum.at(new_decay_times, inverse, seconds)
+        sums = np.bincount(inverse, weights * np.exp2(-(new_decay_times[inverse] - seconds) / half_life),
+                           minlength=len(unique_codes))
+        self._decays.values[unique_codes] = (
+                self._decays.values[unique_codes] * np.exp2(-(new_decay_times - decay_times) / half_life) + sums)
+        self._decay_times.values[unique_codes] = new_decay_times
+
+    def read(self, datetimes, ids, is_cut=False):
+        """
+        各IDの、datetime 時点の件数を返却する。
+
+        ARGUMENTs
+        --------------------
+        datetimes [array like object]:
+            各クエリの datetime。preprocesser の datetimes と同じ形式。
+        ids [array like object]:
+            各クエリのID。未知のIDの件数は 0。
+        is_cut [bool]:
+            preprocesser.get_past_cnt_batch と同じ。
+
+        RETURN
+        --------------------
+        {
+            'count': (len(ids), len(diff_days)) の int の numpy.array。期間内の件数（モジュールの説明を参照）。
+            'decay': (len(ids),) の float の numpy.array。減衰件数。
+        }
+        """
+        return self.read_codes(self.id_tf.transform_array(ids),
+                               util.array_to_seconds(datetimes, self.datetime_format), is_cut)
+
+    def read_codes(self, codes, seconds, is_cut=False):
+        """
+        read の内部ID版。seconds は 1970-01-01 00:00:00 からの秒数。
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        past_cnts = np.zeros((len(codes), len(self.diff_days)), dtype=np.int64)
+        decays = np.zeros(len(codes), dtype=np.float64)
+        is_known = (codes >= 0) & (codes < len(self))
+        _codes, _seconds = codes[is_known], seconds[is_known]
+
+        # 各リングの位置に入っているバケットの番号
+        last_buckets = self._last_buckets.values[_codes][:, None]
+        buckets = last_buckets - (last_buckets - np.arange(self.n_buckets)) % self.n_buckets
+        query_buckets = (_seconds // self.bucket_seconds)[:, None]
+        counts = self._counts.values[_codes]
+        for i, diff_time in enumerate(util.days_to_seconds(self.diff_days)):
+            in_window = (buckets >= query_buckets - diff_time // self.bucket_seconds) & (buckets <= query_buckets)
+            past_cnts[is_known, i] = (counts * in_window).sum(axis=1)
+        if is_cut:
+            past_cnts = cut_past_cnts(past_cnts, self.diff_days)
+
+        half_life = util.days_to_seconds(self.half_life_days)
+        decays[is_known] = self._decays.values[_codes] * np.exp2(
+                -(_seconds - self._decay_times.values[_codes]) / half_life)
+        return {'count': past_cnts, 'decay': decays}
+
+    def snapshot(self, dir, save_id_tf=True):
+        """
+        状態を dir に .npy ファイルとして保存する。restore で読み込める。
+        save_id_tf は preprocesser.save と同じ。
+        """
+        os.makedirs(dir, exist_ok=True)
+        with open(os.path.join(dir, 'meta.json'), 'w') as f:
+            json.dump({'diff_days': self.diff_days, 'bucket_seconds': self.bucket_seconds,
+                       'half_life_days': self.half_life_days, 'datetime_format': self.datetime_format}, f)
+        for name in ['counts', 'last_buckets', 'decays', 'decay_times']:
+            np.save(os.path.join(dir, name + '.npy'), getattr(self, '_' + name).values)
+        if save_id_tf:
+            self.id_tf.save_array(os.path.join(dir, 'id_tf'))
+
+    @classmethod
+    def restore(cls, dir, id_tf=None):
+        """
+        snapshot で保存した状態を読み込む。id_tf は preprocesser.load の user_id_tf と同じ。
+        """
+        with open(os.path.join(dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if id_tf is None:
+            id_tf = ID.id_transformer()
+            id_tf.load_array(os.path.join(dir, 'id_tf'), mmap=False)
+        self = cls(meta['diff_days'], meta['bucket_seconds'], meta['half_life_days'], id_tf, meta['datetime_format'])
+        for name in ['counts', 'last_buckets', 'decays', 'decay_times']:
+            setattr(self, '_' + name, growing_array(np.load(os.path.join(dir, name + '.npy'))))
+        return self
+
+
+class stream_counter:
+    # カウンターを持つキーの組み合わせ
+    NAMES = [('user',), ('item',), ('user', 'item')]
+
+    def __init__(self, diff_days=[7,30,90], bucket_seconds=86400, half_life_days=7, user_id_tf=None, item_id_tf=None,
+                 datetime_format='%Y-%m-%d %H:%M:%S'):
+        """
+        user, item, (user, item) ごとの counter_store。
+        (user, item) のカウンターは、index.composite_key の値を ID とする id_transformer で内部IDに変換する。
+
+        ARGUMENTs
+        --------------------
+        diff_days, bucket_seconds, half_life_days, datetime_format:
+            counter_store と同じ。
+        user_id_tf, item_id_tf [id_transformer or None]:
+            user, item の id_transformer。preprocesser の user_id_tf, item_id_tf を渡すと内部IDを共有する。
+        """
+        if user_id_tf is None:
+            user_id_tf = ID.id_transformer()
+            user_id_tf.fit_transform_array([])
+        if item_id_tf is None:
+            item_id_tf = ID.id_transformer()
+            item_id_tf.fit_transform_array([])
+        self.user_id_tf, self.item_id_tf = user_id_tf, item_id_tf
+        self.datetime_format = datetime_format
+        args = (diff_days, bucket_seconds, half_life_days)
+        self.stores = {
+            ('user',): counter_store(*args, user_id_tf, datetime_format),
+            ('item',): counter_store(*args, item_id_tf, datetime_format),
+            ('user', 'item'): counter_store(*args, None, datetime_format),
+        }
+
+    @classmethod
+    def from_preprocesser(cls, preprocesser_, diff_days=[7,30,90], bucket_seconds=86400, half_life_days=7):
+        """
+        preprocesser の user_id_tf, item_id_tf を共有し、preprocesser の全てのデータで更新したものを作成する。
+        """
+        self = cls(diff_days, bucket_seconds, half_life_days, preprocesser_.user_id_tf, preprocesser_.item_id_tf,
+                   preprocesser_.datetime_format)
+        seconds = preprocesser_.datetimes.astype(np.int64) + preprocesser_.datetime_offset
+        self.update_codes(preprocesser_.user_ids, preprocesser_.item_ids, seconds, preprocesser_.weights)
+        return self
+
+    def update(self, user_ids, item_ids, datetimes, weights=None):
+        """
+        イベントを追加する。引数は preprocesser.append と同じ。weights は counter_store.update と同じ。
+        """
+        self.user_id_tf.fit_update(user_ids)
+        self.item_id_tf.fit_update(item_ids)
+        self.update_codes(self.user_id_tf.transform_array(user_ids), self.item_id_tf.transform_array(item_ids),
+                          util.array_to_seconds(datetimes, self.datetime_format), weights)
+
+    def update_codes(self, _user_ids, _item_ids, seconds, weights=None):
+        """
+        update の内部ID版。seconds は 1970-01-01 00:00:00 からの秒数。
+        """
+        pair_store = self.stores[('user', 'item')]
+        pair_keys = composite_key(_user_ids, _item_ids)
+        pair_store.id_tf.fit_update(pair_keys)
+        self.stores[('user',)].update_codes(_user_ids, seconds, weights)
+        self.stores[('item',)].update_codes(_item_ids, seconds, weights)
+        pair_store.update_codes(pair_store.id_tf.transform_array(pair_keys), seconds, weights)
+
+    def _read(self, datetimes, user_ids, item_ids, is_cut):
+        if user_ids is None and item_ids is None:
+            raise ValueError('Specify user_ids or item_ids.')
+        _user_ids = None if user_ids is None else self.user_id_tf.transform_array(user_ids)
+        _item_ids = None if item_ids is None else self.item_id_tf.transform_array(item_ids)
+        seconds = util.array_to_seconds(datetimes, self.datetime_format)
+        if _item_ids is None:
+            return self.stores[('user',)].read_codes(_user_ids, seconds, is_cut)
+        if _user_ids is None:
+            return self.stores[('item',)].read_codes(_item_ids, seconds, is_cut)
+        pair_store = self.stores[('user', 'item')]
+        codes = pair_store.id_tf.transform_array(composite_key(_user_ids, _item_ids))
+        codes[(_user_ids < 0) | (_item_ids < 0)] = -1
+        return pair_store.read_codes(codes, seconds, is_cut)
+
+    def get_past_cnt_batch(self, datetimes, user_ids=None, item_ids=None, is_cut=False):
+        """
+        preprocesser.get_past_cnt_batch の近似（モジュールの説明を参照）。diff_days は作成時に指定したもの。
+        user_ids, item_ids の少なくとも一方を指定する。
+        """
+        return self._read(datetimes, user_ids, item_ids, is_cut)['count']
+
+    def get_decayed_cnt_batch(self, datetimes, user_ids=None, item_ids=None):
+        """
+        減衰件数の配列を返却する。preprocesser.get_past_aggregates_batch の 'decay' で、
+        期間を全期間にしたものと同じ。
+        """
+        return self._read(datetimes, user_ids, item_ids, False)['decay']
+
+    def snapshot(self, dir):
+        """
+        状態を dir に保存する。user_id_tf, item_id_tf は1回だけ保存する。
+        """
+        os.makedirs(dir, exist_ok=True)
+        self.user_id_tf.save_array(os.path.join(dir, 'user_id_tf'))
+        self.item_id_tf.save_array(os.path.join(dir, 'item_id_tf'))
+        for names, store in self.stores.items():
+            store.snapshot(os.path.join(dir, '_'.join(names)), save_id_tf=names == ('user', 'item'))
+
+    @classmethod
+    def restore(cls, dir):
+        """
+        snapshot で保存した状態を読み込む。
+        """
+        self = cls.__new__(cls)
+        self.user_id_tf, self.item_id_tf = ID.id_transformer(), ID.id_transformer()
+        self.user_id_tf.load_array(os.path.join(dir, 'user_id_tf'), mmap=False)
+        self.item_id_tf.load_array(os.path.join(dir, 'item_id_tf'), mmap=False)
+        id_tfs = {('user',): self.user_id_tf, ('item',): self.item_id_tf, ('user', 'item'): None}
+        self.stores = {names: counter_store.restore(os.path.join(dir, '_'.join(names)), id_tfs[names])
+                       for names in cls.NAMES}
+        self.datetime_format = self.stores[('user',)].datetime_format
+        return self
@@ -7,9 +7,18 @@ Cython, numba は利用していない。numpyを効率的に使った場合は
 ただし、ID情報のint化管理を行うモジュール ID は Cython によって高速化を行った。
 '''
 
+import os
+import json
 import numpy as np
 from user_item_preprocess import ID
 from user_item_preprocess import util
+from user_item_preprocess import statistics
+from user_item_preprocess import bucket
+from user_item_preprocess.index import time_index, composite_key, get_order_dtype
+from user_item_preprocess.buffer import growing_array
+from user_item_preprocess.cache import lru_cache
+from user_item_preprocess.instrument import profiler
+from user_item_preprocess.aggregate import aggregate_past, top_k_past, AGGREGATES
 
 
 ''' test code
@@ -29,8 +38,78 @@ self.get_past_cnt_by_user_item_datetime(user_id, item_id, datetime)
 self.get_past_cnt_by_user_datetime(user_id, datetime)
 '''
 
+
+def count_past_dict(sorted_datetimes, _datetime, diff_days, cum_weights=None):
+    '''
+    diff_days に指定された日数ごとに、_datetime より前の sorted_datetimes を集計する。
+    sorted_datetimes はソート済みである必要がある。
+    cum_weights を指定した場合は、件数の代わりに重みの累積和から重みの合計を計算する。
+    preprocesser 以外（multi_key_preprocesser など）の1件のクエリのカウントにも使う。
+    '''
+    past_cnt_dict = dict()
+    if diff_days:
+        dtype = sorted_datetimes.dtype
+        if dtype.itemsize < 8:
+            # sorted_datetimes を大きい型に変換するコピーが発生しないよう、クエリ側の型を合わせる。
+            _to_dtype = lambda value: util.clip_scalar_to_dtype(value, dtype)
+        else:
+            _to_dtype = lambda value: value
+        _datetime = int(_datetime)
+        end = np.searchsorted(sorted_datetimes, _to_dtype(_datetime), side='left')
+        for diff_day, diff_time in zip(diff_days, util.days_to_seconds(diff_days).tolist()):
+            start = np.searchsorted(sorted_datetimes, _to_dtype(_datetime - diff_time), side='right')
+            if cum_weights is None:
+                past_cnt_dict[diff_day] = int(max(end - start, 0))
+            else:
+                past_cnt_dict[diff_day] = int(max(cum_weights[end] - cum_weights[start], 0))
+    return past_cnt_dict
+
+
+def cut_past_cnt_dict(past_cnt_dict):
+    '''
+    is_cut=True の場合の変換。diff_days ごとの累積の件数を、diff_days を昇順に並べた区間ごとの件数にする。
+
+    EXAMPLE
+    -----------------
+    past_cnt_dict = {7:10, 30:25, 90:50}
+    cut_past_cnt_dict(past_cnt_dict)
+     > {7: 10, 30: 15, 90: 25}
+    '''
+    _diff_days = sorted(past_cnt_dict.keys())
+    _past_cnt_dict = {}
+    for i, d in enumerate(_diff_days):
+        if i == 0:
+            _past_cnt_dict[d] = past_cnt_dict[d]
+        else:
+            _past_cnt_dict[d] = past_cnt_dict[d] - past_cnt_dict[_diff_days[i-1]]
+    return _past_cnt_dict
+
+
+def cut_past_cnts(past_cnts, diff_days):
+    '''
+    cut_past_cnt_dict の配列版。diff_days を昇順に並べた区間ごとの件数に変換する。
+    列の順番は diff_days の順番のまま。
+
+    EXAMPLE
+    -----------------
+    past_cnts = np.array([[10, 25, 50]])
+    cut_past_cnts(past_cnts, [7, 30, 90])
+     > array([[10, 15, 25]])
+    '''
+    order = np.argsort(diff_days, kind='stable')
+    sorted_past_cnts = past_cnts[:, order]
+    _past_cnts = np.empty_like(past_cnts)
+    _past_cnts[:, order[:1]] = sorted_past_cnts[:, :1]
+    _past_cnts[:, order[1:]] = np.diff(sorted_past_cnts, axis=1)
+    return _past_cnts
+
+
 class preprocesser:
-    def __init__(self, user_ids, item_ids, datetimes, datetime_format='%Y-%m-%d %H:%M:%S'):
+    # インデックスを作成するキーの組み合わせ
+    INDEX_NAMES = [(), ('user',), ('item',), ('user', 'item')]
+
+    def __init__(self, user_ids, item_ids, datetimes, datetime_format='%Y-%m-%d %H:%M:%S', compact=False,
+                 time_resolution=None):
         """
         このクラスでは、[user_id, item_id, datetime] の3次元行列データの効率的な処理をまとめた。
         
@@ -40,22 +119,382 @@ class preprocesser:
             user_id の1次元の配列で、要素数はサンプル数だけある。
         item_ids [array like object]: 
             item_id の1次元の配列で、要素数はサンプル数だけある。
-        datetimes [array like object which element is str]: 
+        datetimes [array like object]: 
             datetimes の1次元の配列で、要素数はサンプル数だけある。
-            要素はdatetime_formatと同じ日付形式のstrである必要がある。        
-        * user_ids, item_ids は内部的にint型に変換されて管理される。 
-        * datetimes は内部的にfloat型の日数に変換されて管理される。 
+            要素はdatetime_formatと同じ日付形式のstrである必要がある。
+            numpy.datetime64 の配列や、整数(1970-01-01 00:00:00 からの秒数)の配列も
+            そのまま渡すことができる。
+        * user_ids, item_ids は内部的にint32型に変換されて管理される。
+          1つの配列の中で、文字列のIDと整数のIDを混在させることはできない。
+        * datetimes は内部的に 1970-01-01 00:00:00 からの秒数(int64)に変換されて管理される。
+          タイムゾーンは考慮せず、UTCの日時として扱う。
         datetime_format [str]:
             datetimes の日付形式のstr
+        compact [bool]:
+            Trueの場合は、メモリを節約するために、各列を値が収まる最も小さい整数型で保持する。
+            * user_ids, item_ids は ID の種類数に応じて int8, int16, int32 のいずれか。
+            * datetimes は datetime_offset（最初のデータの最小の秒数）からの秒数で、
+              範囲が約68年以内であれば int32。
+            append で値が収まらなくなった場合は、その列の型を広げる。
+            Falseの場合は、user_ids, item_ids は int32, datetimes は秒数の int64 で保持し、
+            datetime_offset は 0 になる。
+            どちらの場合も、クエリの結果は同じ。
+        time_resolution [int or None]:
+            指定した場合は、user, item が同じで、秒数を time_resolution 秒で切り捨てた値が同じデータを、
+            1つの行にマージし、件数を重み (self.weights) として保持する（append, from_csv なども同じ）。
+            全ての件数（get_past_cnt, get_past_cnt_batch, is_cut, get_past_cnt_of_log, get_past_aggregates,
+            get_top_k, get_entropy, get_bucket_counts）は重みの合計で数えるので、
+            datetimes を time_resolution 秒で切り捨てたデータで作成した場合と同じ結果になる。
+            time_resolution=1 の場合は、元のデータで作成した場合と同じ結果になる。
+            ただし get_past_cnt_of_log の行は、マージした後の行になる。
+            None の場合（デフォルト）はマージしない。
+
+        * 内部の datetimes の値は、秒数から datetime_offset を引いたもの。
         """
-        self.str_to_total_days = lambda datetime : util.str_to_total_days(datetime, datetime_format) 
-        self.total_days_to_str = lambda datetime : util.total_days_to_str(datetime, datetime_format) 
+        self.datetime_format = datetime_format
+        self.compact = compact
+        self.time_resolution = time_resolution
+        self.read_only = False
+        self._shared_dir = None
+        self.cache = None
+        self.profiler = None
         self.user_id_tf = ID.id_transformer()
         self.item_id_tf = ID.id_transformer()
-        self.user_ids = np.array(self.user_id_tf.fit_transform(user_ids), dtype=int)
-        self.item_ids = np.array(self.item_id_tf.fit_transform(item_ids), dtype=int)
-        vfunc = np.vectorize(self.str_to_total_days)
-        self.datetimes = vfunc(datetimes)
+        _user_ids = self.user_id_tf.fit_transform_array(user_ids)
+        _item_ids = self.item_id_tf.fit_transform_array(item_ids)
+        seconds = util.array_to_seconds(datetimes, datetime_format)
+        self._check_length(_user_ids, _item_ids, seconds)
+        self._weights = None
+        if time_resolution:
+            _user_ids, _item_ids, seconds, weights = bucket.merge_events(_user_ids, _item_ids, seconds, time_resolution)
+            self._weights = growing_array(self._to_storage_dtype(weights, np.int8))
+        self.datetime_offset = int(seconds.min()) if compact and len(seconds) else 0
+        _datetimes = seconds - self.datetime_offset if self.datetime_offset else seconds
+        self._user_ids = growing_array(self._to_storage_dtype(_user_ids, np.int8))
+        self._item_ids = growing_array(self._to_storage_dtype(_item_ids, np.int8))
+        self._datetimes = growing_array(self._to_storage_dtype(_datetimes, np.int8))
+        self._build_indexes()
+
+    @property
+    def user_ids(self):
+        return self._user_ids.values
+
+    @property
+    def item_ids(self):
+        return self._item_ids.values
+
+    @property
+    def datetimes(self):
+        return self._datetimes.values
+
+    @property
+    def weights(self):
+        """
+        各行の重み（マージしたデータの件数）。time_resolution を指定しない場合は None。
+        """
+        return None if self._weights is None else self._weights.values
+
+    def __len__(self):
+        return len(self._datetimes)
+
+    def _append_columns(self, user_ids, item_ids, datetimes):
+        """
+        append のうち、IDの追加と内部の配列への追加だけを行う（インデックスは更新しない）。
+        変換後の (_user_ids, _item_ids, _datetimes) と、追加した行番号を返却する。
+        """
+        self.user_id_tf.fit_update(user_ids)
+        self.item_id_tf.fit_update(item_ids)
+        _user_ids = self.user_id_tf.transform_array(user_ids)
+        _item_ids = self.item_id_tf.transform_array(item_ids)
+        seconds = util.array_to_seconds(datetimes, self.datetime_format)
+        return self._append_codes(_user_ids, _item_ids, seconds)
+
+    def _append_codes(self, _user_ids, _item_ids, seconds):
+        """
+        _append_columns のうち、内部IDと秒数に変換済みのデータを内部の配列に追加する部分。
+        _user_ids, _item_ids は user_id_tf, item_id_tf に追加済みの内部ID。
+        time_resolution を指定した場合は、追加するデータの中でマージしてから追加する。
+        """
+        self._check_length(_user_ids, _item_ids, seconds)
+        weights = None
+        if self.time_resolution:
+            _user_ids, _item_ids, seconds, weights = bucket.merge_events(
+                    _user_ids, _item_ids, seconds, self.time_resolution)
+        if self.compact and len(self) == 0 and len(seconds):
+            # 空の状態から追加する場合は、最初に追加するデータで datetime_offset を決める。
+            self.datetime_offset = int(seconds.min())
+        _datetimes = seconds - self.datetime_offset
+
+        self._shared_dir = None
+        if self.cache is not None:
+            self.cache.clear()
+        n_rows = len(self) + len(_datetimes)
+        order = np.arange(len(self), n_rows, dtype=get_order_dtype(n_rows))
+        self._append_column(self._user_ids, _user_ids)
+        self._append_column(self._item_ids, _item_ids)
+        self._append_column(self._datetimes, _datetimes)
+        if weights is not None:
+            self._append_column(self._weights, weights)
+        return _user_ids, _item_ids, _datetimes.astype(self._datetimes.dtype, copy=False), order
+
+    @classmethod
+    def from_csv(cls, path, user_col='user_id', item_col='item_id', datetime_col='datetime',
+                 chunksize=1000000, datetime_format='%Y-%m-%d %H:%M:%S', compact=True, time_resolution=None,
+                 **kwargs):
+        """
+        CSVファイルを chunksize 行ずつ読み込んで preprocesser を作成する。
+        pandas.DataFrame 全体や、文字列の列全体をメモリに保持しないため、
+        メモリ使用量のピークは、最終的な内部の配列の大きさに近くなる。
+        チャンクごとに、IDを fit_update で追加し、datetime を秒数に変換して、内部の配列に追加する。
+        インデックスは最後に1回だけ作成する。
+
+        ARGUMENTs
+        -----------------
+        path [str]:
+            CSVファイルのパス。
+        user_col, item_col, datetime_col [str]:
+            user_id, item_id, datetime の列名。
+        chunksize [int]:
+            1回に読み込む行数。
+        datetime_format [str]:
+            datetime の列の日付形式のstr。
+        compact, time_resolution:
+            __init__ と同じ。
+        kwargs:
+            pandas.read_csv に渡す引数。 ex) dtype={'user_id': str}
+
+        EXAMPLE
+        -----------------
+        self = preprocesser.from_csv('tests/data/user_item_time.csv', chunksize=1000)
+        """
+        import pandas as pd
+        self = cls([], [], [], datetime_format, compact, time_resolution)
+        reader = pd.read_csv(path, usecols=[user_col, item_col, datetime_col],
+                             chunksize=chunksize, **kwargs)
+        for chunk in reader:
+            self._append_columns(chunk[user_col].values, chunk[item_col].values, chunk[datetime_col].values)
+        self._build_indexes()
+        return self
+
+    @classmethod
+    def from_arrow(cls, source, user_col='user_id', item_col='item_id', datetime_col='datetime',
+                   datetime_format='%Y-%m-%d %H:%M:%S', compact=True, batch_size=1000000, time_resolution=None):
+        """
+        Arrow の表、レコードバッチ、Parquet ファイルから preprocesser を作成する。（pyarrow が必要）
+        from_csv と同じく、バッチごとに内部の配列に追加し、インデックスは最後に1回だけ作成する。
+
+        * 辞書エンコードされた ID の列は、辞書（ユニークなID）だけを id_transformer で変換し、
+          辞書のインデックスを変換後の内部IDに置き換える。行ごとの Python の文字列は作成しない。
+          同じ辞書が続くバッチでは、辞書の変換結果を使い回す。
+        * timestamp 型の datetime の列は、文字列を経由せずに秒数に変換する（タイムゾーンつきの場合は UTC）。
+          整数の列は秒数、文字列の列は datetime_format の文字列として扱う。
+
+        ARGUMENTs
+        -----------------
+        source:
+            Parquet ファイルのパス、pyarrow.Table, pyarrow.RecordBatch, pyarrow.RecordBatchReader
+            または pyarrow.RecordBatch の iterable。
+            Parquet ファイルの user_col, item_col は辞書エンコードされたまま読み込む。
+        user_col, item_col, datetime_col [str]:
+            user_id, item_id, datetime の列名。
+        datetime_format [str]:
+            datetime の列が文字列の場合の日付形式のstr。
+        compact [bool]:
+            __init__ の compact と同じ。
+        batch_size [int]:
+            Parquet ファイルや pyarrow.Table から1回に読み込む行数。
+        time_resolution [int or None]:
+            __init__ の time_resolution と同じ。
+
+        EXAMPLE
+        -----------------
+        self = preprocesser.from_arrow('events.parquet')
+        """
+        from user_item_preprocess import arrow
+        self = cls([], [], [], datetime_format, compact, time_resolution)
+        user_codes, item_codes = arrow.code_mapper(self.user_id_tf), arrow.code_mapper(self.item_id_tf)
+        for batch in arrow.iter_batches(source, [user_col, item_col, datetime_col], batch_size):
+            self._append_codes(user_codes.transform(batch.column(user_col)),
+                               item_codes.transform(batch.column(item_col)),
+                               arrow.to_seconds(batch.column(datetime_col), datetime_format))
+        self._build_indexes()
+        return self
+
+    def _get_storage_dtype(self, values, dtype):
+        """
+        values を格納する型を返却する。
+        compact=True の場合は、dtype と、values が収まる最も小さい整数型のうちの大きい方。
+        compact=False の場合は values の型。
+        """
+        if not self.compact:
+            return values.dtype
+        if len(values) == 0:
+            return np.dtype(dtype)
+        return np.promote_types(dtype, util.min_int_dtype(values.min(), values.max()))
+
+    def _to_storage_dtype(self, values, dtype):
+        """
+        values を _get_storage_dtype の型に変換する。同じ型の場合はコピーしない。
+        """
+        return values.astype(self._get_storage_dtype(values, dtype), copy=False)
+
+    def _append_column(self, column, values):
+        """
+        column(growing_array) に values を追加する。
+        compact=True で、values が column の型に収まらない場合は、column の型を広げる。
+        """
+        dtype = self._get_storage_dtype(values, column.dtype)
+        column.astype(np.promote_types(column.dtype, dtype))
+        column.append(values.astype(column.dtype, copy=False))
+
+    def _check_length(self, _user_ids, _item_ids, _datetimes):
+        if not len(_user_ids) == len(_item_ids) == len(_datetimes):
+            raise ValueError('user_ids, item_ids, datetimes must have the same length.')
+
+    def _build_indexes(self):
+        """
+        user, item, (user, item) ごとに datetimes をソートしたインデックスを作成する。
+        get_past_cnt はこのインデックスを np.searchsorted で引くことで、
+        ログ全体を走査せずにカウントする。
+        """
+        self._indexes = {
+            names: time_index(self._get_keys(names, self.user_ids, self.item_ids, len(self)), self.datetimes,
+                              self.weights)
+            for names in self.INDEX_NAMES
+        }
+
+    def append(self, user_ids, item_ids, datetimes):
+        """
+        データを追加する。全体を作り直さずに、以下の処理だけを行う。
+        * user_id_tf, item_id_tf に未知のIDを fit_update で追加する。
+        * 内部の配列に追加する（容量は2倍ずつ確保するので、毎回全体をコピーしない）。
+        * インデックスに追加する（time_index.append を参照）。
+        追加のコストは、全体のデータ件数ではなく、追加するデータの件数にほぼ比例する。
+
+        ARGUMENTs
+        --------------------
+        user_ids, item_ids, datetimes:
+            追加するデータ。__init__ と同じ形式。
+        """
+        if self.read_only:
+            raise ValueError('This preprocesser is read only (loaded with mmap=True).')
+        _user_ids, _item_ids, _datetimes, order = self._append_columns(user_ids, item_ids, datetimes)
+        weights = None if self._weights is None else self.weights[order]
+        for names, index in self._indexes.items():
+            index.append(self._get_keys(names, _user_ids, _item_ids, len(_datetimes)), _datetimes, order, weights)
+
+    def save(self, dir, save_id_tf=True):
+        """
+        このインスタンスを dir に保存する。
+        user_ids, item_ids, datetimes とインデックスは .npy ファイルとして、
+        user_id_tf, item_id_tf は id_transformer.save_array の形式で保存する。
+        保存したものは preprocesser.load で読み込める。
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            保存するディレクトリのパス。
+        save_id_tf [bool]:
+            Falseの場合は user_id_tf, item_id_tf を保存しない。
+            複数の preprocesser で同じ id_transformer を共有する場合（partition を参照）に使う。
+            読み込む時は、load に user_id_tf, item_id_tf を渡す。
+        """
+        os.makedirs(dir, exist_ok=True)
+        with open(os.path.join(dir, 'meta.json'), 'w') as f:
+            json.dump({'datetime_format': self.datetime_format,
+                       'compact': self.compact,
+                       'time_resolution': self.time_resolution,
+                       'datetime_offset': self.datetime_offset}, f)
+        np.save(os.path.join(dir, 'user_ids.npy'), self.user_ids)
+        np.save(os.path.join(dir, 'item_ids.npy'), self.item_ids)
+        np.save(os.path.join(dir, 'datetimes.npy'), self.datetimes)
+        if self._weights is not None:
+            np.save(os.path.join(dir, 'weights.npy'), self.weights)
+        if save_id_tf:
+            self.user_id_tf.save_array(os.path.join(dir, 'user_id_tf'))
+            self.item_id_tf.save_array(os.path.join(dir, 'item_id_tf'))
+        for names, index in self._indexes.items():
+            index.save(os.path.join(dir, self._get_index_dir_name(names)))
+
+    @classmethod
+    def load(cls, dir, mmap=True, user_id_tf=None, item_id_tf=None):
+        """
+        save で保存したインスタンスを読み込む。
+        mmap=True の場合は全ての配列を np.memmap（読み取り専用）で開く。
+        読み込みはほぼ一瞬で、同じディレクトリを読み込んだ複数のプロセスは
+        ページキャッシュ上の同じデータを共有する。この場合は append できない。
+
+        ARGUMENT
+        -------------
+        dir [str]:
+            保存したディレクトリのパス。
+        mmap [bool]:
+            np.memmap で開くかどうか。
+        user_id_tf, item_id_tf [id_transformer or None]:
+            指定した場合は、dir から読み込まずにこの id_transformer を使う（save の save_id_tf を参照）。
+        """
+        mmap_mode = 'r' if mmap else None
+        self = cls.__new__(cls)
+        with open(os.path.join(dir, 'meta.json')) as f:
+            meta = json.load(f)
+        self.datetime_format = meta['datetime_format']
+        self.compact = meta['compact']
+        self.time_resolution = meta.get('time_resolution')
+        self.datetime_offset = meta['datetime_offset']
+        self.read_only = mmap
+        self.cache = None
+        self.profiler = None
+        # 読み取り専用の場合は、並列処理のワーカーもこのディレクトリを開く。
+        self._shared_dir = dir if mmap else None
+        self._user_ids = growing_array(np.load(os.path.join(dir, 'user_ids.npy'), mmap_mode=mmap_mode))
+        self._item_ids = growing_array(np.load(os.path.join(dir, 'item_ids.npy'), mmap_mode=mmap_mode))
+        self._datetimes = growing_array(np.load(os.path.join(dir, 'datetimes.npy'), mmap_mode=mmap_mode))
+        self._weights = None
+        if os.path.exists(os.path.join(dir, 'weights.npy')):
+            self._weights = growing_array(np.load(os.path.join(dir, 'weights.npy'), mmap_mode=mmap_mode))
+        if user_id_tf is None:
+            user_id_tf = ID.id_transformer()
+            user_id_tf.load_array(os.path.join(dir, 'user_id_tf'), mmap)
+        if item_id_tf is None:
+            item_id_tf = ID.id_transformer()
+            item_id_tf.load_array(os.path.join(dir, 'item_id_tf'), mmap)
+        self.user_id_tf, self.item_id_tf = user_id_tf, item_id_tf
+        self._indexes = {
+            names: time_index.load(os.path.join(dir, self._get_index_dir_name(names)), mmap)
+            for names in self.INDEX_NAMES
+        }
+        return self
+
+    def _get_index_dir_name(self, names):
+        return 'index_' + ('_'.join(names) or 'all')
+
+    def _get_index_names(self, _user_ids=None, _item_ids=None):
+        """
+        入力のうち None でないものの名前を、インデックスの名前として返却する。
+        """
+        return tuple(name for name, ids in [('user', _user_ids), ('item', _item_ids)] if ids is not None)
+
+    def _get_keys(self, names, _user_ids, _item_ids, n):
+        """
+        names のインデックスを引くためのキーを返却する。
+        未知のID（負の値）を含むキーは負の値になり、インデックスには存在しない。
+        """
+        if names == ('user', 'item'):
+            return composite_key(_user_ids, _item_ids)
+        if names == ('user',):
+            return _user_ids
+        if names == ('item',):
+            return _item_ids
+        return np.zeros(n, dtype=np.int64)
+
+    def _to_code_array(self, id, _id):
+        """
+        _transform_inputs で変換した1件の内部IDを、_transform_batch_inputs と同じ形式の要素数1の配列にする。
+        id が None の場合は None、未知のID（_id が None）の場合は -1 にする。
+        """
+        if id is None:
+            return None
+        return np.array([-1 if _id is None else _id])
         
     
     def get_past_cnt(self, datetime, user_id=None, item_id=None, diff_days=[7,30,90], is_cut=False):
@@ -67,6 +506,7 @@ class preprocesser:
         -----------------
         datetime [str]:
             日付の文字列。　ex) '2019-01-01 12:13:14'
+            numpy.datetime64, datetime.datetime, 整数(秒数)も指定できる。
         user_id:
             ユーザーID
         item_id:
@@ -86,28 +526,505 @@ class preprocesser:
             90: 3, 
         }
         """
+        record = None if self.profiler is None else self.profiler.start('get_past_cnt')
+
         # 入力を内部処理用に変換する。
         _user_id, _item_id, _datetime = self._transform_inputs(user_id, item_id, datetime)
-        
-        # 組み合わせを満たすindexを取得する。
-        indexes = self._get_index(_user_id, _item_id, _datetime)
-        
-        # 得られたindexに対応する配列datetimesを取得
-        _datetimes = self._np_array_roop_index(self.datetimes, indexes)
+        is_unknown = (user_id is not None and _user_id is None) or (item_id is not None and _item_id is None)
+        if record is not None:
+            record.lap('transform_inputs')
 
-        # 入力されたdatetimeとの時差をとる。
-        diff_datetimes = _datetime - _datetimes
+        # キャッシュがあればそれを返却する。
+        if self.cache is not None:
+            _datetime = self._floor_datetime(_datetime)
+            cache_key = (is_unknown, _user_id, _item_id, _datetime, tuple(diff_days), is_cut)
+            past_cnt_dict = self.cache.get(cache_key)
+            if record is not None:
+                record.lap('cache')
+            if past_cnt_dict is not None:
+                if record is not None:
+                    self.profiler.finish(record)
+                return dict(past_cnt_dict)
         
-        # 集計        
-        past_cnt_dict = self._get_past_cnt_dict(diff_datetimes, diff_days)
+        # 組み合わせに対応するソート済みの datetimes を取得する。
+        if is_unknown:
+            # 未知のIDの場合は過去データは存在しない。
+            _datetimes, cum_weights = self.datetimes[:0], None
+        else:
+            _datetimes, cum_weights = self._get_sorted_datetimes(_user_id, _item_id)
+        if record is not None:
+            record.lap('index_lookup')
+            record.rows_scanned = len(_datetimes)
+
+        # 集計
+        past_cnt_dict = self._get_past_cnt_dict(_datetimes, _datetime, diff_days, cum_weights)
+        if record is not None:
+            record.lap('count')
+            record.result_size = int(max(past_cnt_dict.values(), default=0))
         
         # is_cut に応じて、区間カウントする。
         if is_cut:
             past_cnt_dict = self._cut(past_cnt_dict)
+            if record is not None:
+                record.lap('cut')
 
+        if self.cache is not None:
+            self.cache.put(cache_key, dict(past_cnt_dict))
+        if record is not None:
+            self.profiler.finish(record)
         return past_cnt_dict
 
+    def enable_profiling(self, callback=None):
+        """
+        get_past_cnt, get_past_cnt_batch の処理時間を、処理の段階ごとに計測するようにする。
+        計測結果は get_profile で取得できる。
+        無効の場合（デフォルト）は計測しないので、クエリの処理時間は変わらない。
+
+        ARGUMENTs
+        -----------------
+        callback [callable or None]:
+            クエリごとに計測結果の dict を渡して呼び出す関数。
+            dict の形式は instrument.query_record.to_dict を参照。
+
+        計測する段階は以下の通り。
+        * transform_inputs: ID の内部IDへの変換と、datetime の秒数への変換。
+        * cache: キャッシュの参照（enable_cache している場合）。
+        * index_lookup: インデックスからの、組み合わせに対応する datetimes の取得。
+        * count: diff_days ごとのカウント（get_past_cnt_batch では index_lookup を含む）。
+        * cut: is_cut=True の場合の区間カウントへの変換。
+        """
+        self.profiler = profiler(callback)
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def get_profile(self):
+        """
+        enable_profiling してからの計測結果を返却する。無効の場合は空の dict を返却する。
+        形式は instrument.profiler.snapshot を参照。
+        """
+        return {} if self.profiler is None else self.profiler.snapshot()
+
+    def enable_cache(self, maxsize=10000, time_bucket=1):
+        """
+        get_past_cnt の結果を LRU キャッシュに保持するようにする。
+        同じ user_id, item_id, diff_days, is_cut で、datetime が同じ time_bucket 内の
+        クエリは、キャッシュから結果を返却する。
+        キャッシュは append でデータが追加された時に全て削除される。
+
+        ARGUMENTs
+        -----------------
+        maxsize [int]:
+            キャッシュする結果の数の上限。
+        time_bucket [int]:
+            datetime をまとめる単位の秒数。
+            1より大きい場合、クエリの datetime は time_bucket 単位に切り捨ててからカウントする。
+            （キャッシュの有無で結果が変わらないようにするため。）
+
+        キャッシュのヒット数などは self.cache.info() で取得できる。
+        """
+        self.cache = lru_cache(maxsize)
+        self.cache_time_bucket = time_bucket
+
+    def disable_cache(self):
+        self.cache = None
+
+    def _floor_datetime(self, _datetime):
+        """
+        内部処理用の _datetime を、cache_time_bucket 単位に切り捨てる。
+        """
+        if self.cache_time_bucket <= 1:
+            return _datetime
+        seconds = _datetime + self.datetime_offset
+        return seconds - seconds % self.cache_time_bucket - self.datetime_offset
+
+    def get_past_cnt_batch(self, datetimes, user_ids=None, item_ids=None, diff_days=[7,30,90], is_cut=False,
+                           n_jobs=1, backend='thread'):
+        """
+        get_past_cnt の配列版。複数のクエリをまとめてnumpyで処理する。
+        クエリごとにdictを作らないため、大量のクエリを高速に処理できる。
+
+        ARGUMENTs
+        -----------------
+        datetimes [array like object]:
+            日付の文字列の配列。numpy.datetime64 や整数(秒数)の配列も指定できる。
+        user_ids [array like object or None]:
+            ユーザーIDの配列。Noneの場合はユーザーで絞り込まない。
+        item_ids [array like object or None]:
+            アイテムIDの配列。Noneの場合はアイテムで絞り込まない。
+        diff_days [list of int]:
+            何日前ごとにカウントするかの指定。　ex) [7,30,90]
+        is_cut [bool]:
+            Trueの時にdiff_daysを区間とみなしてカウントする。get_past_cnt と同じ。
+        n_jobs [int or None]:
+            並列数。1 の場合は並列化しない。None または負の値の場合はCPUのコア数。
+        backend [str]:
+            並列化の方法。'thread' or 'process'. 詳しくは parallel を参照。
+
+        RETURN
+        -----------------
+        (len(datetimes), len(diff_days)) の int の numpy.array。
+        列の順番は diff_days の順番と同じ。
+
+        EXAMPLE
+        -----------------
+        self.get_past_cnt_batch(['2019-04-15', '2019-04-15'], [1, 2], None, [30, 90])
+         > array([[1, 3],
+                  [0, 2]])
+        """
+        record = None if self.profiler is None else self.profiler.start('get_past_cnt_batch')
+        _user_ids, _item_ids, _datetimes = self._transform_batch_inputs(user_ids, item_ids, datetimes)
+        n_rows = None
+        if record is not None:
+            record.lap('transform_inputs')
+            record.n_queries = len(_datetimes)
+            n_rows = np.zeros(len(_datetimes), dtype=np.int64)
+        if n_jobs == 1:
+            past_cnts = self._get_past_cnt_array(_user_ids, _item_ids, _datetimes, diff_days, n_rows)
+        else:
+            from user_item_preprocess import parallel
+            past_cnts = parallel.get_past_cnt_array(
+                    self, _user_ids, _item_ids, _datetimes, diff_days, n_jobs, backend, n_rows)
+        if record is not None:
+            record.lap('count')
+            record.rows_scanned = int(n_rows.sum())
+            record.result_size = int(past_cnts.max(axis=1).sum()) if past_cnts.size else 0
+        if is_cut:
+            past_cnts = self._cut_array(past_cnts, diff_days)
+            if record is not None:
+                record.lap('cut')
+        if record is not None:
+            self.profiler.finish(record)
+        return past_cnts
+
+    def get_past_cnt_of_log(self, diff_days=[7,30,90], is_cut=False):
+        """
+        ログの全ての行について、その行の datetime より前の同じ user, 同じ item,
+        同じ (user, item) のデータが diff_days ごとに何個あるかをカウントする。
+        学習データの特徴量をリークなしで作成するためのもの。
+        ソート済みのインデックスを利用するため、O(n log n) で計算できる。
+
+        その行自身と、その行と同じ datetime のデータはカウントしない。
+        つまり、各行の結果は get_past_cnt にその行の user_id, item_id, datetime を
+        渡した場合と同じになる。
+
+        ARGUMENTs
+        -----------------
+        diff_days [list of int]:
+            何日前ごとにカウントするかの指定。　ex) [7,30,90]
+        is_cut [bool]:
+            Trueの時にdiff_daysを区間とみなしてカウントする。get_past_cnt と同じ。
+
+        EXAMPLE of RETURN
+        -----------------
+        {
+            'user': (行数, len(diff_days)) の int の numpy.array,
+            'item': (行数, len(diff_days)) の int の numpy.array,
+            'user_item': (行数, len(diff_days)) の int の numpy.array,
+        }
+        """
+        diff_times = util.days_to_seconds(diff_days)
+        past_cnts_dict = {
+            'user': self._indexes[('user',)].count_past_of_rows(diff_times),
+            'item': self._indexes[('item',)].count_past_of_rows(diff_times),
+            'user_item': self._indexes[('user', 'item')].count_past_of_rows(diff_times),
+        }
+        if is_cut:
+            past_cnts_dict = {k:self._cut_array(v, diff_days) for k,v in past_cnts_dict.items()}
+        return past_cnts_dict
+
+    def get_past_aggregates(self, datetime, user_id=None, item_id=None, diff_days=[7,30,90],
+                            aggregates=AGGREGATES, half_life_days=7):
+        """
+        get_past_cnt と同じ条件の過去データについて、件数以外の集計値もまとめて計算する。
+        条件に合う行をインデックスから1回だけ取得し、全ての diff_days の集計値を計算する。
+
+        ARGUMENTs
+        -----------------
+        datetime, user_id, item_id, diff_days:
+            get_past_cnt と同じ。
+        aggregates [list of str]:
+            計算する集計値。以下のうちのいくつか。
+            * 'count': 件数。get_past_cnt と同じ。
+            * 'distinct': item_id を指定しない場合はアイテムの種類数、指定した場合はユーザーの種類数。
+            * 'min_age': 最も新しいデータの、datetime からの経過日数(float)。データがない場合は nan。
+            * 'max_age': 最も古いデータの、datetime からの経過日数(float)。データがない場合は nan。
+            * 'decay': 各データを 0.5 ** (経過日数 / half_life_days) で重み付けした件数。
+        half_life_days [float]:
+            decay の半減期の日数。
 
+        EXAMPLE of RETURN
+        -----------------
+        {
+            'count': {7: 0, 30: 2, 90: 3},
+            'distinct': {7: 0, 30: 1, 90: 2},
+            'min_age': {7: nan, 30: 12.5, 90: 12.5},
+            'max_age': {7: nan, 30: 20.0, 90: 61.0},
+            'decay': {7: 0.0, 30: 0.52, 90: 0.53},
+        }
+        """
+        _user_id, _item_id, _datetime = self._transform_inputs(user_id, item_id, datetime)
+        results = self._get_past_aggregates_array(
+                self._to_code_array(user_id, _user_id), self._to_code_array(item_id, _item_id),
+                np.array([_datetime]), diff_days, aggregates, half_life_days)
+        return {name: {diff_day: values[0, i].item() for i, diff_day in enumerate(diff_days)}
+                for name, values in results.items()}
+
+    def get_past_aggregates_batch(self, datetimes, user_ids=None, item_ids=None, diff_days=[7,30,90],
+                                  aggregates=AGGREGATES, half_life_days=7):
+        """
+        get_past_aggregates の配列版。
+
+        ARGUMENTs
+        -----------------
+        datetimes, user_ids, item_ids, diff_days:
+            get_past_cnt_batch と同じ。
+        aggregates, half_life_days:
+            get_past_aggregates と同じ。
+        * count, min_age, max_age はインデックスの二分探索だけで計算する。
+          decay, distinct は期間内の行を取り出すので、期間内の行数の合計に比例した時間がかかる。
+          （メモリ使用量は、クエリを分けて処理することで抑えている。aggregate.aggregate_past を参照。）
+
+        RETURN
+        -----------------
+        aggregates をキーとし、(len(datetimes), len(diff_days)) の numpy.array を値とする dict。
+        列の順番は diff_days の順番と同じ。
+        """
+        _user_ids, _item_ids, _datetimes = self._transform_batch_inputs(user_ids, item_ids, datetimes)
+        return self._get_past_aggregates_array(_user_ids, _item_ids, _datetimes, diff_days,
+                                               aggregates, half_life_days)
+
+    def _get_past_aggregates_array(self, _user_ids, _item_ids, _datetimes, diff_days, aggregates, half_life_days):
+        """
+        _transform_batch_inputs で変換済みの入力から、get_past_aggregates_batch の結果を返却する。
+        """
+        names = self._get_index_names(_user_ids, _item_ids)
+        keys = self._get_keys(names, _user_ids, _item_ids, len(_datetimes))
+        values = None
+        if 'distinct' in aggregates:
+            values = self.item_ids if _item_ids is None else self.user_ids
+        half_life = util.days_to_seconds(half_life_days) if half_life_days else None
+        return aggregate_past(self._indexes[names], keys, _datetimes, util.days_to_seconds(diff_days),
+                              aggregates, half_life, values, self.weights)
+
+    def get_top_k(self, datetime, user_id=None, item_id=None, k=10, diff_days=[7,30,90], return_codes=False):
+        """
+        user_id の過去データで件数の多いアイテム（item_id を指定した場合は、その item_id の件数の多いユーザー）の
+        上位 k 個を、diff_days の期間ごとに返却する。期間は get_past_cnt と同じ。
+
+        ARGUMENTs
+        -----------------
+        datetime, diff_days:
+            get_past_cnt と同じ。
+        user_id, item_id:
+            どちらか一方だけを指定する。
+        k [int]:
+            返却する数。期間内の種類数が k より少ない場合は、その数だけ返却する。
+        return_codes [bool]:
+            Trueの場合は、IDの代わりに内部ID(int)を返却する。
+
+        EXAMPLE of RETURN
+        -----------------
+        件数の降順（同じ件数の場合は内部IDの昇順）に並んだ (ID, 件数) のリスト。
+        {7: [], 30: [('i_012', 2)], 90: [('i_012', 3), ('i_077', 1)]}
+        """
+        _user_id, _item_id, _datetime = self._transform_inputs(user_id, item_id, datetime)
+        top_codes, top_counts = self._get_top_k_array(
+                self._to_code_array(user_id, _user_id), self._to_code_array(item_id, _item_id),
+                np.array([_datetime]), diff_days, k)
+        id_tf = self.item_id_tf if item_id is None else self.user_id_tf
+        results = {}
+        for i, diff_day in enumerate(diff_days):
+            n_top = int((top_codes[0, i] >= 0).sum())
+            codes = top_codes[0, i, :n_top]
+            ids = codes.tolist() if return_codes else id_tf.inverse_transform_array(codes).tolist()
+            results[diff_day] = list(zip(ids, top_counts[0, i, :n_top].tolist()))
+        return results
+
+    def get_top_k_batch(self, datetimes, user_ids=None, item_ids=None, k=10, diff_days=[7,30,90],
+                        return_codes=False):
+        """
+        get_top_k の配列版。
+
+        ARGUMENTs
+        -----------------
+        datetimes, diff_days:
+            get_past_cnt_batch と同じ。
+        user_ids, item_ids:
+            どちらか一方だけを指定する。
+        k, return_codes:
+            get_top_k と同じ。
+
+        RETURN
+        -----------------
+        diff_days をキーとし、(IDの配列, 件数の配列) を値とする dict。どちらも (len(datetimes), k) の numpy.array。
+        並び順は get_top_k と同じで、k 個に満たない部分は、件数が 0、IDは None（return_codes=True の場合は -1）になる。
+        """
+        _user_ids, _item_ids, _datetimes = self._transform_batch_inputs(user_ids, item_ids, datetimes)
+        top_codes, top_counts = self._get_top_k_array(_user_ids, _item_ids, _datetimes, diff_days, k)
+        id_tf = self.item_id_tf if item_ids is None else self.user_id_tf
+        results = {}
+        for i, diff_day in enumerate(diff_days):
+            codes = top_codes[:, i]
+            if return_codes:
+                ids = codes
+            else:
+                ids = np.full(codes.shape, None, dtype=object)
+                ids[codes >= 0] = id_tf.inverse_transform_array(codes[codes >= 0])
+            results[diff_day] = (ids, top_counts[:, i])
+        return results
+
+    def _get_top_k_array(self, _user_ids, _item_ids, _datetimes, diff_days, k):
+        """
+        _transform_batch_inputs で変換済みの入力から、上位 k 個の内部IDと件数を
+        (クエリ数, len(diff_days), k) の配列で返却する。aggregate.top_k_past を参照。
+        """
+        if (_user_ids is None) == (_item_ids is None):
+            raise ValueError('Specify either user_ids or item_ids.')
+        names = self._get_index_names(_user_ids, _item_ids)
+        keys = self._get_keys(names, _user_ids, _item_ids, len(_datetimes))
+        if _item_ids is None:
+            values, n_values = self.item_ids, len(self.item_id_tf)
+        else:
+            values, n_values = self.user_ids, len(self.user_id_tf)
+        return top_k_past(self._indexes[names], keys, _datetimes, util.days_to_seconds(diff_days),
+                          values, n_values, k, self.weights)
+
+    def get_entropy(self, by='user', datetime=None, diff_day=None):
+        """
+        全ての user（または item）について、相手側のIDの多様性（エントロピー）をまとめて計算する。
+        by='user' の場合は、ユーザーごとのアイテムのエントロピー。
+        statistics.grouped_entropy を参照。
+
+        ARGUMENTs
+        -----------------
+        by [str]:
+            'user' or 'item'. グループにする側。
+        datetime [str or None]:
+            指定した場合は、datetime より前のデータだけを集計する。get_past_cnt の datetime と同じ形式。
+        diff_day [int or None]:
+            datetime と一緒に指定した場合は、datetime から diff_day 日前までのデータだけを集計する。
+
+        RETURN
+        -----------------
+        内部IDを添字とした float64 の numpy.array。
+        元のIDのエントロピーは、result[self.user_id_tf.transform_array(user_ids)] で取得できる。
+
+        EXAMPLE
+        -----------------
+        self.get_entropy('user', '2019-04-01 00:00:00', 30)
+         > array([0.69314718, 0.        , 1.09861229, ...])
+        """
+        if by == 'user':
+            group_codes, value_codes, n_groups = self.user_ids, self.item_ids, len(self.user_id_tf)
+        elif by == 'item':
+            group_codes, value_codes, n_groups = self.item_ids, self.user_ids, len(self.item_id_tf)
+        else:
+            raise ValueError("by must be 'user' or 'item'.")
+        start, end = None, None
+        if datetime is not None:
+            end = util.to_seconds(datetime, self.datetime_format) - self.datetime_offset
+            if diff_day is not None:
+                start = end - util.days_to_seconds(diff_day)
+        return statistics.grouped_entropy(group_codes, value_codes, self.datetimes, start, end, n_groups,
+                                          self.weights)
+
+    def get_bucket_counts(self, by='user', bucket_days=1, format='csr', cumulative=False):
+        """
+        datetimes を bucket_days 日ごとのバケットに分け、ID × バケットごとの件数を1回の処理で数える。
+        ユーザーの日ごと・週ごとの行動量のヒストグラムなどを、get_past_cnt を繰り返さずに作成できる。
+
+        ARGUMENTs
+        -----------------
+        by [str or tuple]:
+            'user', 'item' or ('user', 'item').
+        bucket_days [int or float]:
+            バケットの日数。ex) 1 なら日ごと、7 なら週ごと。
+            バケットの境界は 1970-01-01 00:00:00 (UTC) から bucket_days 日ごと。
+        format [str]:
+            * 'csr': scipy.sparse.csr_matrix。行は内部ID、列はバケットの番号。（scipy が必要）
+            * 'coo': (内部IDの配列, バケットの番号の配列, 件数の配列) のタプル。
+                     by=('user', 'item') の場合は (user の内部ID, item の内部ID, バケット, 件数)。
+            * 'dense': (内部IDの数, バケットの数) の numpy.array。
+        cumulative [bool]:
+            Trueの場合は、各バケットまでの件数の累積和を返却する（format='dense' のみ）。
+            バケット a の開始からバケット b の開始までの件数は result[:, b-1] - result[:, a-1] になる。
+            get_past_cnt の期間と同じ件数になるのは、期間の境界がバケットの境界と一致する場合で、
+            それ以外は bucket_days の精度での近似になる。
+
+        RETURN
+        -----------------
+        (件数, bucket_starts)
+        bucket_starts はバケットの番号を添字とした、各バケットの開始の秒数 (1970-01-01 00:00:00 からの秒数) の配列。
+
+        EXAMPLE
+        -----------------
+        counts, bucket_starts = self.get_bucket_counts('user', 7)
+        counts[self.user_id_tf.transform_single_id('u_1')].toarray()
+         > array([[0, 3, 1, ...]])
+        """
+        if by in ('user', ('user',)):
+            columns, shape = [self.user_ids], [len(self.user_id_tf)]
+        elif by in ('item', ('item',)):
+            columns, shape = [self.item_ids], [len(self.item_id_tf)]
+        elif tuple(by) == ('user', 'item'):
+            columns = [self.user_ids, self.item_ids]
+            shape = [len(self.user_id_tf), len(self.item_id_tf)]
+        else:
+            raise ValueError("by must be 'user', 'item' or ('user', 'item').")
+        if cumulative and format != 'dense':
+            raise ValueError("cumulative=True is available only with format='dense'.")
+
+        seconds = self.datetimes.astype(np.int64) + self.datetime_offset
+        buckets, bucket_starts = bucket.get_buckets(seconds, int(util.days_to_seconds(bucket_days)))
+        keys, counts = bucket.count_unique_rows(columns + [buckets], self.weights)
+        shape = tuple(shape + [len(bucket_starts)])
+        if format == 'coo':
+            return tuple(keys) + (counts,), bucket_starts
+        if format == 'dense':
+            dense = np.zeros(shape, dtype=np.int64)
+            dense[tuple(keys)] = counts
+            return (np.cumsum(dense, axis=-1) if cumulative else dense), bucket_starts
+        if format == 'csr':
+            if len(shape) != 2:
+                raise ValueError("format='csr' is not available for by=('user', 'item'). use 'coo'.")
+            from scipy.sparse import csr_matrix
+            return csr_matrix((counts, (keys[0], keys[1])), shape=shape), bucket_starts
+        raise ValueError("format must be 'csr', 'coo' or 'dense'.")
+
+    def _transform_batch_inputs(self, user_ids=None, item_ids=None, datetimes=None):
+        """
+        _transform_inputs の配列版。未知のIDは -1 に変換する。
+        Noneで渡された場合はNoneで返却する。
+        None でない入力の長さが異なる場合は ValueError。
+        """
+        lengths = {len(values) for values in [user_ids, item_ids, datetimes] if values is not None}
+        if len(lengths) > 1:
+            raise ValueError('datetimes, user_ids, item_ids must have the same length.')
+        _user_ids, _item_ids, _datetimes = None, None, None
+        if user_ids is not None:
+            _user_ids = self.user_id_tf.transform_array(user_ids)
+        if item_ids is not None:
+            _item_ids = self.item_id_tf.transform_array(item_ids)
+        if datetimes is not None:
+            _datetimes = util.array_to_seconds(datetimes, self.datetime_format) - self.datetime_offset
+        return _user_ids, _item_ids, _datetimes
+
+    def _get_past_cnt_array(self, _user_ids, _item_ids, _datetimes, diff_days, n_rows=None):
+        """
+        _transform_batch_inputs で変換済みの入力から、過去データの件数を
+        (クエリ数, len(diff_days)) の配列で返却する。
+        n_rows は time_index.count_past と同じ（プロファイリングの rows_scanned に使う）。
+        """
+        names = self._get_index_names(_user_ids, _item_ids)
+        keys = self._get_keys(names, _user_ids, _item_ids, len(_datetimes))
+        return self._indexes[names].count_past(keys, _datetimes, util.days_to_seconds(diff_days), n_rows)
+
+    def _cut_array(self, past_cnts, diff_days):
+        '''
+        cut_past_cnts を参照。
+        '''
+        return cut_past_cnts(past_cnts, diff_days)
     
     def _transform_inputs(self, user_id=None, item_id=None, datetime=None):
         """
@@ -120,10 +1037,23 @@ class preprocesser:
         if item_id is not None:
             _item_id = self.item_id_tf.transform_single_id(item_id)
         if datetime is not None:                            
-            _datetime = self.str_to_total_days(datetime)
+            _datetime = util.to_seconds(datetime, self.datetime_format) - self.datetime_offset
         return _user_id, _item_id, _datetime
         
     
+    def _get_sorted_datetimes(self, _user_id=None, _item_id=None):
+        """
+        入力された_user_id, _item_id の組み合わせに対応する、ソート済みの datetimes と、
+        その重みの累積和（先頭は0。time_resolution を指定しない場合は None）を返却する。
+        入力は全てself._transform_inputs()で変換済みのもの。
+        """
+        names = self._get_index_names(_user_id, _item_id)
+        key = np.ravel(self._get_keys(names, _user_id, _item_id, 1))[0]
+        if self._weights is None:
+            return self._indexes[names].get_datetimes(key), None
+        sorted_datetimes, orders = self._indexes[names].get_rows(key)
+        return sorted_datetimes, np.append(0, np.cumsum(self.weights[orders], dtype=np.int64))
+
     def _np_array_roop_index(self, np_array, indexes):
         """
         numpy.arrayのインデックス処理を高速化するための実装実装。
@@ -174,36 +1104,17 @@ class preprocesser:
         return index_user, index_item, index_date
                                 
         
-    def _get_past_cnt_dict(self, diff_datetimes, diff_days):
+    def _get_past_cnt_dict(self, sorted_datetimes, _datetime, diff_days, cum_weights=None):
         '''
-        diff_days に指定された日数ごとに、diff_datetimesを集計する。
+        count_past_dict を参照。
         '''
-        past_cnt_dict = dict()
-        if diff_days:
-            for diff_day in diff_days:
-                past_day_cnt = (diff_datetimes < diff_day).sum()
-                #past_cnt_dict['past_{}day_cnt'.format(diff_day)] = past_day_cnt
-                past_cnt_dict[diff_day] = past_day_cnt                
-        return past_cnt_dict
+        return count_past_dict(sorted_datetimes, _datetime, diff_days, cum_weights)
 
     def _cut(self, past_cnt_dict):
         '''
-        
-        
-        EXAMPLE
-        -----------------
-        past_cnt_dict = {7:10, 30:25, 90:50}
-        self._convert_cut(past_cnt_dict)
-         > {7: 10, 30: 15, 90: 25}
+        cut_past_cnt_dict を参照。
         '''
-        _diff_days = sorted(past_cnt_dict.keys())
-        _past_cnt_dict = {}
-        for i, d in enumerate(_diff_days):
-            if i == 0:
-                _past_cnt_dict[d] = past_cnt_dict[d]
-            else:
-                _past_cnt_dict[d] = past_cnt_dict[d] - past_cnt_dict[_diff_days[i-1]]
-        return _past_cnt_dict
+        return cut_past_cnt_dict(past_cnt_dict)
             
     
         
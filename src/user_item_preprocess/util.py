@@ -3,8 +3,22 @@
 """
 便利関数
 """
+import calendar
+import functools
 from datetime import datetime as dt
 from datetime import timedelta
+import numpy as np
+
+DAY_SECONDS = 60*60*24
+
+# numpy の datetime64 で直接パースできる日付形式
+ISO_DATETIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d',
+)
 
 def str_to_total_days(str_datetime, format='%Y-%m-%d %H:%M:%S'):
     '''
@@ -32,3 +46,138 @@ def total_days_to_str(total_days, format='%Y-%m-%d %H:%M:%S', kind='jst'):
         datetime = dt.utcfromtimestamp(total_days * (60*60*24)) + timedelta(hours=9)
     return datetime.strftime(format)
 
+
+def str_to_seconds(str_datetime, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    1970-01-01 00:00:00 から str_datetime が何秒経過しているかをintで返却する。
+    str_datetime はタイムゾーンを持たないUTCの日時として扱うため、
+    実行環境のローカルタイムには依存しない。
+
+    EXAMPLE
+    -------------
+    str_datetime = '2019-04-01 12:34:56'
+    str_to_seconds(str_datetime, format='%Y-%m-%d %H:%M:%S')
+     > 1554122096
+    '''
+    if format in ISO_DATETIME_FORMATS:
+        try:
+            return int(np.datetime64(str_datetime, 's').astype(np.int64))
+        except ValueError:
+            pass
+    return calendar.timegm(dt.strptime(str_datetime, format).timetuple())
+
+def seconds_to_str(seconds, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    str_to_seconds の逆変換。
+
+    EXAMPLE
+    -------------
+    seconds = 1554122096
+    seconds_to_str(seconds, format='%Y-%m-%d %H:%M:%S')
+     > '2019-04-01 12:34:56'
+    '''
+    return (dt(1970, 1, 1) + timedelta(seconds=int(seconds))).strftime(format)
+
+def to_seconds(datetime, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    str, datetime.datetime, numpy.datetime64, int(エポック秒) のいずれかを
+    1970-01-01 00:00:00 からの経過秒数(int)に変換する。
+
+    EXAMPLE
+    -------------
+    to_seconds('2019-04-01', format='%Y-%m-%d')
+     > 1554076800
+    to_seconds(np.datetime64('2019-04-01'))
+     > 1554076800
+    '''
+    if isinstance(datetime, str):
+        return str_to_seconds(datetime, format)
+    if isinstance(datetime, (dt, np.datetime64)):
+        return int(np.datetime64(datetime, 's').astype(np.int64))
+    return int(datetime)
+
+def array_to_seconds(datetimes, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    to_seconds の配列版。int64 の numpy.array を返却する。
+    datetime64 や整数の配列は文字列を経由せずにそのまま変換する。
+    文字列の配列は、format が ISO_DATETIME_FORMATS の場合は numpy でまとめてパースし、
+    それ以外の形式の場合のみ strptime を1件ずつ実行する。
+
+    EXAMPLE
+    -------------
+    array_to_seconds(['2019-04-01', '2019-04-02'], format='%Y-%m-%d')
+     > array([1554076800, 1554163200])
+    '''
+    datetimes = np.asarray(datetimes)
+    if datetimes.dtype.kind == 'M':
+        return datetimes.astype('datetime64[s]').astype(np.int64)
+    if datetimes.dtype.kind in 'iu':
+        return datetimes.astype(np.int64)
+    if format in ISO_DATETIME_FORMATS:
+        try:
+            return datetimes.astype(object).astype('datetime64[s]').astype(np.int64)
+        except (ValueError, TypeError):
+            pass
+    return np.fromiter((to_seconds(d, format) for d in datetimes),
+                       dtype=np.int64, count=len(datetimes))
+
+def days_to_seconds(days):
+    '''
+    日数(int, float またはその配列)を秒数(int64)に変換する。
+
+    EXAMPLE
+    -------------
+    days_to_seconds([1, 0.5])
+     > array([86400, 43200])
+    '''
+    return np.round(np.asarray(days) * DAY_SECONDS).astype(np.int64)
+
+def min_int_dtype(min_value, max_value):
+    '''
+    min_value から max_value までの値を格納できる、最も小さい符号付き整数型を返却する。
+    値がその型の最小値、最大値と一致しないようにするため、境界値は含めない。
+    （クエリの値を clip_to_dtype で型の範囲に収めても、比較結果が変わらないようにするため。）
+
+    EXAMPLE
+    -------------
+    min_int_dtype(-1, 200)
+     > dtype('int16')
+    '''
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        info = np.iinfo(dtype)
+        if info.min < min_value and max_value < info.max:
+            return np.dtype(dtype)
+    raise OverflowError('values are out of the range of int64.')
+
+def clip_to_dtype(values, dtype):
+    '''
+    values を整数型 dtype の範囲に収めて、dtype に変換する。
+    dtype の配列と比較する際に、配列側を大きい型に変換するコピーが発生しないようにするため。
+
+    EXAMPLE
+    -------------
+    clip_to_dtype(np.array([-1000, 5, 1000]), np.int8)
+     > array([-128,    5,  127], dtype=int8)
+    '''
+    info = np.iinfo(dtype)
+    return np.clip(values, info.min, info.max).astype(dtype)
+
+@functools.lru_cache(maxsize=None)
+def get_int_range(dtype):
+    '''
+    整数型 dtype の (最小値, 最大値) を Python の int で返却する。np.iinfo を毎回作らないようにキャッシュする。
+    '''
+    info = np.iinfo(dtype)
+    return int(info.min), int(info.max)
+
+def clip_scalar_to_dtype(value, dtype):
+    '''
+    clip_to_dtype の1件版。numpy の関数を使わずに Python の int で範囲に収めるので、1件ずつの処理で速い。
+
+    EXAMPLE
+    -------------
+    clip_scalar_to_dtype(1000, np.dtype(np.int8))
+     > np.int8(127)
+    '''
+    min_value, max_value = get_int_range(dtype)
+    return dtype.type(min(max(value, min_value), max_value))